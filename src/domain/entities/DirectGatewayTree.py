@@ -1,17 +1,48 @@
-from typing import ContextManager, Generic, TypeVar
+from typing import ContextManager, Generic, Sequence, TypeVar
 from domain.entities.dataInfo import DataInfo, DataInfoBuilder
-from domain.interfaces.gateway import ModifiableTreeDataGateway, ReadableTreeDataGateway
+from domain.interfaces.gateway import IdNotFoundError, ModifiableTreeDataGateway, ReadableTreeDataGateway, TreeDataGateway
 from domain.interfaces.tree import ModifiableTree, NodeNotFoundedError, ReadOnlyTree, Tree
 
 
+# Списки потомков узла и его потомков до глубины depth - 1 за один
+# запрос поддерева: id -> потомки. Узлы на глубине depth в результат
+# не входят, их потомки неизвестны
+def fetch_children_by_subtree(
+    gate: 'TreeDataGateway',
+    d_info_builder: 'DataInfoBuilder',
+    id: int,
+    depth: int
+) -> dict[int, list[DataInfo]]:
+    res: dict[int, list[DataInfo]] = {}
+    for chunk in gate.iter_subtree_info_by_id(id, depth):
+        for item in chunk:
+            if item.depth < depth:
+                res[item.id] = []
+            # Родитель выдается раньше потомков
+            if item.parent_id is not None:
+                res[item.parent_id].append(d_info_builder.build(item))
+    return res
+
+
+# Потомки запрашиваются поддеревом глубины prefetch_depth, поэтому
+# обход делает один запрос к шлюзу на несколько уровней. Списки
+# потомков нижних уровней хранятся до первого запроса, не более
+# max_prefetched списков
 class DirectGatewayTree(Tree[DataInfo]):
     def __init__(
         self,
-        r_gate: 'ReadableTreeDataGateway',
-        d_info_builder: 'DataInfoBuilder'
+        r_gate: 'TreeDataGateway',
+        d_info_builder: 'DataInfoBuilder',
+        prefetch_depth: int = 2,
+        max_prefetched: int = 10000
     ):
+        if prefetch_depth <= 0:
+            raise ValueError(f'Глубина запроса должна быть положительной! prefetch_depth={prefetch_depth}')
         self._r_gate = r_gate
         self._d_info_builder = d_info_builder
+        self._prefetch_depth = prefetch_depth
+        self._max_prefetched = max_prefetched
+        self._prefetched: dict[int, list[DataInfo]] = {}
         self._root = d_info_builder.build(r_gate.get_root())
     
     def root(self):
@@ -24,13 +55,32 @@ class DirectGatewayTree(Tree[DataInfo]):
             self._r_gate.get_info_by_id(node.id)
         )
 
+    def find_node_by_id(self, id: int):
+        try:
+            return self._d_info_builder.build(self._r_gate.get_info_by_id(id))
+        except IdNotFoundError:
+            return None
+
     def get_binary_file(self, node: 'DataInfo'):
         return self._r_gate.get_binary_data_by_id(node.id)
 
     def get_children(self, node: 'DataInfo'):
-        return [ self._d_info_builder.build(item) 
-            for item in self._r_gate.get_childs_info_by_id(node.id)
-        ]
+        return self.get_children_batch([node])[0]
+
+    def get_children_batch(self, nodes: 'Sequence[DataInfo]') -> list[list[DataInfo]]:
+        res = []
+        for node in nodes:
+            children = self._prefetched.pop(node.id, None)
+            if children is None:
+                fetched = fetch_children_by_subtree(
+                    self._r_gate, self._d_info_builder, node.id, self._prefetch_depth
+                )
+                children = fetched.pop(node.id)
+                self._prefetched.update(fetched)
+                while len(self._prefetched) > self._max_prefetched:
+                    del self._prefetched[next(iter(self._prefetched))]
+            res.append(children)
+        return res
 
 
 class DirectGatewayReadOnlyTree(DirectGatewayTree):
@@ -43,11 +93,12 @@ class DirectGatewayModifiableTree(DirectGatewayTree, ModifiableTree[DataInfo]):
         m_gate: 'ModifiableTreeDataGateway',
         d_info_builder: 'DataInfoBuilder'
     ):
-        self._d_info_builder = d_info_builder
-        self._root = d_info_builder.build(m_gate.get_root())
+        super().__init__(m_gate, d_info_builder)
         self._m_gate = m_gate
     
-    def add_node(self, p_node: 'DataInfo', c_node: 'DataInfo'):
+    def add_node(self, p_node: 'DataInfo', c_node: 'DataInfo') -> 'DataInfo':
+        # Запомненные списки потомков устарели
+        self._prefetched.clear()
         # Получаем id для контента
         id_for_file = self._m_gate.get_id_for_new_elem(p_node.id)
         # Получаем файловый менеджер
@@ -62,8 +113,11 @@ class DirectGatewayModifiableTree(DirectGatewayTree, ModifiableTree[DataInfo]):
                 file,
                 c_node.meta_info
             )
+        # Возвращаем добавленный узел, чтобы к нему можно было добавлять потомков
+        return self._d_info_builder.build(self._m_gate.get_info_by_id(id_for_file))
 
     def remove_node(self, node: 'DataInfo'):
+        self._prefetched.clear()
         self._m_gate.delete_by_id(node.id)
 
 
@@ -0,0 +1,450 @@
+import sys
+from array import array
+from bisect import bisect_left
+from typing import Any, Optional
+from domain.entities.dataInfo import BinaryDataKeeperFabric, DataInfo
+from domain.interfaces.tree import ReadOnlyTree, TreeKeeper
+from domain.shared.readOnlyDict import ReadOnlyDict
+from domain.shared.treeTraversal import TraversalOrder
+
+NO_NODE = -1
+
+# Виды колонок метаинформации
+_INT = 0
+_STR = 1
+_OBJ = 2
+# Значение совпадает с id узла (hashOrderLocation) и не хранится
+_ID = 3
+
+_INT_MIN = -(1 << 63)
+_INT_MAX = (1 << 63) - 1
+_INT32_MIN = -(1 << 31)
+_INT32_MAX = (1 << 31) - 1
+
+# Отсутствующее значение в колонке (None - допустимое значение)
+_ABSENT = object()
+
+
+# Целые хранятся в array('i'), пока помещаются в 32 бита.
+# Возвращает массив, в который можно записать value
+def _widened(values: array, value: int) -> array:
+    if values.typecode == 'i' and not _INT32_MIN <= value <= _INT32_MAX:
+        return array('q', values)
+    return values
+
+
+# Строки в одном буфере UTF-8. При сборке одинаковые строки
+# хранятся один раз, после freeze словарь поиска удаляется
+class _StringTable:
+    def __init__(self):
+        self._data = bytearray()
+        self._offsets = array('i', [0])
+        self._lookup: Optional[dict[str, int]] = {}
+
+    def intern(self, value: str) -> int:
+        idx = self._lookup.get(value)
+        if idx is None:
+            idx = len(self._offsets) - 1
+            self._data += value.encode('utf-8', 'surrogatepass')
+            self._offsets = _widened(self._offsets, len(self._data))
+            self._offsets.append(len(self._data))
+            self._lookup[value] = idx
+        return idx
+
+    def get(self, idx: int) -> str:
+        return self._data[self._offsets[idx]:self._offsets[idx + 1]].decode('utf-8', 'surrogatepass')
+
+    def freeze(self):
+        self._lookup = None
+
+    def memory_usage(self) -> int:
+        return len(self._data) + self._offsets.itemsize * len(self._offsets)
+
+
+# Колонка одного ключа метаинформации. Целые хранятся в array,
+# строки - ссылками в общую таблицу строк. Строка листа, которая
+# продолжает значение того же ключа у родителя (rel_path),
+# хранится только хвостом, у каталогов строки хранятся целиком,
+# поэтому значение собирается не более чем из двух частей.
+# Колонка, значения которой совпадают с id узлов, хранит только
+# признак наличия. Признак наличия создается при первом пропуске.
+# Остальные типы и смешанные колонки хранятся списком объектов
+class _MetaColumn:
+    def __init__(self, kind: int, nodes_count: int):
+        self._kind = kind
+        self._count = nodes_count
+        # None - значение есть у всех узлов
+        self._present: Optional[bytearray] = None
+        if kind in (_INT, _ID) and nodes_count > 0:
+            self._present = bytearray(nodes_count)
+        if kind == _INT:
+            self._values = array('i', [0]) * nodes_count
+        elif kind == _STR:
+            self._values = array('i', [NO_NODE]) * nodes_count
+            self._suffix = bytearray(nodes_count)
+        elif kind == _OBJ:
+            self._values = [_ABSENT] * nodes_count
+
+    @property
+    def kind(self):
+        return self._kind
+
+    def _append_presence(self, is_present: bool):
+        if self._present is None:
+            if is_present:
+                return
+            self._present = bytearray(b'\x01') * self._count
+        self._present.append(1 if is_present else 0)
+
+    def is_present(self, idx: int) -> bool:
+        return self._present is None or self._present[idx] == 1
+
+    def append_absent(self):
+        if self._kind == _INT:
+            self._values.append(0)
+            self._append_presence(False)
+        elif self._kind == _ID:
+            self._append_presence(False)
+        elif self._kind == _STR:
+            self._values.append(NO_NODE)
+            self._suffix.append(0)
+        else:
+            self._values.append(_ABSENT)
+        self._count += 1
+
+    def append_int(self, value: int):
+        self._values = _widened(self._values, value)
+        self._values.append(value)
+        self._append_presence(True)
+        self._count += 1
+
+    def append_id(self):
+        self._append_presence(True)
+        self._count += 1
+
+    def append_str(self, str_idx: int, is_suffix: bool):
+        self._values = _widened(self._values, str_idx)
+        self._values.append(str_idx)
+        self._suffix.append(1 if is_suffix else 0)
+        self._count += 1
+
+    def append_obj(self, value: Any):
+        self._values.append(value)
+        self._count += 1
+
+    def set_str(self, idx: int, str_idx: int, is_suffix: bool):
+        self._values = _widened(self._values, str_idx)
+        self._values[idx] = str_idx
+        self._suffix[idx] = 1 if is_suffix else 0
+
+    def is_suffix(self, idx: int) -> bool:
+        return self._kind == _STR and self._suffix[idx] == 1
+
+    # Для колонки _ID значение берется из id узла
+    def get_raw(self, idx: int) -> Any:
+        if self._kind == _INT:
+            return self._values[idx] if self.is_present(idx) else _ABSENT
+        if self._kind == _STR:
+            str_idx = self._values[idx]
+            return _ABSENT if str_idx == NO_NODE else str_idx
+        return self._values[idx]
+
+    def memory_usage(self) -> int:
+        present = 0 if self._present is None else len(self._present)
+        if self._kind == _ID:
+            return present
+        if self._kind == _INT:
+            return self._values.itemsize * len(self._values) + present
+        if self._kind == _STR:
+            return self._values.itemsize * len(self._values) + len(self._suffix)
+        # Список и его объекты (без вложенных), общие объекты - один раз
+        objects = {id(value): value for value in self._values if value is not _ABSENT}
+        return sys.getsizeof(self._values) + sum(sys.getsizeof(value) for value in objects.values())
+
+
+# Неизменяемый снимок дерева DataInfo в колонках. Узлы хранятся
+# по индексам в прямом порядке обхода: связи (родитель, первый
+# потомок, следующий брат) - в 32-битных array, пока узлов и id
+# не больше 2^31, хэши - в одном буфере
+# фиксированной ширины, строки метаинформации - в общей таблице.
+# DataInfo создается только при обращении к узлу
+class ColumnarSnapshotTree(ReadOnlyTree[DataInfo]):
+    def __init__(
+        self,
+        digest_size: Optional[int] = None,
+        b_data_keeper_fabric: Optional[BinaryDataKeeperFabric] = None
+    ):
+        self._digest_size = digest_size
+        self._b_data_keeper_fabric = b_data_keeper_fabric
+        self._ids = array('i')
+        self._parents = array('i')
+        self._first_childs = array('i')
+        self._next_siblings = array('i')
+        self._hashes = bytearray()
+        self._hash_present = bytearray()
+        self._strings = _StringTable()
+        self._keys: list[str] = []
+        self._columns: list[_MetaColumn] = []
+        self._key_positions: dict[str, int] = {}
+        # Индекс по id: прямой массив для плотных id, иначе
+        # отсортированные id с индексами узлов
+        self._index_by_id: Optional[array] = None
+        self._sorted_ids: Optional[array] = None
+        self._sorted_idxs: Optional[array] = None
+        # Путь сборки от корня до последнего узла: [индекс, последний
+        # потомок, строковые значения метаинформации целиком]
+        self._build_path: Optional[list[list]] = []
+        self._frozen = False
+
+    # Сборка
+
+    # Узлы добавляются в прямом порядке обхода с глубиной
+    def _append_node(self, depth: int, node: DataInfo) -> int:
+        if self._frozen:
+            raise RuntimeError('Снимок уже собран!')
+        if depth > len(self._build_path) or (depth == 0 and len(self._ids) > 0):
+            raise ValueError(f'Узлы должны добавляться в прямом порядке обхода! depth={depth}')
+        del self._build_path[depth:]
+        parent = self._build_path[-1] if depth > 0 else None
+        idx = len(self._ids)
+        if idx > _INT32_MAX:
+            self._parents = _widened(self._parents, idx)
+            self._first_childs = _widened(self._first_childs, idx)
+            self._next_siblings = _widened(self._next_siblings, idx)
+        self._ids = _widened(self._ids, node.id)
+        self._ids.append(node.id)
+        self._parents.append(NO_NODE if parent is None else parent[0])
+        self._first_childs.append(NO_NODE)
+        self._next_siblings.append(NO_NODE)
+        if parent is not None:
+            if parent[1] == NO_NODE:
+                self._first_childs[parent[0]] = idx
+                # У родителя появился потомок: его строки храним целиком
+                self._store_full_strings(parent[0], parent[2])
+            else:
+                self._next_siblings[parent[1]] = idx
+            parent[1] = idx
+        self._append_hash(node.hash)
+        str_values = self._append_meta(idx, None if parent is None else parent[2], node.meta_info)
+        self._build_path.append([idx, NO_NODE, str_values])
+        return idx
+
+    def _store_full_strings(self, idx: int, str_values: dict[str, str]):
+        for key, value in str_values.items():
+            column = self._columns[self._key_positions[key]]
+            if column.is_suffix(idx):
+                column.set_str(idx, self._strings.intern(value), False)
+
+    def _append_hash(self, hash: Optional[bytes]):
+        if hash is None:
+            self._hashes += bytes(self._digest_size or 0)
+            self._hash_present.append(0)
+            return
+        if self._digest_size is None:
+            self._digest_size = len(hash)
+            # Узлы без хэша до первого хэша
+            self._hashes = bytearray(self._digest_size * len(self._hash_present))
+        if len(hash) != self._digest_size:
+            raise ValueError(
+                f'Размер хэша не совпадает с размером снимка! '
+                f'len(hash)={len(hash)}, digest_size={self._digest_size}'
+            )
+        self._hashes += hash
+        self._hash_present.append(1)
+
+    def _get_column(self, key: str, kind: int, idx: int) -> _MetaColumn:
+        pos = self._key_positions.get(key)
+        if pos is None:
+            pos = len(self._keys)
+            self._keys.append(key)
+            self._columns.append(_MetaColumn(kind, idx))
+            self._key_positions[key] = pos
+            return self._columns[pos]
+        column = self._columns[pos]
+        if column.kind == _INT and kind == _ID:
+            return column
+        if column.kind == _ID and kind == _INT:
+            # Значение не совпало с id: колонка переводится в целые
+            int_column = _MetaColumn(_INT, 0)
+            for i in range(idx):
+                if column.is_present(i):
+                    int_column.append_int(self._ids[i])
+                else:
+                    int_column.append_absent()
+            self._columns[pos] = int_column
+            return int_column
+        if column.kind != kind and column.kind != _OBJ:
+            # Типы значений ключа смешаны: колонка переводится в объекты
+            obj_column = _MetaColumn(_OBJ, 0)
+            for i in range(idx):
+                obj_column.append_obj(self._get_meta_value(pos, i))
+            self._columns[pos] = obj_column
+            column = obj_column
+        return column
+
+    # Возвращает строковые значения узла для сжатия значений потомков
+    def _append_meta(self, idx: int, parent_str_values: Optional[dict[str, str]], meta_info) -> dict[str, str]:
+        filled = set()
+        str_values = {}
+        for key, value in meta_info.items():
+            if type(value) is int and _INT_MIN <= value <= _INT_MAX:
+                column = self._get_column(key, _ID if value == self._ids[idx] else _INT, idx)
+                if column.kind == _ID:
+                    column.append_id()
+                elif column.kind == _INT:
+                    column.append_int(value)
+                else:
+                    column.append_obj(value)
+            elif type(value) is str:
+                column = self._get_column(key, _STR, idx)
+                if column.kind == _STR:
+                    str_values[key] = value
+                    parent_value = None if parent_str_values is None else parent_str_values.get(key)
+                    if parent_value and value.startswith(parent_value):
+                        column.append_str(self._strings.intern(value[len(parent_value):]), True)
+                    else:
+                        column.append_str(self._strings.intern(value), False)
+                else:
+                    column.append_obj(value)
+            else:
+                column = self._get_column(key, _OBJ, idx)
+                column.append_obj(value)
+            filled.add(key)
+        for key, column in zip(self._keys, self._columns):
+            if key not in filled:
+                column.append_absent()
+        return str_values
+
+    def _freeze(self):
+        self._build_path = None
+        self._strings.freeze()
+        self._key_positions = {key: pos for pos, key in enumerate(self._keys)}
+        n = len(self._ids)
+        max_id = max(self._ids, default=NO_NODE)
+        if min(self._ids, default=0) >= 0 and max_id < 2 * n + 64:
+            index = array('i' if n <= _INT32_MAX else 'q', [NO_NODE]) * (max_id + 1)
+            for idx, id in enumerate(self._ids):
+                index[id] = idx
+            self._index_by_id = index
+        else:
+            order = sorted(range(n), key=self._ids.__getitem__)
+            self._sorted_ids = array(self._ids.typecode, (self._ids[idx] for idx in order))
+            self._sorted_idxs = array('i' if n <= _INT32_MAX else 'q', order)
+        self._frozen = True
+
+    # Чтение
+
+    def _get_meta_value(self, pos: int, idx: int) -> Any:
+        column = self._columns[pos]
+        if column.kind == _ID:
+            return self._ids[idx] if column.is_present(idx) else _ABSENT
+        raw = column.get_raw(idx)
+        if raw is _ABSENT or column.kind != _STR:
+            return raw
+        if not column.is_suffix(idx):
+            return self._strings.get(raw)
+        # Хвост строки листа: значение родителя хранится целиком
+        return self._strings.get(column.get_raw(self._parents[idx])) + self._strings.get(raw)
+
+    def _get_meta_info(self, idx: int) -> ReadOnlyDict:
+        meta_info = {}
+        for pos, key in enumerate(self._keys):
+            value = self._get_meta_value(pos, idx)
+            if value is not _ABSENT:
+                meta_info[key] = value
+        return ReadOnlyDict(meta_info)
+
+    def _get_hash(self, idx: int) -> Optional[bytes]:
+        if not self._hash_present[idx]:
+            return None
+        start = idx * self._digest_size
+        return bytes(self._hashes[start:start + self._digest_size])
+
+    def _get_index(self, id: int) -> int:
+        if self._index_by_id is not None:
+            if 0 <= id < len(self._index_by_id):
+                return self._index_by_id[id]
+            return NO_NODE
+        pos = bisect_left(self._sorted_ids, id)
+        if pos < len(self._sorted_ids) and self._sorted_ids[pos] == id:
+            return self._sorted_idxs[pos]
+        return NO_NODE
+
+    def _build_node(self, idx: int) -> DataInfo:
+        return DataInfo(
+            self._ids[idx],
+            self._get_hash(idx),
+            self._get_meta_info(idx),
+            None if self._b_data_keeper_fabric is None else self._b_data_keeper_fabric.build()
+        )
+
+    @property
+    def nodes_count(self):
+        return len(self._ids)
+
+    @property
+    def digest_size(self):
+        return self._digest_size
+
+    def root(self):
+        if len(self._ids) == 0:
+            raise ValueError('Снимок пуст!')
+        return self._build_node(0)
+
+    def find_node(self, node: 'DataInfo'):
+        return self.find_node_by_id(node.id)
+
+    def find_node_by_id(self, id: int):
+        idx = self._get_index(id)
+        if idx == NO_NODE:
+            return None
+        return self._build_node(idx)
+
+    def get_children(self, node: 'DataInfo'):
+        idx = self._get_index(node.id)
+        if idx == NO_NODE:
+            return []
+        res = []
+        child = self._first_childs[idx]
+        while child != NO_NODE:
+            res.append(self._build_node(child))
+            child = self._next_siblings[child]
+        return res
+
+    def get_parent(self, node: 'DataInfo') -> Optional[DataInfo]:
+        idx = self._get_index(node.id)
+        if idx == NO_NODE or self._parents[idx] == NO_NODE:
+            return None
+        return self._build_node(self._parents[idx])
+
+    def memory_usage(self) -> int:
+        arrays = (
+            self._ids, self._parents, self._first_childs, self._next_siblings,
+            self._index_by_id, self._sorted_ids, self._sorted_idxs
+        )
+        res = sum(a.itemsize * len(a) for a in arrays if a is not None)
+        res += len(self._hashes) + len(self._hash_present)
+        res += self._strings.memory_usage()
+        res += sum(column.memory_usage() for column in self._columns)
+        return res
+
+
+# Сохраняет дерево DataInfo в колоночный снимок за один обход.
+# batch_size включает запрос потомков пачками
+class ColumnarTreeKeeper(TreeKeeper[DataInfo, DataInfo]):
+    def __init__(
+        self,
+        digest_size: Optional[int] = None,
+        b_data_keeper_fabric: Optional[BinaryDataKeeperFabric] = None,
+        batch_size: Optional[int] = None
+    ):
+        self._digest_size = digest_size
+        self._b_data_keeper_fabric = b_data_keeper_fabric
+        self._batch_size = batch_size
+
+    def keep(self, tree: 'ReadOnlyTree[DataInfo]') -> ColumnarSnapshotTree:
+        snapshot = ColumnarSnapshotTree(self._digest_size, self._b_data_keeper_fabric)
+        for node, _, depth in tree.iter_nodes(order=TraversalOrder.PRE_ORDER, batch_size=self._batch_size):
+            snapshot._append_node(depth, node)
+        snapshot._freeze()
+        return snapshot
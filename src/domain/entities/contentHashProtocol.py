@@ -1,10 +1,16 @@
 import abc
-from typing import TYPE_CHECKING, Iterable, Type
+from typing import TYPE_CHECKING, Iterable, Type, Union
 
 
 if TYPE_CHECKING:
+    from io import BufferedReader
     from _typeshed import SupportsRichComparison
-    
+
+# Источник данных для потокового хэширования: открытый файл,
+# файловый дескриптор, данные целиком (например, отображение файла)
+# или итератор кусков
+BinaryStream = Union['BufferedReader', int, memoryview, Iterable[memoryview]]
+
 
 class ContentHashProtocol(abc.ABC):
     @classmethod
@@ -19,6 +25,11 @@ class ContentHashProtocol(abc.ABC):
     def get_hash_from_binary(cls, data: bytes) ->  bytes:
         ...
 
+    # Должен совпадать с get_hash_from_binary от тех же данных
+    @abc.abstractmethod
+    def get_hash_from_stream(cls, data: 'BinaryStream') -> bytes:
+        ...
+
     @abc.abstractmethod
     def get_hash_by_hash_lst(cls, hash_lst: Iterable[bytes]) -> bytes:
         ...
@@ -49,6 +49,28 @@ class IdentifiedInfo(IdentifiedElement):
         return self._info
 
 
+# Запись пакетной выдачи поддерева: ссылка на родителя и глубина
+class IdentifiedInfoWithParent(IdentifiedInfo):
+    def __init__(
+        self,
+        id: int,
+        info: dict[str, Any],
+        parent_id: Optional[int],
+        depth: int
+    ) -> None:
+        super().__init__(id, info)
+        self._parent_id = parent_id
+        self._depth = depth
+
+    @property
+    def parent_id(self):
+        return self._parent_id
+
+    @property
+    def depth(self):
+        return self._depth
+
+
 class DataInfo(IdentifiedElement):
     def __init__(
         self,
@@ -59,7 +81,11 @@ class DataInfo(IdentifiedElement):
     ):
         super().__init__(id)
         self._hash = hash
-        self._meta_info = ReadOnlyDict(meta_info)
+        # Неизменяемую метаинформацию шлюза не копируем
+        if isinstance(meta_info, ReadOnlyDict):
+            self._meta_info = meta_info
+        else:
+            self._meta_info = ReadOnlyDict(meta_info)
         self._b_data_keeper = b_data_keeper 
     
     @property
@@ -0,0 +1,225 @@
+import sys
+from typing import Any, Optional, Sequence
+from domain.entities.DirectGatewayTree import fetch_children_by_subtree
+from domain.entities.dataInfo import DataInfo, DataInfoBuilder
+from domain.interfaces.gateway import IdNotFoundError, ReadableTreeDataGateway
+from domain.interfaces.tree import ReadOnlyTree
+
+
+# Виды записей кэша
+_NODE = 0
+_CHILDREN = 1
+
+# Приблизительный размер ссылки в списке потомков
+_REF_SIZE = 8
+
+
+# Снимок счетчиков кэша
+class MirrorCacheStats:
+    def __init__(
+        self,
+        node_hits: int,
+        node_misses: int,
+        children_hits: int,
+        children_misses: int,
+        evictions: int,
+        entries: int,
+        size: int
+    ):
+        self._node_hits = node_hits
+        self._node_misses = node_misses
+        self._children_hits = children_hits
+        self._children_misses = children_misses
+        self._evictions = evictions
+        self._entries = entries
+        self._size = size
+
+    @property
+    def node_hits(self):
+        return self._node_hits
+
+    @property
+    def node_misses(self):
+        return self._node_misses
+
+    @property
+    def children_hits(self):
+        return self._children_hits
+
+    @property
+    def children_misses(self):
+        return self._children_misses
+
+    @property
+    def hits(self):
+        return self._node_hits + self._children_hits
+
+    @property
+    def misses(self):
+        return self._node_misses + self._children_misses
+
+    @property
+    def evictions(self):
+        return self._evictions
+
+    @property
+    def entries(self):
+        return self._entries
+
+    # Приблизительный объем кэша в байтах
+    @property
+    def size(self):
+        return self._size
+
+    def __repr__(self):
+        return (
+            f'MirrorCacheStats(hits={self.hits}, misses={self.misses}, '
+            f'evictions={self._evictions}, entries={self._entries}, size={self._size})'
+        )
+
+
+def _estimate_node_size(node: DataInfo) -> int:
+    size = sys.getsizeof(node) + len(node.hash or b'')
+    for key, value in node.meta_info.items():
+        size += sys.getsizeof(key) + sys.getsizeof(value)
+    return size
+
+
+# Дерево над шлюзом чтения, которое запоминает построенные DataInfo
+# и списки потомков. Повторные обходы (сравнение, хэширование,
+# вывод) не обращаются к шлюзу. Кэш - LRU, ограниченный числом
+# записей max_entries и/или приблизительным объемом max_size в байтах.
+# Дерево рассчитано на неизменный шлюз (снимок), после изменений
+# хранилища кэш нужно сбросить через invalidate.
+# При промахе потомки запрашиваются поддеревом глубины
+# prefetch_depth, и в кэш попадают списки потомков всех его уровней
+class MirrorGatewayTree(ReadOnlyTree[DataInfo]):
+    def __init__(
+        self,
+        r_gate: 'ReadableTreeDataGateway',
+        d_info_builder: 'DataInfoBuilder',
+        max_entries: Optional[int] = 100000,
+        max_size: Optional[int] = None,
+        prefetch_depth: int = 2
+    ):
+        if max_entries is not None and max_entries <= 0:
+            raise ValueError(f'Размер кэша должен быть положительным! max_entries={max_entries}')
+        if max_size is not None and max_size <= 0:
+            raise ValueError(f'Объем кэша должен быть положительным! max_size={max_size}')
+        if prefetch_depth <= 0:
+            raise ValueError(f'Глубина запроса должна быть положительной! prefetch_depth={prefetch_depth}')
+        self._r_gate = r_gate
+        self._d_info_builder = d_info_builder
+        self._max_entries = max_entries
+        self._max_size = max_size
+        self._prefetch_depth = prefetch_depth
+        self._root_id: Optional[int] = None
+        # (вид, id) -> (значение, размер). Порядок вставки - порядок
+        # использования: при попадании запись переставляется в конец
+        self._cache: dict[tuple[int, int], tuple[Any, int]] = {}
+        self._size = 0
+        self._node_hits = 0
+        self._node_misses = 0
+        self._children_hits = 0
+        self._children_misses = 0
+        self._evictions = 0
+
+    @property
+    def stats(self) -> MirrorCacheStats:
+        return MirrorCacheStats(
+            self._node_hits,
+            self._node_misses,
+            self._children_hits,
+            self._children_misses,
+            self._evictions,
+            len(self._cache),
+            self._size
+        )
+
+    def _get_cached(self, key: tuple[int, int]) -> Any:
+        item = self._cache.pop(key, None)
+        if item is None:
+            return None
+        self._cache[key] = item
+        return item[0]
+
+    def _put(self, key: tuple[int, int], value: Any, size: int):
+        old = self._cache.pop(key, None)
+        if old is not None:
+            self._size -= old[1]
+        self._cache[key] = (value, size)
+        self._size += size
+        while len(self._cache) > 1 and (
+            (self._max_entries is not None and len(self._cache) > self._max_entries)
+            or (self._max_size is not None and self._size > self._max_size)
+        ):
+            oldest = next(iter(self._cache))
+            self._size -= self._cache.pop(oldest)[1]
+            self._evictions += 1
+
+    def _get_node_by_id(self, id: int) -> DataInfo:
+        node = self._get_cached((_NODE, id))
+        if node is not None:
+            self._node_hits += 1
+            return node
+        self._node_misses += 1
+        node = self._d_info_builder.build(self._r_gate.get_info_by_id(id))
+        self._put((_NODE, id), node, _estimate_node_size(node))
+        return node
+
+    def root(self):
+        if self._root_id is None:
+            root = self._d_info_builder.build(self._r_gate.get_root())
+            self._root_id = root.id
+            self._put((_NODE, root.id), root, _estimate_node_size(root))
+            self._node_misses += 1
+            return root
+        return self._get_node_by_id(self._root_id)
+
+    def find_node(self, node: 'DataInfo'):
+        return self._get_node_by_id(node.id)
+
+    def find_node_by_id(self, id: int):
+        try:
+            return self._get_node_by_id(id)
+        except IdNotFoundError:
+            return None
+
+    def get_binary_file(self, node: 'DataInfo'):
+        return self._r_gate.get_binary_data_by_id(node.id)
+
+    def get_children(self, node: 'DataInfo'):
+        children = self._get_cached((_CHILDREN, node.id))
+        if children is not None:
+            self._children_hits += 1
+            return list(children)
+        self._children_misses += 1
+        fetched = fetch_children_by_subtree(self._r_gate, self._d_info_builder, node.id, self._prefetch_depth)
+        # Запрошенный список кладется последним, чтобы не вытесниться первым
+        children = tuple(fetched.pop(node.id))
+        for id, lst in fetched.items():
+            self._put_children(id, tuple(lst))
+        self._put_children(node.id, children)
+        return list(children)
+
+    def get_children_batch(self, nodes: 'Sequence[DataInfo]') -> list[list[DataInfo]]:
+        return [self.get_children(node) for node in nodes]
+
+    # Узлы делятся со списком потомков, поэтому find_node
+    # для них не обращается к шлюзу
+    def _put_children(self, id: int, children: tuple[DataInfo, ...]):
+        for child in children:
+            self._put((_NODE, child.id), child, _estimate_node_size(child))
+        self._put((_CHILDREN, id), children, sys.getsizeof(children) + _REF_SIZE * len(children))
+
+    # Сбрасывает кэш узла и его списка потомков, без аргумента - весь кэш
+    def invalidate(self, node: 'Optional[DataInfo]' = None):
+        if node is None:
+            self._cache.clear()
+            self._size = 0
+            self._root_id = None
+            return
+        for key in ((_NODE, node.id), (_CHILDREN, node.id)):
+            item = self._cache.pop(key, None)
+            if item is not None:
+                self._size -= item[1]
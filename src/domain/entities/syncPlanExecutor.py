@@ -0,0 +1,338 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from enum import Enum
+from pathlib import PurePosixPath
+from typing import Callable, Generic, Optional, Sequence, TypeVar, Union
+
+from domain.entities.dataInfo import DataInfo
+from domain.interfaces.gateway import IdNotFoundError
+from domain.interfaces.syncJournal import SyncJournal
+from domain.interfaces.tree import ModifiableTree, NodeNotFoundedError
+
+T = TypeVar('T', bound=DataInfo)
+
+
+class SyncOperationKind(Enum):
+    CREATE = 0
+    DELETE = 1
+
+
+class SyncPlanError(Exception):
+    ...
+
+
+class DependencyFailedError(SyncPlanError):
+    ...
+
+
+class SyncOperation(Generic[T]):
+    def __init__(
+        self,
+        kind: SyncOperationKind,
+        node: T,
+        parent: 'Union[T, SyncOperation[T], None]' = None
+    ):
+        # CREATE: node - добавляемый узел исходного дерева,
+        #   parent - существующий узел целевого дерева или операция,
+        #   создающая родителя
+        # DELETE: node - удаляемый узел целевого дерева,
+        #   parent - операция удаления родителя, если она есть в плане
+        if kind == SyncOperationKind.CREATE and parent is None:
+            raise SyncPlanError('Для создания нужен родитель!')
+        self._kind = kind
+        self._node = node
+        self._parent = parent
+        # Узел, созданный в целевом дереве
+        self._result: Optional[T] = None
+
+    @property
+    def kind(self):
+        return self._kind
+
+    @property
+    def node(self):
+        return self._node
+
+    @property
+    def parent(self):
+        return self._parent
+
+    @property
+    def result(self):
+        return self._result
+
+    @property
+    def size(self) -> int:
+        return int(self._node.meta_info.get('size', 0) or 0)
+
+    def __repr__(self):
+        return f'SyncOperation(kind={self._kind.name}, node={self._node})'
+
+
+class SyncProgress:
+    def __init__(
+        self,
+        total: int,
+        done: int,
+        failed: int,
+        done_bytes: int,
+        elapsed: float
+    ):
+        self._total = total
+        self._done = done
+        self._failed = failed
+        self._done_bytes = done_bytes
+        self._elapsed = elapsed
+
+    @property
+    def total(self):
+        return self._total
+
+    # Число завершенных операций, включая ошибочные
+    @property
+    def done(self):
+        return self._done
+
+    @property
+    def failed(self):
+        return self._failed
+
+    @property
+    def done_bytes(self):
+        return self._done_bytes
+
+    @property
+    def elapsed(self):
+        return self._elapsed
+
+    @property
+    def files_per_second(self) -> float:
+        if self._elapsed <= 0:
+            return 0.0
+        return (self._done - self._failed) / self._elapsed
+
+    @property
+    def megabytes_per_second(self) -> float:
+        if self._elapsed <= 0:
+            return 0.0
+        return self._done_bytes / self._elapsed / (1 << 20)
+
+    def __repr__(self):
+        return (
+            f'SyncProgress(done={self._done}/{self._total}, failed={self._failed}, '
+            f'files/s={self.files_per_second:.1f}, MB/s={self.megabytes_per_second:.2f})'
+        )
+
+
+class SyncReport(SyncProgress):
+    def __init__(
+        self,
+        progress: SyncProgress,
+        errors: 'list[tuple[SyncOperation, BaseException]]'
+    ):
+        super().__init__(
+            progress.total,
+            progress.done,
+            progress.failed,
+            progress.done_bytes,
+            progress.elapsed
+        )
+        self._errors = errors
+
+    # Пары (операция, исключение)
+    @property
+    def errors(self):
+        return self._errors
+
+
+# Ключ операции, одинаковый между запусками
+def default_operation_key(op: SyncOperation) -> str:
+    node = op.node
+    location = node.meta_info.get('rel_path', node.id)
+    return f'{op.kind.name}:{location}:{node.hash.hex()}'
+
+
+def _get_node_name(node: DataInfo) -> Optional[str]:
+    rel_path = node.meta_info.get('rel_path')
+    if rel_path is None:
+        return None
+    return PurePosixPath(rel_path).name
+
+
+# Выполняет план синхронизации на пуле потоков.
+# Создание родителя выполняется раньше создания потомков,
+# удаление потомков - раньше удаления родителя.
+# Независимые операции идут параллельно, поэтому шлюз дерева
+# должен допускать обращения из нескольких потоков.
+# С журналом выполнение можно продолжить после сбоя: выполненные
+# операции пропускаются, а начатые проверяются по хэшу.
+# Для этого id узлов целевого дерева должны сохраняться между запусками
+class SyncPlanExecutor(Generic[T]):
+    def __init__(
+        self,
+        tree: ModifiableTree[T],
+        max_workers: int = 8,
+        progress_callback: Optional[Callable[[SyncProgress], None]] = None,
+        journal: Optional[SyncJournal] = None,
+        get_operation_key: Callable[[SyncOperation[T]], str] = default_operation_key
+    ):
+        if max_workers <= 0:
+            raise ValueError(f'Число потоков должно быть положительным! max_workers={max_workers}')
+        self._tree = tree
+        self._max_workers = max_workers
+        self._progress_callback = progress_callback
+        self._journal = journal
+        self._get_operation_key = get_operation_key
+
+    # Для каждой операции: число операций, которых она ждет,
+    # и операции, ждущие ее
+    @staticmethod
+    def _build_dependencies(
+        operations: Sequence[SyncOperation[T]]
+    ) -> tuple[dict[int, int], dict[int, list[SyncOperation[T]]]]:
+        planned = {id(op) for op in operations}
+        waits_count = {id(op): 0 for op in operations}
+        dependents: dict[int, list[SyncOperation[T]]] = {id(op): [] for op in operations}
+        for op in operations:
+            parent = op.parent
+            if not isinstance(parent, SyncOperation):
+                continue
+            if id(parent) not in planned:
+                raise SyncPlanError(f'Операция родителя не входит в план! operation={op}')
+            if op.kind != parent.kind:
+                raise SyncPlanError(f'Операция и операция родителя разного вида! operation={op}')
+            if op.kind == SyncOperationKind.CREATE:
+                # Сначала создается родитель
+                waits_count[id(op)] += 1
+                dependents[id(parent)].append(op)
+            else:
+                # Сначала удаляются потомки
+                waits_count[id(parent)] += 1
+                dependents[id(op)].append(parent)
+        return waits_count, dependents
+
+    def _run_operation(self, op: SyncOperation[T], verify: bool = False):
+        if op.kind == SyncOperationKind.CREATE:
+            parent = op.parent
+            if isinstance(parent, SyncOperation):
+                parent = parent.result
+            if verify and self._adopt_existing(op, parent):
+                return
+            op._result = self._tree.add_node(parent, op.node)
+        else:
+            try:
+                self._tree.remove_node(op.node)
+            except (IdNotFoundError, NodeNotFoundedError):
+                # Узел мог быть удален до сбоя
+                if not verify:
+                    raise
+
+    # Операция могла быть начата до сбоя. Если узел уже создан
+    # и его хэш совпадает, то берем его, иначе удаляем недописанный
+    def _adopt_existing(self, op: SyncOperation[T], parent: T) -> bool:
+        name = _get_node_name(op.node)
+        if name is None:
+            return False
+        for child in self._tree.get_children(parent):
+            if _get_node_name(child) != name:
+                continue
+            if child.hash == op.node.hash:
+                op._result = child
+                return True
+            self._tree.remove_node(child)
+            return False
+        return False
+
+    # Узел, созданный операцией в прошлом запуске
+    def _restore_operation(self, op: SyncOperation[T], result_id: Optional[int]):
+        if op.kind == SyncOperationKind.CREATE and result_id is not None:
+            result = self._tree.find_node_by_id(result_id)
+            if result is None:
+                raise NodeNotFoundedError(f'Узел, созданный до сбоя, не найден! id={result_id}')
+            op._result = result
+
+    def execute(self, operations: Sequence[SyncOperation[T]]) -> SyncReport:
+        waits_count, dependents = self._build_dependencies(operations)
+        # Состояние из журнала
+        keys: dict[int, str] = {}
+        completed: dict[str, Optional[int]] = {}
+        started: set[str] = set()
+        if self._journal is not None:
+            keys = {id(op): self._get_operation_key(op) for op in operations}
+            completed = dict(self._journal.get_completed())
+            started = self._journal.get_planned()
+            self._journal.record_planned(keys.values())
+        errors: list[tuple[SyncOperation[T], BaseException]] = []
+        total = len(operations)
+        done = 0
+        done_bytes = 0
+        start_time = time.perf_counter()
+
+        def get_progress():
+            return SyncProgress(
+                total, done, len(errors), done_bytes, time.perf_counter() - start_time
+            )
+
+        ready = [op for op in operations if waits_count[id(op)] == 0]
+        in_work: dict[Future, SyncOperation[T]] = {}
+        with ThreadPoolExecutor(self._max_workers) as executor:
+            while len(ready) > 0 or len(in_work) > 0:
+                # Выполненные в прошлых запусках операции не повторяем
+                restored: list[SyncOperation[T]] = []
+                # Держим в пуле не больше двух операций на поток
+                while len(ready) > 0 and len(in_work) < 2 * self._max_workers:
+                    op = ready.pop()
+                    key = keys.get(id(op))
+                    if key in completed:
+                        restored.append(op)
+                        continue
+                    in_work[executor.submit(self._run_operation, op, key in started)] = op
+                finished: set[Future] = set()
+                if len(restored) == 0:
+                    finished, _ = wait(in_work, return_when=FIRST_COMPLETED)
+                results: list[tuple[SyncOperation[T], Optional[BaseException], bool]] = [
+                    (op, None, True) for op in restored
+                ]
+                for future in finished:
+                    results.append((in_work.pop(future), future.exception(), False))
+                for op, error, is_restored in results:
+                    failed_stack: list[SyncOperation[T]] = []
+                    done += 1
+                    if is_restored:
+                        try:
+                            self._restore_operation(op, completed[keys[id(op)]])
+                        except Exception as e:
+                            error = e
+                    if error is not None:
+                        errors.append((op, error))
+                        failed_stack.extend(dependents[id(op)])
+                    else:
+                        if not is_restored:
+                            done_bytes += op.size
+                            if self._journal is not None:
+                                result_id = None if op.result is None else op.result.id
+                                self._journal.record_done(keys[id(op)], result_id)
+                        for dependent in dependents[id(op)]:
+                            waits_count[id(dependent)] -= 1
+                            if waits_count[id(dependent)] == 0:
+                                ready.append(dependent)
+                    # Зависящие от неудачной операции не выполняются
+                    while len(failed_stack) > 0:
+                        failed_op = failed_stack.pop()
+                        if waits_count[id(failed_op)] < 0:
+                            continue
+                        waits_count[id(failed_op)] = -1
+                        done += 1
+                        errors.append((
+                            failed_op,
+                            DependencyFailedError(f'Не выполнена зависимость! operation={op}')
+                        ))
+                        failed_stack.extend(dependents[id(failed_op)])
+                    if self._progress_callback is not None:
+                        self._progress_callback(get_progress())
+
+        if self._journal is not None:
+            self._journal.flush()
+            if len(errors) == 0:
+                self._journal.finish()
+        return SyncReport(get_progress(), errors)
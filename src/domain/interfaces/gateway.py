@@ -1,8 +1,10 @@
 import abc
+import contextlib
 from typing import TYPE_CHECKING
+from domain.entities.dataInfo import IdentifiedInfoWithParent
 
 if TYPE_CHECKING:
-    from typing import Any, ContextManager, Mapping, Optional, Sequence
+    from typing import Any, ContextManager, Iterator, Mapping, Optional, Sequence
     from io import BufferedReader
     from domain.entities.contentHashProtocol import ContentHashProtocol
     from domain.entities.contentTransformationProtocol import DataTransformationProtocol
@@ -30,10 +32,65 @@ class TreeDataGateway(abc.ABC):
     ) -> 'Sequence[IdentifiedInfo]':
         ...
 
+    # Поддерево пачками по chunk_size записей. Родитель выдается раньше
+    # потомков, max_depth ограничивает глубину (корень поддерева - 0).
+    # Реализация по умолчанию обходит поддерево через get_childs_info_by_id,
+    # шлюзы могут заменить ее одним проходом по хранилищу
+    def iter_subtree_info_by_id(
+        self,
+        id: int,
+        max_depth: 'Optional[int]' = None,
+        chunk_size: int = 1000
+    ) -> 'Iterator[Sequence[IdentifiedInfoWithParent]]':
+        root = self.get_info_by_id(id)
+        chunk = [IdentifiedInfoWithParent(root.id, root.info, None, 0)]
+        not_visited = [(root.id, 0)]
+        while len(not_visited) > 0:
+            cur_id, depth = not_visited.pop()
+            if max_depth is not None and depth >= max_depth:
+                continue
+            for child in self.get_childs_info_by_id(cur_id):
+                chunk.append(IdentifiedInfoWithParent(child.id, child.info, cur_id, depth + 1))
+                not_visited.append((child.id, depth + 1))
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+        if len(chunk) > 0:
+            yield chunk
+
+    # Поддерево одним пакетом
+    def get_subtree_info_by_id(
+        self,
+        id: int,
+        max_depth: 'Optional[int]' = None
+    ) -> 'Sequence[IdentifiedInfoWithParent]':
+        res: list[IdentifiedInfoWithParent] = []
+        for chunk in self.iter_subtree_info_by_id(id, max_depth):
+            res.extend(chunk)
+        return res
+
     @abc.abstractmethod
     def get_binary_data_by_id(self, id: int) -> 'BufferedReader':
         ...
 
+    # Диапазон данных (length=None - до конца) как memoryview, который
+    # действителен только внутри контекста. Реализация по умолчанию
+    # читает диапазон в память, шлюзы могут выдавать данные без копирования
+    @contextlib.contextmanager
+    def get_binary_view_by_id(
+        self,
+        id: int,
+        offset: int = 0,
+        length: 'Optional[int]' = None
+    ) -> 'Iterator[memoryview]':
+        with self.get_binary_data_by_id(id) as data:
+            data.seek(offset)
+            view = memoryview(data.read() if length is None else data.read(length))
+        try:
+            yield view
+        finally:
+            view.release()
+
     @abc.abstractmethod
     def get_hash_protocol(self) -> 'ContentHashProtocol':
         ...
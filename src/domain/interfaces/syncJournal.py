@@ -0,0 +1,39 @@
+import abc
+from typing import Iterable, Mapping, Optional
+
+
+# Журнал операций синхронизации для продолжения после сбоя.
+# Запланированные операции должны быть надежно записаны до начала работы,
+# отметки о выполнении могут сбрасываться на диск пачками: потерянная
+# отметка приводит лишь к повторной проверке операции
+class SyncJournal(abc.ABC):
+    # Ключи операций, запланированных в прошлых запусках
+    @abc.abstractmethod
+    def get_planned(self) -> set[str]:
+        ...
+
+    # Ключ выполненной операции -> id созданного узла (если есть)
+    @abc.abstractmethod
+    def get_completed(self) -> Mapping[str, Optional[int]]:
+        ...
+
+    @abc.abstractmethod
+    def record_planned(self, keys: Iterable[str]):
+        ...
+
+    @abc.abstractmethod
+    def record_done(self, key: str, result_id: Optional[int] = None):
+        ...
+
+    @abc.abstractmethod
+    def flush(self):
+        ...
+
+    # План выполнен полностью, журнал больше не нужен
+    @abc.abstractmethod
+    def finish(self):
+        ...
+
+
+class SyncJournalError(Exception):
+    ...
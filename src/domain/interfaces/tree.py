@@ -1,6 +1,8 @@
 import abc
-from collections import deque
-from typing import Callable, Iterable, Iterator, TypeVar, Generic, Optional, List
+import io
+from typing import Callable, Iterable, Iterator, Sequence, TypeVar, Generic, Optional, List
+from domain.shared.treeTraversal import TraversalItem, TraversalOrder, iter_tree
+from domain.shared.treeRepr import Sink, TreeReprFormat, TreeReprResult, write_tree_repr
 
 T = TypeVar('T')
 CT = TypeVar('CT')
@@ -18,34 +20,66 @@ class Tree(abc.ABC, Generic[T]):
     def get_children(self, node: T) -> list[T]:
         ...
 
+    # Узел по идентификатору хранилища, None - если узла нет
+    @abc.abstractmethod
+    def find_node_by_id(self, id: int) -> Optional[T]:
+        ...
+
+    # Потомки нескольких узлов сразу. Деревья над хранилищами
+    # могут заменить на один запрос
+    def get_children_batch(self, nodes: Sequence[T]) -> list[list[T]]:
+        return [self.get_children(node) for node in nodes]
+
+    # Ленивый обход поддерева узла (по умолчанию - всего дерева),
+    # элементы - (узел, родитель, глубина). batch_size включает
+    # запрос потомков пачками через get_children_batch
+    def iter_nodes(
+        self,
+        node: Optional[T] = None,
+        order: TraversalOrder = TraversalOrder.PRE_ORDER,
+        prune: Optional[Callable[[T, int], bool]] = None,
+        max_depth: Optional[int] = None,
+        batch_size: Optional[int] = None
+    ) -> Iterator[TraversalItem]:
+        return iter_tree(
+            self.root() if node is None else node,
+            self.get_children,
+            order,
+            prune,
+            max_depth,
+            None if batch_size is None else self.get_children_batch,
+            batch_size or 1
+        )
+
     def tree_repr_from_node(
         self,
         node: T,
         to_str_foo: Callable[[T], str] = repr,
         indent: str = '  ',
     ):
-        stack: deque[Iterator[T]] = deque([iter([node])])
-        res_items: list[str] = []
-        while len(stack) > 0:
-            last = stack[-1]
-            try:
-                cur_child = next(last)
-            except StopIteration:
-                stack.pop()
-                continue
-            children = self.get_children(cur_child)
-            res_items.append(indent * (len(stack) - 1) + to_str_foo(cur_child) + '\n')
-            if len(children) > 0:
-                stack.append(iter(children))
-        return ''.join(res_items)
+        sink = io.StringIO()
+        write_tree_repr(self, node, sink, to_str_foo=to_str_foo, indent=indent, flush_sink=False)
+        return sink.getvalue()
+
+    # Потоковый вывод поддерева в текстовый или двоичный приемник,
+    # подробности - в write_tree_repr
+    def write_tree_repr(
+        self,
+        node: T,
+        sink: Sink,
+        format: TreeReprFormat = TreeReprFormat.TEXT,
+        **kwargs
+    ) -> TreeReprResult:
+        return write_tree_repr(self, node, sink, format, **kwargs)
     
 
 class ReadOnlyTree(Tree[T], Generic[T]):
     ...
 
 class ModifiableTree(Tree[T], Generic[T]):
+    # Возвращает добавленный узел этого дерева
     @abc.abstractmethod
-    def add_node(self, p_node: T, c_node: 'T'):
+    def add_node(self, p_node: T, c_node: 'T') -> T:
         ...
 
     @abc.abstractmethod
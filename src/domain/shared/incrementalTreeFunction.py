@@ -0,0 +1,188 @@
+from collections.abc import Callable, Hashable
+from typing import TYPE_CHECKING, Generic, Iterable, Optional, TypeVar
+
+from domain.interfaces.tree import NodeNotFoundedError
+if TYPE_CHECKING:
+    from _typeshed import SupportsRichComparison as Comp
+
+IN = TypeVar('IN') # Значение в узле, от которого считается функция
+OUT = TypeVar('OUT') # Результат функции от узла и его потомков
+NODE = TypeVar('NODE', bound=Hashable) # Тип узла (id или путь)
+
+
+# Инкрементальный вариант DependsOnlyDescendantsListTreeFunctionBuilder.
+# Запоминает структуру дерева и результаты по узлам. После изменений
+# пересчитываются только грязные узлы и цепочки их предков,
+# результаты соседей берутся из памяти
+class IncrementalDependsOnlyDescendantsTreeFunction(Generic[NODE, IN, OUT]):
+    def __init__(
+        self,
+        get_out_from_in: Callable[[IN], OUT],
+        get_in_from_leaf: Callable[[NODE], IN],
+        get_leaf_order: Callable[[NODE], 'Comp'],
+        get_out_from_ordered_out: Callable[[list[OUT]], OUT],
+        get_descendants_method: Callable[[NODE], list[NODE]],
+        save_out_method: Callable[[NODE, OUT], None] | None = None,
+        get_cached_method: Callable[[NODE], OUT | None] | None = None
+    ):
+        self._get_out_from_in = get_out_from_in
+        self._get_in_from_leaf = get_in_from_leaf
+        self._get_leaf_order = get_leaf_order
+        self._get_out_from_ordered_out = get_out_from_ordered_out
+        self._get_descendants_method = get_descendants_method
+        self._save_out_method = save_out_method
+        self._get_cached_method = get_cached_method
+
+        self._root: Optional[NODE] = None
+        self._parents: dict[NODE, Optional[NODE]] = {}
+        # None - потомки не раскрывались (результат взят из кэша)
+        self._children: dict[NODE, Optional[list[NODE]]] = {}
+        self._outs: dict[NODE, OUT] = {}
+        self._dirty: set[NODE] = set()
+
+    @property
+    def root_out(self) -> OUT:
+        if self._root is None:
+            raise NodeNotFoundedError('Дерево еще не построено!')
+        return self._outs[self._root]
+
+    def get_out(self, node: NODE) -> OUT:
+        try:
+            return self._outs[node]
+        except KeyError:
+            raise NodeNotFoundedError(f'node={node}')
+
+    def __contains__(self, node: NODE) -> bool:
+        return node in self._outs
+
+    # Полный расчет от корня
+    def build(self, root: NODE) -> OUT:
+        self._root = root
+        self._parents.clear()
+        self._children.clear()
+        self._outs.clear()
+        self._dirty.clear()
+        self._build_subtree(root, None)
+        return self._outs[root]
+
+    # Изменилось содержимое узла или список его потомков.
+    # Для добавленного узла помечается его родитель
+    def mark_changed(self, nodes: Iterable[NODE]):
+        for node in nodes:
+            if node not in self._outs:
+                raise NodeNotFoundedError(f'node={node}')
+            self._dirty.add(node)
+
+    # Узел удален: убираем его поддерево, родитель становится грязным
+    def mark_removed(self, nodes: Iterable[NODE]):
+        for node in nodes:
+            if node not in self._outs:
+                raise NodeNotFoundedError(f'node={node}')
+            parent = self._parents[node]
+            if parent is None:
+                raise ValueError('Невозможно удалить корень!')
+            siblings = self._children[parent]
+            if siblings is not None:
+                siblings.remove(node)
+            self._drop_subtree(node)
+            self._dirty.add(parent)
+
+    # Пересчет грязных узлов и их предков. Возвращает результат корня
+    def update(self) -> OUT:
+        if self._root is None:
+            raise NodeNotFoundedError('Дерево еще не построено!')
+        # Собираем затронутые узлы с их глубиной
+        depth_by_node: dict[NODE, int] = {}
+        for node in self._dirty:
+            if node in depth_by_node:
+                continue
+            chain: list[NODE] = []
+            cur: Optional[NODE] = node
+            while cur is not None and cur not in depth_by_node:
+                chain.append(cur)
+                cur = self._parents[cur]
+            base_depth = -1 if cur is None else depth_by_node[cur]
+            for index, chain_node in enumerate(reversed(chain)):
+                depth_by_node[chain_node] = base_depth + index + 1
+        # Пересчитываем от глубоких к мелким, потомки готовы раньше предков
+        for node in sorted(depth_by_node, key=depth_by_node.__getitem__, reverse=True):
+            if node not in self._outs:
+                # Узел удален при пересчете предка
+                continue
+            if node in self._dirty:
+                self._recompute_dirty(node)
+            else:
+                self._recompute_from_children(node)
+        self._dirty.clear()
+        return self._outs[self._root]
+
+    def _save(self, node: NODE, out: OUT):
+        self._outs[node] = out
+        if self._save_out_method is not None:
+            self._save_out_method(node, out)
+
+    def _recompute_dirty(self, node: NODE):
+        descendants = self._get_descendants_method(node)
+        old_children = self._children.get(node) or []
+        new_set = set(descendants)
+        for child in old_children:
+            if child not in new_set:
+                self._drop_subtree(child)
+        if len(descendants) == 0:
+            self._children[node] = []
+            self._save(node, self._get_out_from_in(self._get_in_from_leaf(node)))
+            return
+        descendants.sort(key=self._get_leaf_order)
+        for child in descendants:
+            if child not in self._outs:
+                self._build_subtree(child, node)
+        self._children[node] = descendants
+        self._recompute_from_children(node)
+
+    def _recompute_from_children(self, node: NODE):
+        children = self._children[node]
+        if not children:
+            # Раскрываем узел, результат которого был взят из кэша
+            self._recompute_dirty(node)
+            return
+        self._save(
+            node,
+            self._get_out_from_ordered_out([self._outs[child] for child in children])
+        )
+
+    # Расчет поддерева с заполнением таблиц, без рекурсии
+    def _build_subtree(self, node: NODE, parent: Optional[NODE]):
+        stack: list[tuple[NODE, Optional[NODE], bool]] = [(node, parent, False)]
+        while len(stack) > 0:
+            cur, cur_parent, expanded = stack.pop()
+            if expanded:
+                self._recompute_from_children(cur)
+                continue
+            self._parents[cur] = cur_parent
+            if self._get_cached_method is not None:
+                cached = self._get_cached_method(cur)
+                if cached is not None:
+                    self._children[cur] = None
+                    self._outs[cur] = cached
+                    continue
+            descendants = self._get_descendants_method(cur)
+            if len(descendants) == 0:
+                self._children[cur] = []
+                self._save(cur, self._get_out_from_in(self._get_in_from_leaf(cur)))
+                continue
+            descendants.sort(key=self._get_leaf_order)
+            self._children[cur] = descendants
+            stack.append((cur, cur_parent, True))
+            for desc in reversed(descendants):
+                stack.append((desc, cur, False))
+
+    def _drop_subtree(self, node: NODE):
+        stack = [node]
+        while len(stack) > 0:
+            cur = stack.pop()
+            self._dirty.discard(cur)
+            self._outs.pop(cur, None)
+            self._parents.pop(cur, None)
+            children = self._children.pop(cur, None)
+            if children:
+                stack.extend(children)
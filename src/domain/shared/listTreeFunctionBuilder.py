@@ -1,6 +1,8 @@
-from collections import deque
 from collections.abc import Callable
-from typing import TYPE_CHECKING, Any, Iterable, TypeVar
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Any, Generator, Generic, Iterable, Iterator, Optional, TypeVar
+import os
+from domain.shared.treeTraversal import TraversalOrder, iter_tree
 if TYPE_CHECKING:
     from _typeshed import SupportsRichComparison as Comp
 
@@ -15,6 +17,61 @@ IN = TypeVar('IN') # Значение в узле, от которого счи
 OUT = TypeVar('OUT') # Результат функции от узла и его потомков
 NODE = TypeVar('NODE') # Тип узла
 
+# Итеративный обход в обратном порядке (потомки раньше родителя).
+# Результаты потомков копятся на общем стеке out_stack и снимаются
+# срезом, когда готовы все потомки узла, поэтому глубина дерева
+# не ограничена пределом рекурсии.
+# Выдает пары (узел, результат) по мере готовности поддеревьев
+# (кроме взятых из кэша), а результат корня возвращает через StopIteration
+def _post_order_tree_function_generator(
+    node: NODE,
+    get_out_from_in: Callable[[IN], OUT],
+    get_in_from_leaf: Callable[[NODE], IN],
+    get_leaf_order: Callable[[NODE], 'Comp'],
+    get_out_from_ordered_out: Callable[[list[OUT]], OUT],
+    get_descendants_method: Callable[[NODE], list[NODE]],
+    save_out_method: Callable[[NODE, OUT], None] | None,
+    get_cached_method: Callable[[NODE], OUT | None] | None
+) -> Generator[tuple[NODE, OUT], None, OUT]:
+    # Второй элемент: -1, если узел еще не раскрыт,
+    # иначе позиция первого результата его потомков в out_stack
+    stack: list[tuple[NODE, int]] = [(node, -1)]
+    out_stack: list[OUT] = []
+    while len(stack) > 0:
+        cur_node, start = stack.pop()
+        out_res: OUT
+        if start >= 0:
+            # Все потомки посчитаны, объединяем их результаты
+            out_res = get_out_from_ordered_out(out_stack[start:])
+            del out_stack[start:]
+        else:
+            # Проверяем наличие кэша. Если есть, то берем его
+            if get_cached_method is not None:
+                cached = get_cached_method(cur_node)
+                if cached is not None:
+                    out_stack.append(cached)
+                    continue
+            # Получаем список потомков
+            descendants = get_descendants_method(cur_node)
+            if len(descendants) == 0:
+                # Если потомков нет, то считаем результат для текущего узла
+                out_res = get_out_from_in(get_in_from_leaf(cur_node))
+            else:
+                # Если есть потомки, то сортируем их в нужно порядке
+                descendants.sort(key=get_leaf_order)
+                # Узел вернется в обработку после всех потомков
+                stack.append((cur_node, len(out_stack)))
+                stack.extend((desc, -1) for desc in reversed(descendants))
+                continue
+
+        # Если нужно сохранить, то сохраняем
+        if save_out_method is not None:
+            save_out_method(cur_node, out_res)
+        out_stack.append(out_res)
+        yield cur_node, out_res
+    return out_stack[0]
+
+
 # TODO: подумать над возможностью дополнительного преобразования
 # функции объединения OUT результатов
 def DependsOnlyDescendantsListTreeFunctionBuilder(
@@ -25,39 +82,177 @@ def DependsOnlyDescendantsListTreeFunctionBuilder(
     get_descendants_method: Callable[[NODE], list[NODE]],
     save_out_method: Callable[[NODE, OUT], None] | None = None,
     get_cached_method: Callable[[NODE], OUT | None] | None = None
+) -> Callable[[NODE], OUT]:
+    def foo(node: NODE) -> OUT:
+        gen = _post_order_tree_function_generator(
+            node,
+            get_out_from_in,
+            get_in_from_leaf,
+            get_leaf_order,
+            get_out_from_ordered_out,
+            get_descendants_method,
+            save_out_method,
+            get_cached_method
+        )
+        # Прокручиваем обход, результат корня приходит в StopIteration
+        while True:
+            try:
+                next(gen)
+            except StopIteration as stop:
+                return stop.value
+    # Возвращаем функцию
+    return foo
+
+
+# То же, что DependsOnlyDescendantsListTreeFunctionBuilder, но функция
+# выдает пары (узел, результат) по мере готовности поддеревьев.
+# Корень выдается последним
+def DependsOnlyDescendantsListTreeGeneratorBuilder(
+    get_out_from_in: Callable[[IN], OUT],
+    get_in_from_leaf: Callable[[NODE], IN],
+    get_leaf_order: Callable[[NODE], 'Comp'],
+    get_out_from_ordered_out: Callable[[list[OUT]], OUT],
+    get_descendants_method: Callable[[NODE], list[NODE]],
+    save_out_method: Callable[[NODE, OUT], None] | None = None,
+    get_cached_method: Callable[[NODE], OUT | None] | None = None
+) -> Callable[[NODE], Iterator[tuple[NODE, OUT]]]:
+    def foo(node: NODE) -> Iterator[tuple[NODE, OUT]]:
+        return _post_order_tree_function_generator(
+            node,
+            get_out_from_in,
+            get_in_from_leaf,
+            get_leaf_order,
+            get_out_from_ordered_out,
+            get_descendants_method,
+            save_out_method,
+            get_cached_method
+        )
+    return foo
+
+# Вычисление результата листа. Вынесено на уровень модуля,
+# чтобы его можно было передать в пул процессов
+def _get_out_from_leaf(
+    get_out_from_in: Callable[[IN], OUT],
+    get_in_from_leaf: Callable[[NODE], IN],
+    node: NODE
+) -> OUT:
+    return get_out_from_in(get_in_from_leaf(node))
+
+
+# Узел, ожидающий результатов от потомков
+class _PendingNode(Generic[NODE, OUT]):
+    __slots__ = ('node', 'parent', 'index', 'outs', 'left')
+
+    def __init__(
+        self,
+        node: NODE,
+        parent: 'Optional[_PendingNode[NODE, OUT]]',
+        index: int,
+        descendants_count: int
+    ):
+        self.node = node
+        self.parent = parent
+        self.index = index
+        self.outs: list[Any] = [None] * descendants_count
+        self.left = descendants_count
+
+
+# Параллельный вариант DependsOnlyDescendantsListTreeFunctionBuilder.
+# Обход, кэш и объединение выполняются в вызывающем потоке,
+# в пул уходят только вычисления для листьев. Порядок результатов
+# потомков сохраняется, поэтому итог совпадает с последовательным
+def ParallelDependsOnlyDescendantsListTreeFunctionBuilder(
+    get_out_from_in: Callable[[IN], OUT],
+    get_in_from_leaf: Callable[[NODE], IN],
+    get_leaf_order: Callable[[NODE], 'Comp'],
+    get_out_from_ordered_out: Callable[[list[OUT]], OUT],
+    get_descendants_method: Callable[[NODE], list[NODE]],
+    save_out_method: Callable[[NODE, OUT], None] | None = None,
+    get_cached_method: Callable[[NODE], OUT | None] | None = None,
+    max_workers: int | None = None,
+    max_queue_depth: int | None = None,
+    executor_builder: Callable[[int | None], Executor] = ThreadPoolExecutor
 ) -> Callable[[NODE], OUT]:
     def none_cached(node: NODE):
         return None
-    
-    # Устанавливаем функцию кэша
+
+    def none_save(node: NODE, out: OUT):
+        return None
+
+    # Устанавливаем функции кэша и сохранения
     get_cached_method = get_cached_method or none_cached
-    
+    save_out_method = save_out_method or none_save
+    # Максимальное число листьев, отправленных в пул одновременно
+    if max_queue_depth is None:
+        max_queue_depth = 4 * (max_workers or os.cpu_count() or 1)
+    if max_queue_depth <= 0:
+        raise ValueError(f'Глубина очереди должна быть положительной! max_queue_depth={max_queue_depth}')
+
     def foo(node: NODE) -> OUT:
-        # Проверяем наличие кэша. Если есть, то возвращаем его
-        cached = get_cached_method(node)
-        if cached is not None:
-            return cached
-        # Получаем список потомков
-        descendants = get_descendants_method(node)
-        # Переменная для результата
-        out_res: OUT
-        if len(descendants) == 0:
-            # Если потомков нет, то считаем результат для текущего узла
-            out_res = get_out_from_in(get_in_from_leaf(node))
-        else:
-            # Если есть потомки, то сортируем их в нужно порядке
-            descendants.sort(key=get_leaf_order)
-            # Вычисляем выходное значение от каждого узла
-            out_results = [foo(desc) for desc in descendants]
-            # Вычисляем значения для текущего узла
-            out_res = get_out_from_ordered_out(out_results)
-        
-        # Если нужно сохранить, то сохраняем
-        if save_out_method is not None:
-            save_out_method(node, out_res)
-        return out_res
-    # Возвращаем функцию
-    return foo   
+        # Результат для корня
+        root_res: list[OUT] = []
+
+        # Передает результат узла родителю и поднимается вверх,
+        # пока у родителей готовы все потомки
+        def complete(parent: 'Optional[_PendingNode]', index: int, out: OUT):
+            while parent is not None:
+                parent.outs[index] = out
+                parent.left -= 1
+                if parent.left > 0:
+                    return
+                out = get_out_from_ordered_out(parent.outs)
+                save_out_method(parent.node, out)
+                index = parent.index
+                parent = parent.parent
+            root_res.append(out)
+
+        with executor_builder(max_workers) as executor:
+            in_work: dict[Future, tuple[NODE, Optional[_PendingNode], int]] = {}
+
+            def handle_done(done: Iterable[Future]):
+                for future in done:
+                    leaf, parent, index = in_work.pop(future)
+                    out = future.result()
+                    save_out_method(leaf, out)
+                    complete(parent, index, out)
+
+            stack: list[tuple[NODE, Optional[_PendingNode], int]] = [(node, None, 0)]
+            try:
+                while len(stack) > 0:
+                    cur_node, parent, index = stack.pop()
+                    # Проверяем наличие кэша
+                    cached = get_cached_method(cur_node)
+                    if cached is not None:
+                        complete(parent, index, cached)
+                        continue
+                    descendants = get_descendants_method(cur_node)
+                    if len(descendants) == 0:
+                        # Лист отправляем в пул
+                        future = executor.submit(
+                            _get_out_from_leaf, get_out_from_in, get_in_from_leaf, cur_node
+                        )
+                        in_work[future] = (cur_node, parent, index)
+                        # Ограничиваем число листьев в работе
+                        if len(in_work) >= max_queue_depth:
+                            done, _ = wait(in_work, return_when=FIRST_COMPLETED)
+                            handle_done(done)
+                        continue
+                    descendants.sort(key=get_leaf_order)
+                    pending = _PendingNode(cur_node, parent, index, len(descendants))
+                    for desc_index in range(len(descendants) - 1, -1, -1):
+                        stack.append((descendants[desc_index], pending, desc_index))
+                # Дожидаемся оставшихся листьев
+                while len(in_work) > 0:
+                    done, _ = wait(in_work, return_when=FIRST_COMPLETED)
+                    handle_done(done)
+            except BaseException:
+                for future in in_work:
+                    future.cancel()
+                raise
+
+        return root_res[0]
+
+    return foo
 
 IN_NODE = TypeVar('IN_NODE')
 OUT_NODE = TypeVar('OUT_NODE')
@@ -70,43 +265,37 @@ def copy_tree_with_node_tranform_function_builder(
     def foo(node: IN_NODE) -> OUT_NODE:
         # Корень результирующего дерева
         out_node_res = out_node_constructor_method(node)
-        # Обходим дерево в ширину
-        not_visited: deque[tuple[IN_NODE, OUT_NODE]] = deque(((node, out_node_res),))
-        while len(not_visited) > 0:
-            # Текущие узлы
-            in_node, out_node = not_visited.popleft()
-            # Узлы на уровень ниже
-            for low_in_node in in_node_leaves_method(in_node):
-                low_out_node = out_node_constructor_method(low_in_node)
+        # Пара (исходный узел, узел результирующего дерева): потомки
+        # пары создаются и привязываются к родителю при раскрытии
+        def get_children(pair: tuple[IN_NODE, OUT_NODE]) -> list[tuple[IN_NODE, OUT_NODE]]:
+            in_parent, out_parent = pair
+            res = []
+            for in_node in in_node_leaves_method(in_parent):
+                out_node = out_node_constructor_method(in_node)
                 # Связываем узлы результирующего дерева
-                add_out_node_method(out_node, low_out_node)
-                # Добавляем узлы в очередь
-                not_visited.append((low_in_node, low_out_node))
+                add_out_node_method(out_parent, out_node)
+                res.append((in_node, out_node))
+            return res
+
+        # Обходим дерево в ширину. Узел результирующего дерева идет
+        # вместе с исходным, поэтому память занимает только текущий уровень
+        for _ in iter_tree((node, out_node_res), get_children, TraversalOrder.BFS):
+            pass
 
         return out_node_res
 
     return foo
 
-# Можно переписать на итераторах        
+
 def bfs_tree_make_operation_function_builder(
     node_leaves_method: Callable[[NODE], Iterable[NODE]],
     operation_method: Callable[[NODE], None]
 ):
     def foo(node: NODE):
-        # Обходим дерево в ширину
-        not_visited: deque[NODE] = deque((node,))
-        while len(not_visited) > 0:
-            # Текущие узлы
-            nv_node = not_visited.popleft()
-            # Узлы на уровень ниже
-            for node_item in node_leaves_method(nv_node):
-                # Выполняем операцию над узлом
-                operation_method(node_item)
-                # Добавляем узлы в очередь
-                not_visited.append(node_item)
-
-    return foo        
-                
-        
-
+        # Обходим дерево в ширину, операция выполняется над всеми узлами, кроме корня
+        nodes = iter_tree(node, node_leaves_method, TraversalOrder.BFS)
+        next(nodes)
+        for node_item, _, _ in nodes:
+            operation_method(node_item)
 
+    return foo
@@ -0,0 +1,104 @@
+from collections.abc import Callable, Hashable
+from enum import Enum
+from typing import Generic, Iterator, Optional, TypeVar
+
+from domain.interfaces.tree import Tree
+
+NODE = TypeVar('NODE') # Тип узла
+
+
+class DiffKind(Enum):
+    ADDED = 0
+    REMOVED = 1
+    MODIFIED = 2
+    TYPE_CHANGED = 3
+    # Узел исходного дерева перемещен на место узла сравниваемого
+    MOVED = 4
+    # Добавлен только сам узел, его потомки идут отдельными записями
+    ADDED_WITHOUT_CHILDREN = 5
+
+
+class TreeDiffEntry(Generic[NODE]):
+    def __init__(
+        self,
+        kind: DiffKind,
+        src_node: Optional[NODE],
+        dst_node: Optional[NODE]
+    ):
+        self._kind = kind
+        self._src_node = src_node
+        self._dst_node = dst_node
+
+    @property
+    def kind(self):
+        return self._kind
+
+    # Узел исходного дерева (нет у ADDED)
+    @property
+    def src_node(self):
+        return self._src_node
+
+    # Узел сравниваемого дерева (нет у REMOVED)
+    @property
+    def dst_node(self):
+        return self._dst_node
+
+    def __repr__(self):
+        return f'TreeDiffEntry(kind={self._kind.name}, src_node={self._src_node}, dst_node={self._dst_node})'
+
+
+def default_node_key(node) -> Hashable:
+    return node.meta_info['rel_path']
+
+
+def default_node_hash(node) -> bytes:
+    return node.hash
+
+
+def default_node_type(node) -> Hashable:
+    return node.meta_info.get('type')
+
+
+# Сравнение двух деревьев по хэшам (дерево Меркла).
+# Поддеревья с одинаковым хэшем пропускаются целиком, поэтому
+# стоимость зависит от числа изменений, а не от размера дерева.
+# Для ADDED, REMOVED и TYPE_CHANGED выдается только корень поддерева,
+# MODIFIED выдается для узлов без потомков в обоих деревьях
+def merkle_tree_diff_function_builder(
+    get_node_key: Callable[[NODE], Hashable] = default_node_key,
+    get_node_hash: Callable[[NODE], bytes] = default_node_hash,
+    get_node_type: Callable[[NODE], Hashable] = default_node_type
+) -> Callable[[Tree[NODE], Tree[NODE]], Iterator[TreeDiffEntry[NODE]]]:
+    def foo(
+        src_tree: Tree[NODE],
+        dst_tree: Tree[NODE]
+    ) -> Iterator[TreeDiffEntry[NODE]]:
+        not_visited: list[tuple[NODE, NODE]] = [(src_tree.root(), dst_tree.root())]
+        while len(not_visited) > 0:
+            src_node, dst_node = not_visited.pop()
+            # Одинаковые поддеревья не обходим
+            if get_node_hash(src_node) == get_node_hash(dst_node):
+                continue
+            if get_node_type(src_node) != get_node_type(dst_node):
+                yield TreeDiffEntry(DiffKind.TYPE_CHANGED, src_node, dst_node)
+                continue
+            src_children = src_tree.get_children(src_node)
+            dst_children = dst_tree.get_children(dst_node)
+            if len(src_children) == 0 and len(dst_children) == 0:
+                yield TreeDiffEntry(DiffKind.MODIFIED, src_node, dst_node)
+                continue
+            # Сопоставляем потомков по ключу
+            dst_by_key = {get_node_key(child): child for child in dst_children}
+            pairs: list[tuple[NODE, NODE]] = []
+            for src_child in src_children:
+                dst_child = dst_by_key.pop(get_node_key(src_child), None)
+                if dst_child is None:
+                    yield TreeDiffEntry(DiffKind.REMOVED, src_child, None)
+                else:
+                    pairs.append((src_child, dst_child))
+            for dst_child in dst_by_key.values():
+                yield TreeDiffEntry(DiffKind.ADDED, None, dst_child)
+            # Сохраняем порядок обхода потомков
+            not_visited.extend(reversed(pairs))
+
+    return foo
@@ -0,0 +1,165 @@
+from collections.abc import Callable, Hashable
+from typing import Generic, Iterable, Iterator, Optional, TypeVar
+
+from domain.interfaces.tree import Tree
+from domain.shared.merkleTreeDiff import DiffKind, TreeDiffEntry, default_node_hash, default_node_key, default_node_type
+
+NODE = TypeVar('NODE') # Тип узла
+
+
+# Индекс хэш -> узлы. Строится по удаленным поддеревьям
+# и помнит связи с родителями, чтобы один и тот же контент
+# не был перемещен дважды (целиком и по частям)
+class ContentHashIndex(Generic[NODE]):
+    def __init__(
+        self,
+        get_node_key: Callable[[NODE], Hashable] = default_node_key,
+        get_node_hash: Callable[[NODE], bytes] = default_node_hash,
+        get_node_type: Callable[[NODE], Hashable] = default_node_type
+    ):
+        self._get_node_key = get_node_key
+        self._get_node_hash = get_node_hash
+        self._get_node_type = get_node_type
+        self._nodes_by_hash: dict[tuple[Hashable, bytes], list[NODE]] = {}
+        self._parent_keys: dict[Hashable, Optional[Hashable]] = {}
+        # Узлы, уже сопоставленные целиком
+        self._matched: set[Hashable] = set()
+        # Узлы, у которых сопоставлен кто-то из потомков
+        self._partially_matched: set[Hashable] = set()
+
+    def __len__(self):
+        return len(self._parent_keys)
+
+    def add(self, node: NODE, parent: Optional[NODE] = None):
+        key = self._get_node_key(node)
+        self._parent_keys[key] = None if parent is None else self._get_node_key(parent)
+        self._nodes_by_hash.setdefault(
+            (self._get_node_type(node), self._get_node_hash(node)), []
+        ).append(node)
+
+    # Добавляет узел и всех его потомков
+    def add_subtree(self, tree: Tree[NODE], node: NODE):
+        self.add(node)
+        not_visited: list[NODE] = [node]
+        while len(not_visited) > 0:
+            cur_node = not_visited.pop()
+            for child in tree.get_children(cur_node):
+                self.add(child, cur_node)
+                not_visited.append(child)
+
+    def is_matched(self, node: NODE) -> bool:
+        return self._get_node_key(node) in self._matched
+
+    def _is_free(self, key: Hashable) -> bool:
+        if key in self._partially_matched:
+            return False
+        cur_key: Optional[Hashable] = key
+        while cur_key is not None:
+            if cur_key in self._matched:
+                return False
+            cur_key = self._parent_keys.get(cur_key)
+        return True
+
+    # Возвращает узел с тем же типом и хэшем, не пересекающийся
+    # с уже сопоставленными, и помечает его
+    def pop_match(self, node: NODE) -> Optional[NODE]:
+        candidates = self._nodes_by_hash.get(
+            (self._get_node_type(node), self._get_node_hash(node))
+        )
+        if not candidates:
+            return None
+        while len(candidates) > 0:
+            candidate = candidates.pop()
+            key = self._get_node_key(candidate)
+            if not self._is_free(key):
+                continue
+            self._matched.add(key)
+            parent_key = self._parent_keys.get(key)
+            while parent_key is not None and parent_key not in self._partially_matched:
+                self._partially_matched.add(parent_key)
+                parent_key = self._parent_keys.get(parent_key)
+            return candidate
+        return None
+
+
+# Превращает пары удаление/добавление с одинаковым хэшем в перемещения.
+# Поддерево ищется сначала целиком, затем по частям вплоть до файлов.
+# Порядок выдачи: MODIFIED и TYPE_CHANGED по мере поступления, затем
+# добавления и перемещения (родитель раньше потомков), затем удаления.
+# Поэтому перемещения нужно применять до удалений
+def detect_moves_function_builder(
+    get_node_key: Callable[[NODE], Hashable] = default_node_key,
+    get_node_hash: Callable[[NODE], bytes] = default_node_hash,
+    get_node_type: Callable[[NODE], Hashable] = default_node_type
+) -> Callable[
+    [Tree[NODE], Tree[NODE], Iterable[TreeDiffEntry[NODE]]],
+    Iterator[TreeDiffEntry[NODE]]
+]:
+    def resolve_added(
+        dst_tree: Tree[NODE],
+        node: NODE,
+        index: ContentHashIndex[NODE]
+    ) -> list[TreeDiffEntry[NODE]]:
+        # Второй элемент: None, если узел еще не раскрыт,
+        # иначе число его потомков
+        stack: list[tuple[NODE, Optional[int]]] = [(node, None)]
+        results: list[list[TreeDiffEntry[NODE]]] = []
+        while len(stack) > 0:
+            cur_node, children_count = stack.pop()
+            if children_count is None:
+                match = index.pop_match(cur_node)
+                if match is not None:
+                    results.append([TreeDiffEntry(DiffKind.MOVED, match, cur_node)])
+                    continue
+                children = dst_tree.get_children(cur_node)
+                if len(children) == 0:
+                    results.append([TreeDiffEntry(DiffKind.ADDED, None, cur_node)])
+                    continue
+                stack.append((cur_node, len(children)))
+                stack.extend((child, None) for child in reversed(children))
+                continue
+            children_results = results[len(results) - children_count:]
+            del results[len(results) - children_count:]
+            # Если ничего не перемещено, добавляем поддерево целиком
+            if all(
+                len(entries) == 1 and entries[0].kind == DiffKind.ADDED
+                for entries in children_results
+            ):
+                results.append([TreeDiffEntry(DiffKind.ADDED, None, cur_node)])
+                continue
+            node_entries = [TreeDiffEntry(DiffKind.ADDED_WITHOUT_CHILDREN, None, cur_node)]
+            for entries in children_results:
+                node_entries.extend(entries)
+            results.append(node_entries)
+        return results[0]
+
+    def foo(
+        src_tree: Tree[NODE],
+        dst_tree: Tree[NODE],
+        entries: Iterable[TreeDiffEntry[NODE]]
+    ) -> Iterator[TreeDiffEntry[NODE]]:
+        removed: list[TreeDiffEntry[NODE]] = []
+        added: list[TreeDiffEntry[NODE]] = []
+        for entry in entries:
+            if entry.kind == DiffKind.REMOVED:
+                removed.append(entry)
+            elif entry.kind == DiffKind.ADDED:
+                added.append(entry)
+            else:
+                yield entry
+        # Без удалений перемещать нечего
+        if len(removed) == 0:
+            yield from added
+            return
+        index: ContentHashIndex[NODE] = ContentHashIndex(
+            get_node_key, get_node_hash, get_node_type
+        )
+        for entry in removed:
+            index.add_subtree(src_tree, entry.src_node)
+        for entry in added:
+            yield from resolve_added(dst_tree, entry.dst_node, index)
+        for entry in removed:
+            if not index.is_matched(entry.src_node):
+                yield entry
+
+    return foo
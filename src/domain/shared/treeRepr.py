@@ -0,0 +1,193 @@
+import io
+import json
+from enum import Enum
+from typing import TYPE_CHECKING, Any, Callable, Optional, TypeVar, Union
+
+from domain.shared.treeTraversal import TraversalOrder
+
+if TYPE_CHECKING:
+    from domain.interfaces.tree import Tree
+
+NODE = TypeVar('NODE') # Тип узла
+
+# Приемник вывода: текстовый или двоичный файл (сокет, канал и т.п.)
+Sink = Union[io.TextIOBase, io.RawIOBase, io.BufferedIOBase, Any]
+
+
+class TreeReprFormat(Enum):
+    # Узлы с отступами по глубине
+    TEXT = 0
+    # Одна JSON-запись на строку
+    NDJSON = 1
+    # Таблица: глубина, id, id родителя, хэш, путь
+    TSV = 2
+
+
+class TreeReprResult:
+    def __init__(self, nodes: int, size: int, truncated: bool):
+        self._nodes = nodes
+        self._size = size
+        self._truncated = truncated
+
+    # Число выведенных узлов
+    @property
+    def nodes(self):
+        return self._nodes
+
+    # Объем вывода в символах (для двоичного приемника - в байтах)
+    @property
+    def size(self):
+        return self._size
+
+    # Вывод остановлен по ограничению
+    @property
+    def truncated(self):
+        return self._truncated
+
+    def __repr__(self):
+        return f'TreeReprResult(nodes={self._nodes}, size={self._size}, truncated={self._truncated})'
+
+
+def _get_attr(node, name: str, default=None):
+    return getattr(node, name, default)
+
+
+# Запись узла для NDJSON и TSV: id, хэш и метаинформация, если они есть
+def default_node_record(node) -> dict[str, Any]:
+    record: dict[str, Any] = {}
+    id = _get_attr(node, 'id')
+    if id is not None:
+        record['id'] = id
+    hash = _get_attr(node, 'hash')
+    if isinstance(hash, (bytes, bytearray)):
+        record['hash'] = hash.hex()
+    meta_info = _get_attr(node, 'meta_info')
+    if meta_info is not None:
+        record['meta'] = dict(meta_info)
+    if len(record) == 0:
+        record['repr'] = repr(node)
+    return record
+
+
+def _json_default(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).hex()
+    return str(value)
+
+
+_TSV_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def _tsv_field(value) -> str:
+    if value is None:
+        return ''
+    return str(value).translate(_TSV_ESCAPES)
+
+
+def _is_text_sink(sink) -> bool:
+    if isinstance(sink, io.TextIOBase):
+        return True
+    if isinstance(sink, (io.RawIOBase, io.BufferedIOBase)):
+        return False
+    # Объекты без иерархии io: текстовые обычно знают кодировку
+    return hasattr(sink, 'encoding')
+
+
+# Пишет представление поддерева в приемник по мере обхода.
+# Строки копятся в буфере и сбрасываются по buffer_size символов,
+# поэтому память не зависит от размера дерева.
+# max_depth, max_nodes и max_size ограничивают вывод, max_size - в
+# символах (для двоичного приемника - в байтах)
+def write_tree_repr(
+    tree: 'Tree[NODE]',
+    node: NODE,
+    sink: Sink,
+    format: TreeReprFormat = TreeReprFormat.TEXT,
+    to_str_foo: Callable[[NODE], str] = repr,
+    indent: str = '  ',
+    max_depth: Optional[int] = None,
+    max_nodes: Optional[int] = None,
+    max_size: Optional[int] = None,
+    get_node_record: Callable[[NODE], dict[str, Any]] = default_node_record,
+    buffer_size: int = 1 << 16,
+    flush_sink: bool = True
+) -> TreeReprResult:
+    is_text = _is_text_sink(sink)
+    buffer: list[str] = []
+    buffered = 0
+    size = 0
+    nodes = 0
+    truncated = False
+
+    def write_buffer():
+        nonlocal buffered
+        if len(buffer) == 0:
+            return
+        data = ''.join(buffer)
+        sink.write(data if is_text else data.encode('utf-8', 'surrogateescape'))
+        buffer.clear()
+        buffered = 0
+        if flush_sink and hasattr(sink, 'flush'):
+            sink.flush()
+
+    def add_line(line: str) -> bool:
+        nonlocal buffered, size
+        line_size = len(line) if is_text else len(line.encode('utf-8', 'surrogateescape'))
+        if max_size is not None and size + line_size > max_size:
+            return False
+        buffer.append(line)
+        buffered += len(line)
+        size += line_size
+        if buffered >= buffer_size:
+            write_buffer()
+        return True
+
+    if format == TreeReprFormat.TSV:
+        add_line('depth\tid\tparent_id\thash\trel_path\n')
+    parent_ids: list[Any] = []
+    # Обход идет на уровень глубже max_depth, чтобы узнать, есть ли
+    # что-то за ограничением. После первого такого узла потомки
+    # узлов на глубине max_depth больше не запрашиваются
+    def prune(_: NODE, depth: int) -> bool:
+        return truncated and depth >= max_depth
+
+    nodes_iter = tree.iter_nodes(
+        node,
+        TraversalOrder.PRE_ORDER,
+        prune=None if max_depth is None else prune,
+        max_depth=None if max_depth is None else max_depth + 1
+    )
+    for cur_node, parent, depth in nodes_iter:
+        if max_depth is not None and depth > max_depth:
+            truncated = True
+            continue
+        if max_nodes is not None and nodes >= max_nodes:
+            truncated = True
+            break
+        if format == TreeReprFormat.TEXT:
+            line = indent * depth + to_str_foo(cur_node) + '\n'
+        else:
+            record = get_node_record(cur_node)
+            # id родителя берем из записей на пути к узлу
+            del parent_ids[depth:]
+            parent_id = parent_ids[depth - 1] if depth > 0 else None
+            parent_ids.append(record.get('id'))
+            if format == TreeReprFormat.NDJSON:
+                record = {'depth': depth, 'parent_id': parent_id, **record}
+                line = json.dumps(record, ensure_ascii=False, default=_json_default) + '\n'
+            elif format == TreeReprFormat.TSV:
+                line = '\t'.join((
+                    str(depth),
+                    _tsv_field(record.get('id')),
+                    _tsv_field(parent_id),
+                    _tsv_field(record.get('hash')),
+                    _tsv_field((record.get('meta') or {}).get('rel_path'))
+                )) + '\n'
+            else:
+                raise ValueError(f'Неизвестный формат! format={format}')
+        if not add_line(line):
+            truncated = True
+            break
+        nodes += 1
+    write_buffer()
+    return TreeReprResult(nodes, size, truncated)
@@ -0,0 +1,106 @@
+from collections import deque
+from enum import Enum
+from typing import Callable, Iterable, Iterator, Optional, Sequence, TypeVar
+
+NODE = TypeVar('NODE') # Тип узла
+
+
+class TraversalOrder(Enum):
+    # Родитель раньше потомков, в глубину
+    PRE_ORDER = 0
+    # Потомки раньше родителя, в глубину
+    POST_ORDER = 1
+    # По уровням
+    BFS = 2
+
+
+# Элемент обхода: (узел, родитель, глубина), у корня обхода родитель None
+TraversalItem = tuple[NODE, Optional[NODE], int]
+
+
+# Ленивый обход дерева. В памяти держится только путь до текущего
+# узла (или текущий уровень для BFS) со списками потомков.
+# prune(узел, глубина) = True - потомки узла не обходятся, max_depth -
+# наибольшая выдаваемая глубина (корень - 0). Потомки пропущенных
+# узлов не запрашиваются.
+# Если передан get_children_batch, потомки запрашиваются пачками по
+# batch_size узлов одного родителя: get_children_batch(узлы) -> списки потомков
+def iter_tree(
+    root: NODE,
+    get_children: Callable[[NODE], Iterable[NODE]],
+    order: TraversalOrder = TraversalOrder.PRE_ORDER,
+    prune: Optional[Callable[[NODE, int], bool]] = None,
+    max_depth: Optional[int] = None,
+    get_children_batch: Optional[Callable[[Sequence[NODE]], Sequence[Iterable[NODE]]]] = None,
+    batch_size: int = 64
+) -> Iterator[TraversalItem]:
+    if batch_size <= 0:
+        raise ValueError(f'Размер пачки должен быть положительным! batch_size={batch_size}')
+
+    def is_expandable(node: NODE, depth: int) -> bool:
+        if max_depth is not None and depth >= max_depth:
+            return False
+        return prune is None or not prune(node, depth)
+
+    # Узлы одного родителя вместе с их потомками (пустыми для
+    # нераскрываемых). Потомки запрашиваются по мере продвижения
+    def with_children(
+        nodes: Iterable[NODE],
+        parent: Optional[NODE],
+        depth: int
+    ) -> Iterator[tuple[NODE, Optional[NODE], int, Iterable[NODE]]]:
+        if get_children_batch is None:
+            for node in nodes:
+                children = get_children(node) if is_expandable(node, depth) else ()
+                yield node, parent, depth, children
+            return
+        batch: list[NODE] = []
+        nodes_iter = iter(nodes)
+        while True:
+            batch.clear()
+            for node in nodes_iter:
+                batch.append(node)
+                if len(batch) >= batch_size:
+                    break
+            if len(batch) == 0:
+                return
+            flags = [is_expandable(node, depth) for node in batch]
+            fetched = iter(get_children_batch([node for node, flag in zip(batch, flags) if flag]))
+            for node, flag in zip(batch, flags):
+                yield node, parent, depth, next(fetched) if flag else ()
+
+    if order == TraversalOrder.PRE_ORDER:
+        stack = [with_children((root,), None, 0)]
+        while len(stack) > 0:
+            try:
+                node, parent, depth, children = next(stack[-1])
+            except StopIteration:
+                stack.pop()
+                continue
+            yield node, parent, depth
+            if children:
+                stack.append(with_children(children, node, depth + 1))
+    elif order == TraversalOrder.POST_ORDER:
+        # Второй элемент - родитель списка, он выдается после потомков
+        post_stack: list[tuple[Iterator, Optional[TraversalItem]]] = [
+            (with_children((root,), None, 0), None)
+        ]
+        while len(post_stack) > 0:
+            children_iter, owner = post_stack[-1]
+            try:
+                node, parent, depth, children = next(children_iter)
+            except StopIteration:
+                post_stack.pop()
+                if owner is not None:
+                    yield owner
+                continue
+            post_stack.append((with_children(children, node, depth + 1), (node, parent, depth)))
+    elif order == TraversalOrder.BFS:
+        queue = deque((with_children((root,), None, 0),))
+        while len(queue) > 0:
+            for node, parent, depth, children in queue.popleft():
+                yield node, parent, depth
+                if children:
+                    queue.append(with_children(children, node, depth + 1))
+    else:
+        raise ValueError(f'Неизвестный порядок обхода! order={order}')
@@ -1,9 +1,28 @@
 from typing import Iterable, Type
-from domain.entities.contentHashProtocol import ContentHashProtocol
+from domain.entities.contentHashProtocol import BinaryStream, ContentHashProtocol
 from hashlib import blake2b
+import threading
 
 
 class Blake2ContentHashProtocol(ContentHashProtocol):
+    def __init__(self, chunk_size: int = 1 << 20):
+        if chunk_size <= 0:
+            raise ValueError(f'Размер куска должен быть положительным! chunk_size={chunk_size}')
+        self._chunk_size = chunk_size
+        # Буфер для чтения выделяется один раз на поток
+        self._local = threading.local()
+
+    # Буферы потоков не передаются в пул процессов,
+    # в новом процессе они создаются заново
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
     @classmethod
     def is_compitable_with(
         cls,
@@ -11,10 +30,45 @@ class Blake2ContentHashProtocol(ContentHashProtocol):
     ):
         return content_hash_protocol == Blake2ContentHashProtocol
 
+    @property
+    def chunk_size(self):
+        return self._chunk_size
+
     def get_hash_from_binary(self, data: bytes) ->  bytes:
         hash = blake2b(data, digest_size=32)
         return hash.digest()
 
+    def _get_buffer(self) -> memoryview:
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = memoryview(bytearray(self._chunk_size))
+            self._local.buffer = buffer
+        return buffer
+
+    def get_hash_from_stream(self, data: BinaryStream) -> bytes:
+        hash = blake2b(digest_size=32)
+        if isinstance(data, int):
+            # Файловый дескриптор читаем без буферизации и без его закрытия
+            with open(data, 'rb', buffering=0, closefd=False) as file:
+                self._update_from_reader(hash, file)
+        elif isinstance(data, (bytes, bytearray, memoryview)):
+            # Данные уже в памяти, хэшируем без копирования
+            hash.update(data)
+        elif hasattr(data, 'readinto'):
+            self._update_from_reader(hash, data)
+        else:
+            for chunk in data:
+                hash.update(chunk)
+        return hash.digest()
+
+    def _update_from_reader(self, hash, reader):
+        buffer = self._get_buffer()
+        while True:
+            read_count = reader.readinto(buffer)
+            if not read_count:
+                break
+            hash.update(buffer[:read_count])
+
     def get_hash_by_hash_lst(self, hash_lst: Iterable[bytes]) -> bytes:
         hash_lst = list(hash_lst)
         hash_lst.sort()
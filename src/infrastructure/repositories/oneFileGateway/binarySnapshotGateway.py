@@ -0,0 +1,704 @@
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import zlib
+from array import array
+from typing import TYPE_CHECKING, Any, BinaryIO, Iterator, Optional, Sequence
+
+from domain.entities.dataInfo import IdentifiedInfo, IdentifiedInfoWithParent
+from domain.interfaces.gateway import GatewayError, IdNotFoundError, ReadableTreeDataGateway
+from domain.shared.treeTraversal import TraversalOrder
+from infrastructure.repositories.oneFileGateway.gateway import OneFileGatewayError
+
+if TYPE_CHECKING:
+    from domain.entities.contentHashProtocol import ContentHashProtocol
+    from domain.entities.contentTransformationProtocol import DataTransformationProtocol
+    from domain.entities.dataInfo import DataInfo
+    from domain.entities.locationIdentifierProtocol import LocationProtocol
+    from domain.interfaces.tree import Tree
+
+
+class BinarySnapshotError(OneFileGatewayError):
+    ...
+
+
+SNAPSHOT_MAGIC = b'TREESNAP'
+SNAPSHOT_VERSION = 2
+
+# Ключ метаинформации, под которым шлюз отдает сохраненный хэш узла
+HASH_KEY = 'hash'
+
+NO_NODE = -1
+
+# Формат файла (все числа little-endian, разделы выровнены по 8 байт):
+# заголовок | записи узлов | индекс по id | смещения строк | строки | метаинформация
+#
+# Заголовок: magic, версия, размер заголовка, размер хэша, размер записи,
+# число узлов, смещение записей, вид индекса, флаги (0), смещение индекса,
+# число элементов индекса, смещение и число смещений строк, смещение и
+# длина строк, смещение и длина метаинформации, crc32 всего после
+# заголовка, crc32 заголовка
+_HEADER = struct.Struct('<8sIIIIqqIIqqqqqqqqII')
+
+# Запись узла фиксированной ширины, за ней - хэш размером digest_size.
+# Узлы идут в прямом порядке обхода, связи - индексы записей:
+# id, родитель, первый потомок, следующий брат, конец поддерева
+# (индекс за последним потомком), смещение и длина метаинформации,
+# глубина, флаги
+_RECORD = struct.Struct('<qqqqqqIII')
+_FIRST_CHILD_FIELD = 16
+_NEXT_SIBLING_FIELD = 24
+_SUBTREE_END_FIELD = 32
+_META_LEN_FIELD = 48
+_HAS_HASH = 1
+
+# Индекс по id: прямой массив индексов записей для плотных id
+# или отсортированные пары (id, индекс записи)
+_DIRECT_INDEX = 0
+_SORTED_INDEX = 1
+
+# Элемент метаинформации: индекс строки ключа, тег, значение
+_ENTRY_HEAD = struct.Struct('<IB')
+_INT64 = struct.Struct('<q')
+_U32 = struct.Struct('<I')
+_F64 = struct.Struct('<d')
+_QQ = struct.Struct('<qq')
+
+_TAG_NONE = 0
+_TAG_FALSE = 1
+_TAG_TRUE = 2
+_TAG_INT = 3
+_TAG_STR = 4
+# Строка листа - продолжение значения того же ключа у родителя
+# (rel_path). Строки узлов с потомками хранятся целиком, поэтому
+# значение собирается из двух частей без обхода цепочки предков
+_TAG_STR_SUFFIX = 5
+_TAG_FLOAT = 6
+_TAG_BYTES = 7
+# Целое вне int64, хранится десятичной строкой
+_TAG_BIG_INT = 8
+
+_INT_MIN = -(1 << 63)
+_INT_MAX = (1 << 63) - 1
+
+_COPY_CHUNK_SIZE = 1 << 20
+
+# Советы ядру по упреждающему чтению (есть не на всех платформах)
+_MADV_RANDOM = getattr(mmap, 'MADV_RANDOM', None)
+_MADV_SEQUENTIAL = getattr(mmap, 'MADV_SEQUENTIAL', None)
+_MADV_WILLNEED = getattr(mmap, 'MADV_WILLNEED', None)
+
+
+def _align(value: int) -> int:
+    return (value + 7) & ~7
+
+
+def _to_little_endian(values: array) -> array:
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values
+
+
+# Строки с дедупликацией при записи
+class _StringTableWriter:
+    def __init__(self):
+        self._data = bytearray()
+        self._offsets = array('q', [0])
+        self._lookup: dict[str, int] = {}
+
+    @property
+    def data(self):
+        return self._data
+
+    @property
+    def offsets(self):
+        return self._offsets
+
+    @property
+    def count(self):
+        return len(self._offsets) - 1
+
+    def intern(self, value: str) -> int:
+        idx = self._lookup.get(value)
+        if idx is None:
+            idx = len(self._offsets) - 1
+            self._data += value.encode('utf-8', 'surrogatepass')
+            self._offsets.append(len(self._data))
+            self._lookup[value] = idx
+        return idx
+
+
+# Записи узлов пишутся во временный файл через буфер последних
+# записей. Связи уже сброшенных записей исправляются через pwrite
+class _RecordsWriter:
+    def __init__(self, fd: int, record_size: int, buffer_records: int = 65536):
+        self._fd = fd
+        self._record_size = record_size
+        self._buffer_records = buffer_records
+        self._buffer = bytearray()
+        self._buffer_start = 0
+        self._count = 0
+
+    @property
+    def count(self):
+        return self._count
+
+    def append(self, record: bytes):
+        self._buffer += record
+        self._count += 1
+        if self._count - self._buffer_start >= self._buffer_records:
+            self.flush()
+
+    def patch(self, idx: int, field_offset: int, value: int, field: struct.Struct = _INT64):
+        if idx >= self._buffer_start:
+            field.pack_into(self._buffer, (idx - self._buffer_start) * self._record_size + field_offset, value)
+        else:
+            os.pwrite(self._fd, field.pack(value), idx * self._record_size + field_offset)
+
+    def flush(self):
+        view = memoryview(self._buffer)
+        offset = self._buffer_start * self._record_size
+        written = 0
+        while written < len(view):
+            written += os.pwrite(self._fd, view[written:], offset + written)
+        view.release()
+        self._buffer.clear()
+        self._buffer_start = self._count
+
+
+def _encode_meta(
+    meta_info,
+    parent_str_values: Optional[dict[str, str]],
+    strings: _StringTableWriter
+) -> tuple[bytes, dict[str, str]]:
+    res = bytearray()
+    str_values = {}
+    for key, value in meta_info.items():
+        key_idx = strings.intern(key)
+        if value is None:
+            res += _ENTRY_HEAD.pack(key_idx, _TAG_NONE)
+        elif value is True or value is False:
+            res += _ENTRY_HEAD.pack(key_idx, _TAG_TRUE if value else _TAG_FALSE)
+        elif isinstance(value, int):
+            if _INT_MIN <= value <= _INT_MAX:
+                res += _ENTRY_HEAD.pack(key_idx, _TAG_INT) + _INT64.pack(value)
+            else:
+                res += _ENTRY_HEAD.pack(key_idx, _TAG_BIG_INT) + _U32.pack(strings.intern(str(value)))
+        elif isinstance(value, str):
+            str_values[key] = value
+            parent_value = None if parent_str_values is None else parent_str_values.get(key)
+            if parent_value and value.startswith(parent_value):
+                res += _ENTRY_HEAD.pack(key_idx, _TAG_STR_SUFFIX) + _U32.pack(strings.intern(value[len(parent_value):]))
+            else:
+                res += _ENTRY_HEAD.pack(key_idx, _TAG_STR) + _U32.pack(strings.intern(value))
+        elif isinstance(value, float):
+            res += _ENTRY_HEAD.pack(key_idx, _TAG_FLOAT) + _F64.pack(value)
+        elif isinstance(value, (bytes, bytearray, memoryview)):
+            value = bytes(value)
+            res += _ENTRY_HEAD.pack(key_idx, _TAG_BYTES) + _U32.pack(len(value)) + value
+        else:
+            raise ValueError(f'Значение метаинформации не поддерживается форматом снимка! key={key}, type={type(value)}')
+    return bytes(res), str_values
+
+
+# Сохраняет поддерево узла (по умолчанию - все дерево) в файл снимка
+# за один обход. В памяти держатся только id узлов, таблица строк
+# и буфер последних записей, записи и метаинформация копятся во
+# временных файлах рядом с целевым. Файл заменяется атомарно.
+# digest_size по умолчанию берется из хэша корня. Возвращает число узлов
+def write_binary_snapshot(
+    abs_file_path: str,
+    tree: 'Tree[DataInfo]',
+    node: 'Optional[DataInfo]' = None,
+    digest_size: Optional[int] = None,
+    batch_size: Optional[int] = None
+) -> int:
+    root = tree.root() if node is None else node
+    if digest_size is None:
+        digest_size = 0 if root.hash is None else len(root.hash)
+    record_size = _align(_RECORD.size + digest_size)
+    empty_hash = bytes(record_size - _RECORD.size)
+    dir_path = os.path.dirname(abs_file_path) or '.'
+    ids = array('q')
+    strings = _StringTableWriter()
+    with tempfile.TemporaryFile(dir=dir_path) as records_file, \
+            tempfile.TemporaryFile(dir=dir_path) as meta_file:
+        records = _RecordsWriter(records_file.fileno(), record_size)
+        meta_len = 0
+        # Путь от корня: [индекс, последний потомок, строковые значения]
+        path: list[list] = []
+        # Метаинформация последнего узла пишется, когда станет известно,
+        # есть ли у него потомки: (глубина, метаинформация, элемент пути)
+        pending: Optional[tuple[int, Any, list]] = None
+
+        def write_pending_meta(has_children: bool):
+            nonlocal meta_len
+            pending_depth, meta_info, entry = pending
+            parent_str_values = None if has_children or pending_depth == 0 else path[pending_depth - 1][2]
+            meta, entry[2] = _encode_meta(meta_info, parent_str_values, strings)
+            records.patch(entry[0], _META_LEN_FIELD, len(meta), _U32)
+            meta_file.write(meta)
+            meta_len += len(meta)
+
+        for cur_node, _, depth in tree.iter_nodes(root, TraversalOrder.PRE_ORDER, batch_size=batch_size):
+            if pending is not None:
+                write_pending_meta(depth > pending[0])
+            idx = records.count
+            for finished in path[depth:]:
+                records.patch(finished[0], _SUBTREE_END_FIELD, idx)
+            del path[depth:]
+            parent = path[-1] if depth > 0 else None
+            if parent is not None:
+                if parent[1] == NO_NODE:
+                    records.patch(parent[0], _FIRST_CHILD_FIELD, idx)
+                else:
+                    records.patch(parent[1], _NEXT_SIBLING_FIELD, idx)
+                parent[1] = idx
+            hash = cur_node.hash
+            if hash is not None and len(hash) != digest_size:
+                raise ValueError(
+                    f'Размер хэша не совпадает с размером снимка! '
+                    f'len(hash)={len(hash)}, digest_size={digest_size}'
+                )
+            records.append(
+                _RECORD.pack(
+                    cur_node.id,
+                    NO_NODE if parent is None else parent[0],
+                    NO_NODE,
+                    NO_NODE,
+                    NO_NODE,
+                    meta_len,
+                    0,
+                    depth,
+                    0 if hash is None else _HAS_HASH
+                )
+                + (empty_hash if hash is None else hash + empty_hash[digest_size:])
+            )
+            ids.append(cur_node.id)
+            entry = [idx, NO_NODE, {}]
+            path.append(entry)
+            pending = (depth, cur_node.meta_info, entry)
+        if pending is not None:
+            write_pending_meta(False)
+        nodes_count = records.count
+        for finished in path:
+            records.patch(finished[0], _SUBTREE_END_FIELD, nodes_count)
+        records.flush()
+
+        index_kind, index = _build_id_index(ids)
+        del ids
+
+        # Уникальное имя: параллельные записи в один путь не мешают друг другу
+        fd, tmp_path = tempfile.mkstemp(
+            prefix=f'.{os.path.basename(abs_file_path)}.', suffix='.tmp', dir=dir_path
+        )
+        try:
+            os.fchmod(fd, 0o644)
+            with open(fd, 'wb') as f:
+                crc = 0
+                pos = _HEADER.size
+
+                def write(data) -> int:
+                    nonlocal crc, pos
+                    start = pos
+                    f.write(data)
+                    crc = zlib.crc32(data, crc)
+                    pos += len(data)
+                    return start
+
+                def write_padding():
+                    write(bytes(_align(pos) - pos))
+
+                def copy_file(src: BinaryIO) -> int:
+                    start = pos
+                    src.seek(0)
+                    while True:
+                        chunk = src.read(_COPY_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        write(chunk)
+                    write_padding()
+                    return start
+
+                f.write(bytes(_HEADER.size))
+                write_padding()
+                records_offset = copy_file(records_file)
+                index_offset = write(_to_little_endian(index).tobytes())
+                write_padding()
+                str_offsets_offset = write(_to_little_endian(strings.offsets).tobytes())
+                write_padding()
+                str_data_offset = write(strings.data)
+                write_padding()
+                meta_offset = copy_file(meta_file)
+                header = _HEADER.pack(
+                    SNAPSHOT_MAGIC,
+                    SNAPSHOT_VERSION,
+                    _HEADER.size,
+                    digest_size,
+                    record_size,
+                    nodes_count,
+                    records_offset,
+                    index_kind,
+                    0,
+                    index_offset,
+                    len(index) if index_kind == _DIRECT_INDEX else len(index) // 2,
+                    str_offsets_offset,
+                    strings.count,
+                    str_data_offset,
+                    len(strings.data),
+                    meta_offset,
+                    meta_len,
+                    crc,
+                    0
+                )
+                header = header[:-_U32.size] + _U32.pack(zlib.crc32(header[:-_U32.size]))
+                f.seek(0)
+                f.write(header)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, abs_file_path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+    # Переименование сохраняется только вместе с каталогом
+    dir_fd = os.open(dir_path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+    return nodes_count
+
+
+def _build_id_index(ids: array) -> tuple[int, array]:
+    n = len(ids)
+    if n > 0 and min(ids) >= 0 and max(ids) < 2 * n + 64:
+        index = array('q', [NO_NODE]) * (max(ids) + 1)
+        for idx, id in enumerate(ids):
+            index[id] = idx
+        return _DIRECT_INDEX, index
+    index = array('q')
+    for idx in sorted(range(n), key=ids.__getitem__):
+        index.append(ids[idx])
+        index.append(idx)
+    return _SORTED_INDEX, index
+
+
+# Шлюз чтения над файлом снимка. Файл отображается в память целиком,
+# открытие проверяет только заголовок и не зависит от размера дерева.
+# Записи разбираются при обращении, поэтому в память попадают только
+# затронутые страницы. Хэш узла отдается в метаинформации под ключом
+# HASH_KEY. Полная проверка контрольной суммы - verify
+class BinarySnapshotGateway(ReadableTreeDataGateway):
+    def __init__(
+        self,
+        abs_file_path: str,
+        hash_protocol: 'Optional[ContentHashProtocol]' = None,
+        location_protocol: 'Optional[LocationProtocol]' = None,
+        data_transformation_protocol: 'Optional[DataTransformationProtocol]' = None,
+        verify_checksum: bool = False
+    ):
+        self._abs_file_path = abs_file_path
+        self._hash_protocol = hash_protocol
+        self._location_protocol = location_protocol
+        self._data_transformation_protocol = data_transformation_protocol
+        self._verify_checksum = verify_checksum
+        self._mmap: Optional[mmap.mmap] = None
+        self._key_cache: dict[int, str] = {}
+
+    def __enter__(self) -> 'BinarySnapshotGateway':
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def open(self):
+        if self._mmap is not None:
+            return
+        with open(self._abs_file_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < _HEADER.size:
+                raise BinarySnapshotError(f'Файл снимка поврежден! path={self._abs_file_path}')
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._read_header(mm)
+        except BaseException:
+            mm.close()
+            raise
+        self._mmap = mm
+        # Поиск по индексу и переходы по связям читают отдельные
+        # страницы, поэтому упреждающее чтение по умолчанию отключено
+        self._advise(_MADV_RANDOM, 0, len(mm))
+        self._key_cache = {}
+        if self._verify_checksum and not self.verify():
+            self.close()
+            raise BinarySnapshotError(f'Контрольная сумма снимка не совпадает! path={self._abs_file_path}')
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def _read_header(self, mm: mmap.mmap):
+        (
+            magic, version, header_size, self._digest_size, self._record_size,
+            self._nodes_count, self._records_offset, self._index_kind, _,
+            self._index_offset, self._index_len, self._str_offsets_offset,
+            self._strings_count, self._str_data_offset, self._str_data_len,
+            self._meta_offset, self._meta_len, self._body_crc, header_crc
+        ) = _HEADER.unpack_from(mm, 0)
+        if magic != SNAPSHOT_MAGIC:
+            raise BinarySnapshotError(f'Файл не является снимком дерева! path={self._abs_file_path}')
+        if version != SNAPSHOT_VERSION:
+            raise BinarySnapshotError(f'Неподдерживаемая версия снимка! version={version}')
+        if zlib.crc32(mm[:_HEADER.size - _U32.size]) != header_crc or header_size != _HEADER.size:
+            raise BinarySnapshotError(f'Заголовок снимка поврежден! path={self._abs_file_path}')
+        index_entry_size = 8 if self._index_kind == _DIRECT_INDEX else 16
+        sections_end = max(
+            self._records_offset + self._nodes_count * self._record_size,
+            self._index_offset + self._index_len * index_entry_size,
+            self._str_offsets_offset + (self._strings_count + 1) * 8,
+            self._str_data_offset + self._str_data_len,
+            self._meta_offset + self._meta_len
+        )
+        if sections_end > len(mm) or self._record_size < _RECORD.size + self._digest_size:
+            raise BinarySnapshotError(f'Файл снимка поврежден! path={self._abs_file_path}')
+
+    # Совет ядру для диапазона файла, границы выравниваются по страницам.
+    # Без поддержки madvise ничего не делает
+    def _advise(self, advice: Optional[int], start: int, end: int):
+        mm = self._mmap
+        if advice is None or mm is None or not hasattr(mm, 'madvise'):
+            return
+        start -= start % mmap.PAGESIZE
+        end = min(end, len(mm))
+        if end > start:
+            mm.madvise(advice, start, end - start)
+
+    def _get_mmap(self) -> mmap.mmap:
+        if self._mmap is None:
+            raise GatewayError('Снимок не открыт!')
+        return self._mmap
+
+    # Проверяет контрольную сумму всего файла после заголовка.
+    # Файл читается подряд, поэтому на время проверки включается
+    # упреждающее чтение
+    def verify(self) -> bool:
+        mm = self._get_mmap()
+        self._advise(_MADV_SEQUENTIAL, 0, len(mm))
+        self._advise(_MADV_WILLNEED, 0, len(mm))
+        view = memoryview(mm)
+        try:
+            crc = 0
+            for start in range(_HEADER.size, len(mm), _COPY_CHUNK_SIZE):
+                crc = zlib.crc32(view[start:start + _COPY_CHUNK_SIZE], crc)
+        finally:
+            view.release()
+            self._advise(_MADV_RANDOM, 0, len(mm))
+        return crc == self._body_crc
+
+    @property
+    def nodes_count(self):
+        return self._nodes_count
+
+    @property
+    def digest_size(self):
+        return self._digest_size
+
+    def _get_index(self, id: int) -> int:
+        mm = self._get_mmap()
+        if self._index_kind == _DIRECT_INDEX:
+            if 0 <= id < self._index_len:
+                return _INT64.unpack_from(mm, self._index_offset + 8 * id)[0]
+            return NO_NODE
+        low, high = 0, self._index_len
+        while low < high:
+            mid = (low + high) // 2
+            mid_id, idx = _QQ.unpack_from(mm, self._index_offset + 16 * mid)
+            if mid_id == id:
+                return idx
+            if mid_id < id:
+                low = mid + 1
+            else:
+                high = mid
+        return NO_NODE
+
+    def _get_index_or_raise(self, id: int) -> int:
+        idx = self._get_index(id)
+        if idx == NO_NODE:
+            raise IdNotFoundError(f'Неизвестный идентификатор! id={id}')
+        return idx
+
+    def _read_record(self, idx: int) -> tuple:
+        return _RECORD.unpack_from(self._get_mmap(), self._records_offset + idx * self._record_size)
+
+    def _get_string(self, str_idx: int) -> str:
+        mm = self._get_mmap()
+        start, end = _QQ.unpack_from(mm, self._str_offsets_offset + 8 * str_idx)
+        return mm[self._str_data_offset + start:self._str_data_offset + end].decode('utf-8', 'surrogatepass')
+
+    def _get_key(self, str_idx: int) -> str:
+        key = self._key_cache.get(str_idx)
+        if key is None:
+            key = self._get_string(str_idx)
+            self._key_cache[str_idx] = key
+        return key
+
+    # Разбирает метаинформацию записи. only_key - индекс строки ключа,
+    # если нужно только одно строковое значение
+    def _decode_meta(self, record: tuple, only_key: Optional[int] = None, parent_of_suffix: bool = False) -> Any:
+        mm = self._get_mmap()
+        pos = self._meta_offset + record[5]
+        end = pos + record[6]
+        res = {}
+        while pos < end:
+            key_idx, tag = _ENTRY_HEAD.unpack_from(mm, pos)
+            pos += _ENTRY_HEAD.size
+            if tag == _TAG_NONE:
+                value = None
+            elif tag == _TAG_FALSE:
+                value = False
+            elif tag == _TAG_TRUE:
+                value = True
+            elif tag == _TAG_INT:
+                value = _INT64.unpack_from(mm, pos)[0]
+                pos += _INT64.size
+            elif tag in (_TAG_STR, _TAG_STR_SUFFIX, _TAG_BIG_INT):
+                str_idx = _U32.unpack_from(mm, pos)[0]
+                pos += _U32.size
+                if only_key is not None and key_idx != only_key:
+                    continue
+                if tag == _TAG_STR_SUFFIX and parent_of_suffix:
+                    # У родителя строка хранится целиком
+                    raise BinarySnapshotError(f'Файл снимка поврежден! path={self._abs_file_path}')
+                value = self._get_string(str_idx)
+                if tag == _TAG_STR_SUFFIX:
+                    value = self._decode_meta(self._read_record(record[1]), key_idx, True) + value
+                elif tag == _TAG_BIG_INT:
+                    value = int(value)
+            elif tag == _TAG_FLOAT:
+                value = _F64.unpack_from(mm, pos)[0]
+                pos += _F64.size
+            elif tag == _TAG_BYTES:
+                length = _U32.unpack_from(mm, pos)[0]
+                pos += _U32.size
+                value = mm[pos:pos + length]
+                pos += length
+            else:
+                raise BinarySnapshotError(f'Неизвестный тег метаинформации! tag={tag}')
+            if only_key is not None:
+                if key_idx == only_key:
+                    return value
+                continue
+            res[self._get_key(key_idx)] = value
+        if only_key is not None:
+            raise BinarySnapshotError('Значение родителя для строки не найдено!')
+        return res
+
+    def _build_info(self, idx: int, record: Optional[tuple] = None) -> dict[str, Any]:
+        if record is None:
+            record = self._read_record(idx)
+        info = self._decode_meta(record)
+        if record[8] & _HAS_HASH:
+            start = self._records_offset + idx * self._record_size + _RECORD.size
+            info[HASH_KEY] = self._get_mmap()[start:start + self._digest_size]
+        return info
+
+    def get_root(self) -> 'IdentifiedInfo':
+        if self._nodes_count == 0:
+            raise GatewayError('Снимок пуст!')
+        record = self._read_record(0)
+        return IdentifiedInfo(record[0], self._build_info(0, record))
+
+    def get_info_by_id(self, id: int) -> 'IdentifiedInfo':
+        idx = self._get_index_or_raise(id)
+        return IdentifiedInfo(id, self._build_info(idx))
+
+    def get_childs_info_by_id(self, id: int) -> 'Sequence[IdentifiedInfo]':
+        child = self._read_record(self._get_index_or_raise(id))[2]
+        res = []
+        while child != NO_NODE:
+            record = self._read_record(child)
+            res.append(IdentifiedInfo(record[0], self._build_info(child, record)))
+            child = record[3]
+        return res
+
+    # Поддерево - непрерывный диапазон записей, поэтому читается
+    # последовательно, без переходов по связям
+    def iter_subtree_info_by_id(
+        self,
+        id: int,
+        max_depth: 'Optional[int]' = None,
+        chunk_size: int = 1000
+    ) -> 'Iterator[Sequence[IdentifiedInfoWithParent]]':
+        root_idx = self._get_index_or_raise(id)
+        root_record = self._read_record(root_idx)
+        root_depth = root_record[7]
+        end = root_record[4]
+        if max_depth is not None:
+            # Ограниченный обход перескакивает через поддеревья
+            yield from self._iter_records_range(root_idx, root_depth, end, max_depth, chunk_size)
+            return
+        # Записи и метаинформация поддерева лежат подряд и читаются
+        # целиком: на время обхода включаем для них упреждающее чтение
+        last_record = self._read_record(end - 1)
+        ranges = (
+            (
+                self._records_offset + root_idx * self._record_size,
+                self._records_offset + end * self._record_size
+            ),
+            (
+                self._meta_offset + root_record[5],
+                self._meta_offset + last_record[5] + last_record[6]
+            )
+        )
+        for start, stop in ranges:
+            self._advise(_MADV_SEQUENTIAL, start, stop)
+            self._advise(_MADV_WILLNEED, start, stop)
+        try:
+            yield from self._iter_records_range(root_idx, root_depth, end, None, chunk_size)
+        finally:
+            for start, stop in ranges:
+                self._advise(_MADV_RANDOM, start, stop)
+
+    def _iter_records_range(
+        self,
+        root_idx: int,
+        root_depth: int,
+        end: int,
+        max_depth: 'Optional[int]',
+        chunk_size: int
+    ) -> 'Iterator[Sequence[IdentifiedInfoWithParent]]':
+        chunk = []
+        idx = root_idx
+        while idx < end:
+            record = self._read_record(idx)
+            depth = record[7] - root_depth
+            parent_id = None if idx == root_idx else _INT64.unpack_from(
+                self._get_mmap(), self._records_offset + record[1] * self._record_size
+            )[0]
+            chunk.append(IdentifiedInfoWithParent(record[0], self._build_info(idx, record), parent_id, depth))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+            # Потомки глубже max_depth пропускаются целым диапазоном
+            idx = record[4] if max_depth is not None and depth >= max_depth else idx + 1
+        if len(chunk) > 0:
+            yield chunk
+
+    def get_binary_data_by_id(self, id: int):
+        raise GatewayError('Снимок не хранит содержимое файлов!')
+
+    def get_hash_protocol(self) -> 'ContentHashProtocol':
+        return self._hash_protocol
+
+    def get_location_protocol(self) -> 'LocationProtocol':
+        return self._location_protocol
+
+    def get_data_transformation_protocol(self) -> 'DataTransformationProtocol':
+        return self._data_transformation_protocol
@@ -0,0 +1,236 @@
+import abc
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from enum import Enum
+from typing import Callable, Optional
+
+
+_logger = logging.getLogger(__name__)
+
+
+class WatcherError(Exception):
+    ...
+
+
+class WatchEventKind(Enum):
+    # Запись каталога появилась (создана или перемещена внутрь)
+    CREATED = 0
+    # Запись каталога исчезла (удалена или перемещена наружу)
+    DELETED = 1
+    # Изменилось содержимое или атрибуты записи
+    MODIFIED = 2
+    # Наблюдение за каталогом снято (каталог удален)
+    UNWATCHED = 3
+    # События потеряны, все наблюдаемое нужно перечитать
+    OVERFLOW = 4
+
+
+class WatchEvent:
+    def __init__(self, key: int, name: str, kind: WatchEventKind):
+        self._key = key
+        self._name = name
+        self._kind = kind
+
+    # Ключ, с которым каталог поставлен на наблюдение
+    @property
+    def key(self):
+        return self._key
+
+    # Имя записи внутри каталога ('' - сам каталог)
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def kind(self):
+        return self._kind
+
+    def __eq__(self, other):
+        if not isinstance(other, WatchEvent):
+            return NotImplemented
+        return (self._key, self._name, self._kind) == (other._key, other._name, other._kind)
+
+    def __hash__(self):
+        return hash((self._key, self._name, self._kind))
+
+    def __repr__(self):
+        return f'WatchEvent(key={self._key}, name={self._name!r}, kind={self._kind.name})'
+
+
+# Наблюдение за каталогами. События копятся и передаются
+# обработчику пачками без повторов
+class DirectoryWatcher(abc.ABC):
+    @abc.abstractmethod
+    def start(self, callback: Callable[[list[WatchEvent]], None]):
+        ...
+
+    @abc.abstractmethod
+    def watch(self, key: int, abs_path: str):
+        ...
+
+    @abc.abstractmethod
+    def unwatch(self, key: int):
+        ...
+
+    @abc.abstractmethod
+    def stop(self):
+        ...
+
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+# Наблюдение через inotify (Linux), вызовы libc через ctypes.
+# Чтение событий идет в отдельном потоке, пачка отдается
+# обработчику не чаще раза в batch_interval секунд
+class InotifyDirectoryWatcher(DirectoryWatcher):
+    WATCH_MASK = (
+        IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM
+        | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+    )
+
+    def __init__(self, batch_interval: float = 0.2):
+        if not sys.platform.startswith('linux'):
+            raise WatcherError('inotify доступен только в Linux!')
+        self._batch_interval = batch_interval
+        libc_name = ctypes.util.find_library('c') or 'libc.so.6'
+        try:
+            self._libc = ctypes.CDLL(libc_name, use_errno=True)
+            self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            self._libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        except (OSError, AttributeError) as e:
+            raise WatcherError(e)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise WatcherError(os.strerror(ctypes.get_errno()))
+        # Канал для пробуждения потока при остановке
+        self._wake_r, self._wake_w = os.pipe()
+        self._lock = threading.Lock()
+        self._key_by_wd: dict[int, int] = {}
+        self._wd_by_key: dict[int, int] = {}
+        self._callback: Optional[Callable[[list[WatchEvent]], None]] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+
+    def start(self, callback: Callable[[list[WatchEvent]], None]):
+        if self._thread is not None:
+            raise WatcherError('Наблюдение уже запущено!')
+        self._callback = callback
+        self._thread = threading.Thread(target=self._run, name='inotify-watcher', daemon=True)
+        self._thread.start()
+
+    def watch(self, key: int, abs_path: str):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(abs_path), self.WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOTDIR:
+                raise NotADirectoryError(err, os.strerror(err), abs_path)
+            if err == errno.ENOENT:
+                raise FileNotFoundError(err, os.strerror(err), abs_path)
+            if err == errno.ENOSPC:
+                raise WatcherError(
+                    'Превышен лимит наблюдений, увеличьте fs.inotify.max_user_watches!'
+                )
+            raise WatcherError(f'{os.strerror(err)} abs_path={abs_path}')
+        with self._lock:
+            self._key_by_wd[wd] = key
+            self._wd_by_key[key] = wd
+
+    def unwatch(self, key: int):
+        with self._lock:
+            wd = self._wd_by_key.pop(key, None)
+            if wd is None:
+                return
+            self._key_by_wd.pop(wd, None)
+        self._libc.inotify_rm_watch(self._fd, wd)
+
+    def stop(self):
+        if self._stopped:
+            return
+        self._stopped = True
+        os.write(self._wake_w, b'\0')
+        if self._thread is not None:
+            self._thread.join()
+        os.close(self._fd)
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+
+    def _parse(self, data: bytes, batch: dict[WatchEvent, None]):
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, name_len = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + name_len].rstrip(b'\0'))
+            offset += name_len
+            if mask & IN_Q_OVERFLOW:
+                batch[WatchEvent(-1, '', WatchEventKind.OVERFLOW)] = None
+                continue
+            with self._lock:
+                key = self._key_by_wd.get(wd)
+                if mask & IN_IGNORED:
+                    self._key_by_wd.pop(wd, None)
+                    if key is not None:
+                        self._wd_by_key.pop(key, None)
+            if key is None:
+                continue
+            if mask & IN_IGNORED:
+                kind = WatchEventKind.UNWATCHED
+            elif mask & (IN_CREATE | IN_MOVED_TO):
+                kind = WatchEventKind.CREATED
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                kind = WatchEventKind.DELETED
+            else:
+                kind = WatchEventKind.MODIFIED
+            batch[WatchEvent(key, name, kind)] = None
+
+    def _run(self):
+        # Словарь сохраняет порядок событий и убирает повторы
+        batch: dict[WatchEvent, None] = {}
+        batch_start = 0.0
+        while not self._stopped:
+            timeout = None
+            if len(batch) > 0:
+                timeout = max(0.0, batch_start + self._batch_interval - time.monotonic())
+            readable, _, _ = select.select([self._fd, self._wake_r], [], [], timeout)
+            if self._fd in readable:
+                try:
+                    data = os.read(self._fd, 1 << 16)
+                except BlockingIOError:
+                    data = b''
+                if len(batch) == 0:
+                    batch_start = time.monotonic()
+                self._parse(data, batch)
+            if len(batch) > 0 and time.monotonic() - batch_start >= self._batch_interval:
+                events = list(batch)
+                batch = {}
+                if self._callback is not None:
+                    try:
+                        self._callback(events)
+                    except Exception:
+                        # Поток наблюдения не должен завершаться: события
+                        # пачки потеряны, поэтому следующая пачка сообщает
+                        # о переполнении и все наблюдаемое перечитывается
+                        _logger.exception('Ошибка обработки событий наблюдения')
+                        batch[WatchEvent(-1, '', WatchEventKind.OVERFLOW)] = None
+                        batch_start = time.monotonic()
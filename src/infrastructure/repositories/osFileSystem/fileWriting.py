@@ -0,0 +1,202 @@
+import ctypes
+import ctypes.util
+import errno
+import io
+import os
+import stat
+import sys
+import threading
+from typing import Any, Callable, Optional
+
+
+# Ошибки, при которых системный вызов копирования не подходит
+# для пары файлов и нужно пробовать следующий способ
+_COPY_FALLBACK_ERRNOS = {
+    errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP,
+    errno.EBADF, errno.ETXTBSY, errno.EPERM
+}
+
+
+def _get_source_fd(data: Any) -> Optional[int]:
+    try:
+        fd = data.fileno()
+    except (AttributeError, io.UnsupportedOperation, ValueError):
+        return None
+    # Только обычные файлы: у каналов и сокетов нет размера
+    try:
+        if not stat.S_ISREG(os.fstat(fd).st_mode):
+            return None
+    except OSError:
+        return None
+    return fd
+
+
+def _copy_by_kernel(src_fd: int, dst_fd: int, offset: int, count: int) -> int:
+    copied = 0
+    copy_file_range = getattr(os, 'copy_file_range', None)
+    if copy_file_range is not None:
+        try:
+            while copied < count:
+                n = copy_file_range(src_fd, dst_fd, count - copied, offset + copied)
+                if n == 0:
+                    break
+                copied += n
+            return copied
+        except OSError as e:
+            if e.errno not in _COPY_FALLBACK_ERRNOS or copied > 0:
+                raise
+    sendfile = getattr(os, 'sendfile', None)
+    if sendfile is not None:
+        try:
+            while copied < count:
+                n = sendfile(dst_fd, src_fd, offset + copied, count - copied)
+                if n == 0:
+                    break
+                copied += n
+            return copied
+        except OSError as e:
+            if e.errno not in _COPY_FALLBACK_ERRNOS or copied > 0:
+                raise
+    return -1
+
+
+# Копирует данные в открытый файл. Если источник - обычный файл,
+# копирование идет в ядре (copy_file_range, затем sendfile) без
+# передачи данных через Python, иначе - через один буфер.
+# Позиция источника не меняется. Возвращает число байт
+def copy_data_to_fd(data: Any, dst_fd: int, chunk_size: int = 1 << 20) -> int:
+    src_fd = _get_source_fd(data)
+    if src_fd is not None:
+        offset = data.tell()
+        count = os.fstat(src_fd).st_size - offset
+        copied = _copy_by_kernel(src_fd, dst_fd, offset, count)
+        if copied >= 0:
+            return copied
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    copied = 0
+    readinto = getattr(data, 'readinto', None)
+    while True:
+        if readinto is not None:
+            n = readinto(buffer)
+            chunk = view[:n or 0]
+        else:
+            chunk = memoryview(data.read(chunk_size))
+            n = len(chunk)
+        if not n:
+            break
+        written = 0
+        while written < n:
+            written += os.write(dst_fd, chunk[written:])
+        copied += n
+    return copied
+
+
+def _load_syncfs():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        syncfs = libc.syncfs
+    except (OSError, AttributeError):
+        return None
+    syncfs.argtypes = [ctypes.c_int]
+    return syncfs
+
+
+_syncfs = _load_syncfs()
+
+
+# Отложенная синхронизация записей. Новые файлы пишутся во временные
+# файлы, а переименование откладывается до сброса пачки: сначала один
+# syncfs на все данные пачки (без него - fsync каждого временного
+# файла), затем переименования, затем по одному fsync на каждый
+# затронутый каталог. Поэтому существующий файл заменяется только
+# уже сохраненными на диск данными. До flush новые файлы лежат
+# под временными именами, а удаления и новые каталоги могут не
+# пережить сбой питания
+class FsyncBatch:
+    def __init__(self, abs_root_path: str, batch_size: int = 1000):
+        self._abs_root_path = abs_root_path
+        self._batch_size = batch_size
+        self._lock = threading.Lock()
+        self._dirs: set[str] = set()
+        # (временный файл, итоговый путь) в порядке записи
+        self._replaces: list[tuple[str, str]] = []
+        self._pending = 0
+        self._flushes = 0
+
+    # Число выполненных сбросов
+    @property
+    def flushes(self):
+        return self._flushes
+
+    # Отмечает изменение в каталоге. Возвращает True,
+    # если пачка заполнена и ее пора сбросить
+    def add(self, abs_dir_path: str) -> bool:
+        with self._lock:
+            self._dirs.add(abs_dir_path)
+            self._pending += 1
+            return self._pending >= self._batch_size
+
+    # Откладывает замену abs_path записанным временным файлом до flush
+    def add_replace(self, tmp_path: str, abs_path: str) -> bool:
+        with self._lock:
+            self._replaces.append((tmp_path, abs_path))
+            self._dirs.add(os.path.dirname(abs_path))
+            self._pending += 1
+            return self._pending >= self._batch_size
+
+    # on_replaced(временный файл, итоговый путь) вызывается после
+    # каждого переименования
+    def flush(self, on_replaced: Optional[Callable[[str, str], None]] = None):
+        with self._lock:
+            if self._pending == 0:
+                return
+            dirs = self._dirs
+            replaces = self._replaces
+            self._dirs = set()
+            self._replaces = []
+            self._pending = 0
+        self._sync_data([tmp_path for tmp_path, _ in replaces])
+        for tmp_path, abs_path in replaces:
+            try:
+                os.replace(tmp_path, abs_path)
+            except FileNotFoundError:
+                # Файл или каталог удален в той же пачке
+                continue
+            if on_replaced is not None:
+                on_replaced(tmp_path, abs_path)
+        for abs_dir_path in sorted(dirs):
+            try:
+                fd = os.open(abs_dir_path, os.O_RDONLY | os.O_DIRECTORY)
+            except FileNotFoundError:
+                # Каталог удален в той же пачке
+                continue
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        self._flushes += 1
+
+    def _sync_data(self, tmp_paths: list[str]):
+        if len(tmp_paths) == 0:
+            return
+        if _syncfs is not None:
+            fd = os.open(self._abs_root_path, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                if _syncfs(fd) == 0:
+                    return
+            finally:
+                os.close(fd)
+        # Без syncfs синхронизируем только файлы пачки,
+        # а не все файловые системы, как os.sync
+        for tmp_path in tmp_paths:
+            try:
+                fd = os.open(tmp_path, os.O_RDONLY | os.O_CLOEXEC)
+            except FileNotFoundError:
+                continue
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
@@ -1,46 +1,80 @@
 from enum import Enum
 from io import BufferedReader
-from pathlib import Path
-from typing import Any, Callable, ContextManager, Generic, Optional, Sequence, TypeVar
+from pathlib import Path, PurePosixPath
+from typing import Any, Callable, ContextManager, Generic, Iterable, Iterator, Mapping, Optional, Sequence, TypeVar
 from domain.entities.contentTransformationProtocol import DataTransformationProtocol
-from domain.entities.dataInfo import IdentifiedInfo
+from domain.entities.dataInfo import IdentifiedInfo, IdentifiedInfoWithParent
 from domain.entities.locationIdentifierProtocol import LocationProtocol
+from domain.shared.listTreeFunctionBuilder import DependsOnlyDescendantsListTreeFunctionBuilder
+from domain.shared.readOnlyDict import ReadOnlyDict
 from domain.interfaces.gateway import GatewayFactory, IdNotFoundError, ModifiableTreeDataGateway, ReadableTreeDataGateway, TreeDataGateway
-import itertools
+from concurrent.futures import Future, ThreadPoolExecutor
+import os
+import shutil
+import stat
 import threading
+import uuid
 
 from infrastructure.repositories.contentHashProtocol.blake2HashProtocol import Blake2ContentHashProtocol
 from infrastructure.repositories.contentTransformationProtocol.identityTransformation import IdentityTransformationProtocol
 from infrastructure.repositories.locationIdentifierProtocol.relPathLocationIdentifierProtocol import RelPathLocationIdentifierProtocol
+from infrastructure.repositories.osFileSystem.directoryWatcher import DirectoryWatcher, WatchEvent, WatchEventKind
+from infrastructure.repositories.osFileSystem.fileWriting import FsyncBatch, copy_data_to_fd
+from infrastructure.repositories.osFileSystem.mappedFile import MappedFileView
+from infrastructure.repositories.osFileSystem.nodeTable import CompactNodeTable, NodeTableSnapshot
+from infrastructure.repositories.osFileSystem.readWriteLock import LockStats, ReadWriteLock
+from infrastructure.repositories.osFileSystem.statHashCache import StatHashCache, default_cache_path
 
 
-# Пока что id-шки будут генерироваться динамически
-# Пока что будем всегда читать напрямую с диска
+# Имена временных файлов записи, ждущих сброса пачки
+_TMP_PREFIX = '.osgw-'
+_TMP_SUFFIX = '.tmp'
+
+# id-шки выдаются при первом чтении каталога и сохраняются
+# между запусками, если указан файл таблицы идентификаторов
 # TODO: подумать, как оповещать factory без прямой ссылки
 class OsGateway(TreeDataGateway):
-    ...
-
-
-class OsReadableGateway(ReadableTreeDataGateway, OsGateway):
     def __init__(
         self,
         os_gate_fact: 'OsGatewayFactory'
     ):
         self._os_gate_fact = os_gate_fact
+        # Без снимка чтение идет напрямую с диска
+        self._snapshot: Optional[NodeTableSnapshot] = None
 
     def get_root(self) -> IdentifiedInfo:
         root_id = self._os_gate_fact.root_id
-        return self._os_gate_fact.get_identified_info(root_id)
+        return self._os_gate_fact.get_identified_info(root_id, self._snapshot)
 
     def get_info_by_id(self, id: int) -> IdentifiedInfo:
-        return self._os_gate_fact.get_identified_info(id)
+        return self._os_gate_fact.get_identified_info(id, self._snapshot)
 
     def get_childs_info_by_id(self, id: int) -> Sequence[IdentifiedInfo]:
-        return self._os_gate_fact.get_childs_by_id(id)
+        return self._os_gate_fact.get_childs_by_id(id, self._snapshot)
+
+    def iter_subtree_info_by_id(
+        self,
+        id: int,
+        max_depth: Optional[int] = None,
+        chunk_size: int = 1000
+    ) -> Iterator[Sequence[IdentifiedInfoWithParent]]:
+        return self._os_gate_fact.iter_subtree_by_id(id, max_depth, chunk_size, self._snapshot)
 
     def get_binary_data_by_id(self, id: int) -> BufferedReader:
         return self._os_gate_fact.get_binary_by_id(id)
 
+    def get_binary_view_by_id(
+        self,
+        id: int,
+        offset: int = 0,
+        length: Optional[int] = None
+    ) -> ContextManager[memoryview]:
+        return self._os_gate_fact.get_binary_view_by_id(id, offset, length)
+
+    # Хэш файла или каталога (от хэшей потомков)
+    def get_hash_by_id(self, id: int) -> bytes:
+        return self._os_gate_fact.get_hash_by_id(id, self._snapshot)
+
     def get_hash_protocol(self):
         return self._os_gate_fact.get_hash_protocol()
 
@@ -51,8 +85,35 @@ class OsReadableGateway(ReadableTreeDataGateway, OsGateway):
         return self._os_gate_fact.get_trans_protocol()
 
 
-class OsModifiableGateway(ReadableTreeDataGateway, OsGateway):
-    ...
+# Внутри контекста чтец видит снимок таблицы идентификаторов
+# и метаинформации на момент входа и не мешает изменениям.
+# Содержимое файлов читается с диска
+class OsReadableGateway(ReadableTreeDataGateway, OsGateway):
+    def _open_snapshot(self):
+        self._snapshot = self._os_gate_fact.open_snapshot()
+
+    def _close_snapshot(self):
+        if self._snapshot is not None:
+            self._snapshot.close()
+            self._snapshot = None
+
+
+# Изменяющий шлюз читает напрямую с диска. Записанное
+# сбрасывается на диск пачками и при выходе из контекста
+class OsModifiableGateway(ModifiableTreeDataGateway, OsGateway):
+    def get_id_for_new_elem(self, id: int) -> int:
+        return self._os_gate_fact.get_id_for_new_elem(id)
+
+    def save_data_by_id(
+        self,
+        id: int,
+        data: 'Optional[BufferedReader]',
+        info: 'Optional[Mapping[str, Any]]' = None
+    ) -> bool:
+        return self._os_gate_fact.save_data_by_id(id, data, info)
+
+    def delete_by_id(self, id: int):
+        self._os_gate_fact.delete_by_id(id)
 
 
 class LockStateError(Exception):
@@ -70,16 +131,27 @@ class OsGatewayContextManager(ContextManager[T], Generic[T]):
     def __init__(
         self,
         gate: T,
-        update_method: 'Callable[[OsGatewayContextManager]]'
+        update_method: 'Callable[[OsGatewayContextManager]]',
+        timeout: Optional[float] = None
     ):
         self._gate = gate
         self._update_method = update_method
         self._gate_kls = gate.__class__
         self._tried_action = TriedAction.NO_ACTION
+        self._timeout = timeout
+
+    @property
+    def gate(self):
+        return self._gate
 
     @property
     def gate_kls(self):
         return self._gate_kls
+
+    # Сколько ждать доступа при входе (None - без ограничения)
+    @property
+    def timeout(self):
+        return self._timeout
     
     # Возвращает попытку действия
     @property
@@ -112,81 +184,82 @@ class ModifeingNotAllowedError(GatewayAccessError):
     ...
 
 
-class ReadWriteLock:
-    def __init__(self):
-        self._read_lock = threading.Lock()
-        self._write_lock = threading.Lock()
-        self._readers_count = 0
-
-    def acquire_read(self):
-        with self._read_lock:
-            self._readers_count += 1
-            if self._readers_count == 1:
-                self._write_lock.acquire()
-
-    def release_read(self):
-        with self._read_lock:
-            self._readers_count -= 1
-            if self._readers_count == 0:
-                self._write_lock.release()
-
-    def acquire_write(self):
-        self._write_lock.acquire()
-
-    def release_write(self):
-        self._write_lock.release()
-
-    @property
-    def read_locked(self):
-        return self._read_lock.locked()
-
-    @property
-    def write_locked(self):
-        return self._write_lock.locked()
-
-
-class PathWithChilds:
-    def __init__(
-        self,
-        path: Path,
-        childs: Optional[list[int]] = None
-    ):
-        self._childs = childs
-        self._path = path
-
-    @property
-    def childs(self) -> Optional[list[int]]:
-        return self._childs
-
-    @property
-    def path(self):
-        return self._path
-
-    @childs.setter
-    def childs(self, childs: list[int]):
-        self._childs = childs 
-
-
 class OsGatewayFactory(GatewayFactory):
     def __init__(
         self,
-        abs_root_dir_path: str
+        abs_root_dir_path: str,
+        prefetch_workers: int = 0,
+        max_prefetched: int = 256,
+        watcher: Optional[DirectoryWatcher] = None,
+        change_listener: Optional[Callable[[set[int]], None]] = None,
+        id_map_path: Optional[str] = None,
+        lock_timeout: Optional[float] = None,
+        fsync_batch_size: int = 1000,
+        meta_cache_size: int = 100000,
+        hash_cache: Optional[StatHashCache] = None
     ):
-        # TODO: оформить в отдельный класс
-        # Инициализация генератора идентификаторов для инициализации каталога
-        self._id_generator = itertools.count(start=0)
-        self._next_id = next(self._id_generator)
-        # Временно словарь с идентификаторами
-        self._path_id = {}
-        # Инициализация словаря с путями
-        self._id_path_dict: dict[int, PathWithChilds] = {}
-        # Инициализация корневого каталога
-        self._root_id = self._mark_path_with_id(
-            self._get_root_path_by_abs(abs_root_dir_path)
-        )
-        # Инициализация для доступа к чтению-изменению
+        # Абсолютный путь корневого каталога
+        self._root_path = self._get_root_path_by_abs(abs_root_dir_path)
+        self._root_path_str = str(self._root_path)
+        # Гарантия одних id при запуске: таблица идентификаторов
+        # загружается из файла и сохраняется в него при закрытии.
+        # Загруженные каталоги сверяются с диском при первом чтении
+        self._id_map_path = id_map_path
+        nodes = None
+        if id_map_path is not None:
+            nodes = CompactNodeTable.load(id_map_path, self._root_path_str)
+        # Таблица идентификаторов: id -> родитель, имя, потомки
+        if nodes is not None:
+            self._nodes = nodes
+            self._root_id = 0
+        else:
+            self._nodes = CompactNodeTable()
+            # Инициализация корневого каталога
+            self._root_id = self._nodes.add_root()
+        # Инициализация для доступа к чтению-изменению.
+        # lock_timeout - сколько по умолчанию ждать доступа на изменение,
+        # чтецы работают со снимками и доступа не ждут
         self._locker = ReadWriteLock()
+        self._lock_timeout = lock_timeout
         self._active_mngs: set[OsGatewayContextManager] = set()
+        # Упреждающее чтение каталогов (для NFS, FUSE и т.п.).
+        # В пуле только читаются каталоги, id выдаются при запросе потомков,
+        # поэтому они не зависят от порядка завершения чтений
+        self._prefetch_executor: Optional[ThreadPoolExecutor] = None
+        if prefetch_workers > 0:
+            self._prefetch_executor = ThreadPoolExecutor(prefetch_workers)
+        self._max_prefetched = max_prefetched
+        self._prefetched: dict[int, Future] = {}
+        self._prefetch_lock = threading.Lock()
+        # Наблюдение за изменениями: каталоги ставятся на наблюдение
+        # при первом чтении, измененные каталоги перечитываются при
+        # следующем запросе, а id измененных узлов передаются change_listener
+        self._watcher = watcher
+        self._change_listener = change_listener
+        self._watched: set[int] = set()
+        self._stale: set[int] = set()
+        self._watch_lock = threading.Lock()
+        if self._watcher is not None:
+            self._watcher.start(self._on_watch_events)
+        # Запись: id резервируются до сохранения данных (id -> родитель),
+        # fsync выполняется пачками по fsync_batch_size изменений
+        self._reserved: dict[int, int] = {}
+        self._reserved_lock = threading.Lock()
+        # Файлы, ждущие переименования при сбросе пачки:
+        # id -> (родитель, имя, временный файл)
+        self._pending_writes: dict[int, tuple[int, str, str]] = {}
+        self._pending_by_tmp: dict[str, int] = {}
+        self._fsync_batch = FsyncBatch(self._root_path_str, fsync_batch_size)
+        # Кэш метаинформации: id -> (stat, неизменяемый словарь).
+        # Словарь переиспользуется, пока stat узла не изменился.
+        # Порядок вставки - порядок использования, давние вытесняются
+        self._meta_cache: dict[int, tuple[tuple[int, int, int, bool], ReadOnlyDict]] = {}
+        self._meta_cache_size = meta_cache_size
+        # Кэш хэшей файлов по stat. Если не передан, при первом
+        # хэшировании открывается постоянный файл в каталоге состояния
+        self._hash_cache = hash_cache
+        self._owns_hash_cache = hash_cache is None
+        self._hash_cache_lock = threading.Lock()
         
         # TODO: можно сохранить в метаинформации
         # Назначаем hash-протокол
@@ -200,27 +273,32 @@ class OsGatewayFactory(GatewayFactory):
     def root_id(self):
         return self._root_id
 
+    # Счетчики ожидания и удержания доступа к шлюзам
     @property
-    def _root_path(self):
-        return self._id_path_dict[self._root_id].path
-    
+    def lock_stats(self) -> LockStats:
+        return self._locker.stats
+
+    # Чтецы работают со снимками и блокировку не берут,
+    # блокировка разделяет только изменяющие шлюзы
     def _manage_lock(self, gate_mng: 'OsGatewayContextManager'):
-        if gate_mng.tried_action == TriedAction.ENTER:
+        # tried_action сбрасывается при чтении, поэтому читаем один раз
+        tried_action = gate_mng.tried_action
+        if tried_action == TriedAction.ENTER:
             if issubclass(gate_mng.gate_kls, OsReadableGateway):
-                try:
-                    self._locker.acquire_read()
-                except RuntimeError as e:
-                    raise ReadingNotAllowedError(e)
+                gate_mng.gate._open_snapshot()
             elif issubclass(gate_mng.gate_kls, OsModifiableGateway):
-                try:
-                    self._locker.acquire_write()
-                except RuntimeError as e:
-                    raise ModifeingNotAllowedError(e)
-        elif gate_mng.tried_action == TriedAction.EXIT:
+                if not self._locker.acquire_write(gate_mng.timeout):
+                    raise ModifeingNotAllowedError(
+                        f'Не дождались доступа на изменение! timeout={gate_mng.timeout}'
+                    )
+        elif tried_action == TriedAction.EXIT:
             if issubclass(gate_mng.gate_kls, OsReadableGateway):
-                self._locker.release_read()
+                gate_mng.gate._close_snapshot()
             elif issubclass(gate_mng.gate_kls, OsModifiableGateway):
-                self._locker.release_write()
+                try:
+                    self.flush_writes()
+                finally:
+                    self._locker.release_write()
     
     # Возвращает абсолютный путь до корневого каталога
     def _get_root_path_by_abs(self, abs_root_dir_path: str):
@@ -237,98 +315,682 @@ class OsGatewayFactory(GatewayFactory):
             )
         return root_path
 
-    def _get_path_by_id(self, id: int):
-        return self._id_path_dict[id]
-    
-    # Вызывается для всякого пути
-    def _mark_path_with_id(self, path: Path) -> int:
-        cur_id = self._next_id
-        self._id_path_dict[cur_id] = PathWithChilds(path)
-        self._path_id[str(path)] = cur_id
-        self._next_id = next(self._id_generator)
-        return cur_id
+    # Полный путь собирается по таблице по требованию
+    # Несброшенный файл читается из временного файла
+    def _get_abs_path_by_id(self, id: int) -> str:
+        pending = self._pending_writes.get(id)
+        if pending is not None:
+            return pending[2]
+        return self._get_abs_path_by_rel_path(self._get_rel_path(id))
+
+    def _get_path_by_id(self, id: int) -> Path:
+        return Path(self._get_abs_path_by_id(id))
+
+    # Содержимое каталога: (имя, это каталог, stat), отсортировано по имени.
+    # Временные файлы записи в содержимое не входят
+    @staticmethod
+    def _scan_dir(abs_path: str) -> list[tuple[str, bool, os.stat_result]]:
+        listed: list[tuple[str, bool, os.stat_result]] = []
+        with os.scandir(abs_path) as entries:
+            for entry in entries:
+                if entry.name.startswith(_TMP_PREFIX) and entry.name.endswith(_TMP_SUFFIX):
+                    continue
+                is_dir = entry.is_dir()
+                if not (is_dir or entry.is_file()):
+                    raise Exception('В директории должны находиться только файлы и папки!')
+                listed.append((entry.name, is_dir, entry.stat()))
+        listed.sort(key=lambda item: item[0])
+        return listed
+
+    # Берет заранее прочитанное содержимое каталога или читает его
+    def _take_listing(
+        self,
+        id: int,
+        abs_path: str,
+        fresh: bool = False
+    ) -> list[tuple[str, bool, os.stat_result]]:
+        future = None
+        if self._prefetch_executor is not None:
+            with self._prefetch_lock:
+                future = self._prefetched.pop(id, None)
+        if future is not None and not fresh:
+            return future.result()
+        return self._scan_dir(abs_path)
+
+    # Наблюдение ставится до чтения каталога, чтобы не пропустить изменения
+    def _ensure_watched(self, id: int, abs_path: str):
+        if self._watcher is None or id in self._watched:
+            return
+        with self._watch_lock:
+            if id in self._watched:
+                return
+            self._watched.add(id)
+        try:
+            self._watcher.watch(id, abs_path)
+        except BaseException:
+            with self._watch_lock:
+                self._watched.discard(id)
+            raise
+
+    def _on_watch_events(self, events: list[WatchEvent]):
+        dirty: set[int] = set()
+        to_unwatch: list[int] = []
+        with self._watch_lock:
+            for event in events:
+                if event.kind == WatchEventKind.OVERFLOW:
+                    # События потеряны: перечитываем все наблюдаемое
+                    self._stale.update(self._watched)
+                    dirty.update(self._watched)
+                    continue
+                if event.kind == WatchEventKind.UNWATCHED:
+                    self._watched.discard(event.key)
+                    continue
+                if self._nodes.is_removed(event.key):
+                    # Каталог перемещен за пределы известного дерева
+                    self._watched.discard(event.key)
+                    to_unwatch.append(event.key)
+                    continue
+                if event.kind == WatchEventKind.MODIFIED and event.name:
+                    child_id = self._nodes.find_child_by_name(event.key, event.name)
+                    if child_id is not None:
+                        dirty.add(child_id)
+                        continue
+                # Изменился состав каталога
+                self._stale.add(event.key)
+                dirty.add(event.key)
+        for key in to_unwatch:
+            self._watcher.unwatch(key)
+        for id in dirty:
+            self._meta_cache.pop(id, None)
+        if len(dirty) > 0 and self._change_listener is not None:
+            self._change_listener(dirty)
+
+    def _pop_stale(self, id: int) -> bool:
+        if len(self._stale) == 0:
+            return False
+        with self._watch_lock:
+            if id in self._stale:
+                self._stale.discard(id)
+                return True
+        return False
+
+    # Ставит в очередь чтение каталогов, которые, вероятно, понадобятся следом
+    def _prefetch(self, dirs: Iterable[tuple[int, str]]):
+        if self._prefetch_executor is None:
+            return
+        with self._prefetch_lock:
+            for id, abs_path in dirs:
+                if len(self._prefetched) >= self._max_prefetched and not self._evict_prefetched():
+                    break
+                if id in self._prefetched or (
+                    self._nodes.get_children(id) is not None and self._nodes.is_verified(id)
+                ):
+                    continue
+                self._ensure_watched(id, abs_path)
+                self._prefetched[id] = self._prefetch_executor.submit(self._scan_dir, abs_path)
+
+    # Освобождает место от самого старого готового чтения, которое
+    # никто не забрал (обход пропустил ветку или прервался).
+    # Вызывается под _prefetch_lock. False - все чтения еще идут
+    def _evict_prefetched(self) -> bool:
+        for id, future in self._prefetched.items():
+            if future.done():
+                del self._prefetched[id]
+                return True
+        return False
+
+    # Сохраняет таблицу идентификаторов, чтобы следующий запуск
+    # выдал те же id без повторного обхода
+    def save_id_map(self, abs_file_path: Optional[str] = None):
+        if abs_file_path is None:
+            abs_file_path = self._id_map_path
+        if abs_file_path is None:
+            raise ValueError('Не указан файл для таблицы идентификаторов!')
+        self._nodes.save(abs_file_path, self._root_path_str)
+
+    def close(self):
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+        if self._prefetch_executor is not None:
+            self._prefetch_executor.shutdown(wait=True, cancel_futures=True)
+            self._prefetch_executor = None
+            self._prefetched.clear()
+        self.flush_writes()
+        if self._id_map_path is not None:
+            self.save_id_map()
+        if self._hash_cache is not None:
+            if self._owns_hash_cache:
+                self._hash_cache.close()
+                self._hash_cache = None
+            else:
+                self._hash_cache.flush()
+
+    def _get_abs_path_by_rel_path(self, rel_path: str) -> str:
+        if rel_path == '.':
+            return self._root_path_str
+        return os.path.join(self._root_path_str, rel_path)
 
     # Для выдачи новых путей используется только эта функция 
-    # Путь получает идентификатор, как только кто-то его нашел
-    def _get_childs_by_path(
+    # Путь получает идентификатор, как только кто-то его нашел.
+    # Тип и stat берутся из DirEntry, поэтому метаинформация потомков
+    # собирается за один проход без лишних системных вызовов.
+    # Если потомки уже получили id, то новые записи каталога пропускаются
+    # relist = True сверяет с диском и уже прочитанный каталог
+    def _get_childs_by_id(
         self,
-        path: Path,
-    ) -> list[tuple[Path, int]]:
-        self._is_good_path(path)
-        res: list[tuple[Path, int]] = []
-        if path.is_file():
-            return res
-        for item in path.iterdir():
-            id = self._mark_path_with_id(item)
-            res.append((item, id))
+        id: int,
+        rel_path: Optional[str] = None,
+        relist: bool = False
+    ) -> list[tuple[int, Mapping[str, Any]]]:
+        if rel_path is None:
+            rel_path = self._get_rel_path(id)
+        abs_path = self._get_abs_path_by_rel_path(rel_path)
+        is_stale = self._pop_stale(id)
+        # Каталог из сохраненной таблицы сверяем с диском
+        is_loaded = not self._nodes.is_verified(id)
+        try:
+            self._ensure_watched(id, abs_path)
+            listed = self._take_listing(id, abs_path, is_stale)
+        except NotADirectoryError:
+            self._nodes.set_children(id, ())
+            return []
+        if self._pending_writes:
+            listed = self._merge_pending_writes(id, listed)
+        if is_stale or is_loaded or relist:
+            # Каталог мог измениться: сохраняем id оставшихся записей
+            old_len = len(self._nodes)
+            old_childs = self._nodes.get_children(id)
+            old_count = 0 if old_childs is None else len(old_childs)
+            childs_ids = self._nodes.update_children(id, (name for name, _, _ in listed))
+            if is_loaded:
+                self._publish_changes_since_load(id, old_len, old_count, childs_ids, listed)
+        else:
+            childs_ids = self._nodes.set_children(id, (name for name, _, _ in listed))
+        if childs_ids is not None:
+            named_ids = zip(childs_ids, listed)
+        else:
+            # Потомки уже идентифицированы
+            id_by_name = {
+                self._nodes.get_name(child_id): child_id
+                for child_id in self._nodes.get_children(id) or ()
+            }
+            named_ids = (
+                (id_by_name[item[0]], item) for item in listed if item[0] in id_by_name
+            )
+        res: list[tuple[int, Mapping[str, Any]]] = []
+        dirs_to_prefetch: list[tuple[int, str]] = []
+        for child_id, (name, is_dir, st) in named_ids:
+            node_stat = (st.st_size, st.st_mtime_ns, st.st_ino, is_dir)
+            self._nodes.set_stat(child_id, *node_stat)
+            meta_info = self._get_cached_meta_info(child_id, node_stat, rel_path, name)
+            res.append((child_id, meta_info))
+            if is_dir and self._prefetch_executor is not None:
+                dirs_to_prefetch.append(
+                    (child_id, self._get_abs_path_by_rel_path(meta_info['rel_path']))
+                )
+        self._prefetch(dirs_to_prefetch)
         return res
 
+    # Записанные, но еще не переименованные файлы каталога
+    # подставляются под итоговыми именами
+    def _merge_pending_writes(
+        self,
+        id: int,
+        listed: list[tuple[str, bool, os.stat_result]]
+    ) -> list[tuple[str, bool, os.stat_result]]:
+        with self._reserved_lock:
+            pending = {
+                name: tmp_path
+                for parent_id, name, tmp_path in self._pending_writes.values()
+                if parent_id == id
+            }
+        if not pending:
+            return listed
+        merged = [item for item in listed if item[0] not in pending]
+        for name, tmp_path in pending.items():
+            try:
+                merged.append((name, False, os.stat(tmp_path)))
+            except FileNotFoundError:
+                # Уже переименован: берем итоговый файл из содержимого
+                merged.extend(item for item in listed if item[0] == name)
+        merged.sort(key=lambda item: item[0])
+        return merged
+
+    # Изменения, произошедшие пока процесс не работал: новые и
+    # удаленные записи каталога, записи с другим stat
+    def _publish_changes_since_load(
+        self,
+        id: int,
+        old_len: int,
+        old_count: int,
+        childs_ids: Sequence[int],
+        listed: list[tuple[str, bool, os.stat_result]]
+    ):
+        if self._change_listener is None:
+            return
+        dirty: set[int] = set()
+        new_count = 0
+        for child_id, (_, is_dir, st) in zip(childs_ids, listed):
+            if child_id >= old_len:
+                continue
+            new_count += 1
+            # У каталогов mtime меняется вместе с составом,
+            # состав проверяется при их собственном чтении
+            old_stat = self._nodes.get_stat(child_id)
+            if not is_dir and (old_stat is None or old_stat[:2] != (st.st_size, st.st_mtime_ns)):
+                dirty.add(child_id)
+        if new_count != len(childs_ids) or new_count != old_count:
+            dirty.add(id)
+        if len(dirty) > 0:
+            self._change_listener(dirty)
+
+    # Снимок таблицы для чтеца. stat корня обновляется
+    # при каждом открытии, остальные - при чтении каталогов
+    def open_snapshot(self) -> NodeTableSnapshot:
+        st = os.stat(self._root_path_str)
+        self._nodes.set_stat(self._root_id, st.st_size, st.st_mtime_ns, st.st_ino, True)
+        return self._nodes.open_snapshot()
+
+    # Метаинформация по снимку: stat берется из таблицы,
+    # с диска - только для еще не встречавшихся узлов
+    def _get_snapshot_meta_info(
+        self,
+        snapshot: NodeTableSnapshot,
+        id: int,
+        parent_rel_path: Optional[str] = None
+    ) -> Mapping[str, Any]:
+        node_stat = snapshot.get_stat(id)
+        if node_stat is None:
+            rel_path = self._get_rel_path(id, snapshot)
+            st = os.stat(self._get_abs_path_by_rel_path(rel_path))
+            node_stat = (st.st_size, st.st_mtime_ns, st.st_ino, stat.S_ISDIR(st.st_mode))
+            self._nodes.set_stat(id, *node_stat)
+        if parent_rel_path is None:
+            return self._get_cached_meta_info(id, node_stat, snapshot=snapshot)
+        return self._get_cached_meta_info(
+            id, node_stat, parent_rel_path, lambda: snapshot.get_name(id)
+        )
 
-    def _update_identified_info_by_id(self, id: int):
-        cpath = self._id_path_dict.get(id)
-        if not cpath:
-            raise IdNotFoundError('Неизвестный идентификатор!')
-        return IdentifiedInfo(
-            id,
-            self._get_meta_info_by_path(cpath.path)
+    # Нужно ли снимку прочитать каталог с диска. Без наблюдения
+    # каталог перечитывается при первом обращении снимка, с наблюдением -
+    # только измененный, еще не читавшийся или загруженный из файла
+    def _snapshot_needs_listing(self, snapshot: NodeTableSnapshot, id: int) -> bool:
+        if snapshot.is_dir_read(id) or self._nodes.is_removed(id):
+            return False
+        return (
+            self._watcher is None
+            or id in self._stale
+            or self._nodes.get_children(id) is None
+            or not self._nodes.is_verified(id)
         )
 
-    # TODO: если путь еще не посещен, то у него может не быть id-шника
-    # Для выдачи IdentifiedInfo по id (обновленного)
-    def get_identified_info(self, id) -> IdentifiedInfo:
-        return self._update_identified_info_by_id(id)
+    # Потомки по снимку. Каталог, прочитанный снимком, дальше
+    # выдается в том же виде (повторяемое чтение)
+    def _get_snapshot_childs_by_id(
+        self,
+        snapshot: NodeTableSnapshot,
+        id: int,
+        rel_path: Optional[str] = None
+    ) -> list[tuple[int, Mapping[str, Any]]]:
+        if rel_path is None:
+            rel_path = self._get_rel_path(id, snapshot)
+        if self._snapshot_needs_listing(snapshot, id):
+            # Без наблюдателя об изменениях неизвестно, поэтому
+            # прочитанный ранее каталог сверяется с диском заново
+            self._get_childs_by_id(id, rel_path, self._watcher is None)
+            snapshot.set_dir_version(id, self._nodes.next_version())
+        childs_ids = snapshot.get_children(id)
+        return [
+            (child_id, self._get_snapshot_meta_info(snapshot, child_id, rel_path))
+            for child_id in childs_ids or ()
+        ]
 
-    def get_childs_by_id(self, id: int) -> Sequence[IdentifiedInfo]:
-        cpath = self._id_path_dict.get(id)
-        if not cpath:
-            raise IdNotFoundError('Неизвестный идентификатор!')
-        if cpath.childs is None:
-            # Если пути не идентифицированы
-            res = []
-            childs_ids = []
-            for item, id in self._get_childs_by_path(cpath.path):
-                # print('ffff', item)
-                res.append(IdentifiedInfo(id, self._get_meta_info_by_path(item)))
-                childs_ids.append(id)
-            cpath.childs = childs_ids
+    # TODO: если путь еще не посещен, то у него может не быть id-шника
+    # Для выдачи IdentifiedInfo по id (обновленного или по снимку)
+    def get_identified_info(
+        self,
+        id: int,
+        snapshot: Optional[NodeTableSnapshot] = None
+    ) -> IdentifiedInfo:
+        if snapshot is not None:
+            return IdentifiedInfo(id, self._get_snapshot_meta_info(snapshot, id))
+        return IdentifiedInfo(id, self._get_meta_info_by_id(id))
+
+    def get_childs_by_id(
+        self,
+        id: int,
+        snapshot: Optional[NodeTableSnapshot] = None
+    ) -> Sequence[IdentifiedInfo]:
+        if snapshot is not None:
+            childs = self._get_snapshot_childs_by_id(snapshot, id)
         else:
-            # Если пути идентифицированы
-            res = [
-                IdentifiedInfo(
-                    id, self._get_meta_info_by_path(self._id_path_dict[id].path)
-                ) for id in cpath.childs
-            ]
-        return res
+            childs = self._get_childs_by_id(id)
+        return [
+            IdentifiedInfo(child_id, meta_info)
+            for child_id, meta_info in childs
+        ]
+
+    # Поддерево за один проход: один scandir на каталог,
+    # путь каталога берется из уже собранной метаинформации
+    def iter_subtree_by_id(
+        self,
+        id: int,
+        max_depth: Optional[int] = None,
+        chunk_size: int = 1000,
+        snapshot: Optional[NodeTableSnapshot] = None
+    ) -> Iterator[list[IdentifiedInfoWithParent]]:
+        if snapshot is not None:
+            root_info = self._get_snapshot_meta_info(snapshot, id)
+        else:
+            root_info = self._get_meta_info_by_id(id)
+        chunk = [IdentifiedInfoWithParent(id, root_info, None, 0)]
+        not_visited: list[tuple[int, str, int]] = []
+        if root_info['type'] == 'dir':
+            not_visited.append((id, root_info['rel_path'], 0))
+        while len(not_visited) > 0:
+            cur_id, rel_path, depth = not_visited.pop()
+            if max_depth is not None and depth >= max_depth:
+                continue
+            if snapshot is not None:
+                childs = self._get_snapshot_childs_by_id(snapshot, cur_id, rel_path)
+            else:
+                childs = self._get_childs_by_id(cur_id, rel_path)
+            for child_id, meta_info in childs:
+                chunk.append(IdentifiedInfoWithParent(child_id, meta_info, cur_id, depth + 1))
+                if meta_info['type'] == 'dir':
+                    not_visited.append((child_id, meta_info['rel_path'], depth + 1))
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+        if len(chunk) > 0:
+            yield chunk
      
-    def _is_good_path(self, path: Path):
-        if not (
-            path.is_file() 
-            or path.is_dir()
-        ):
-            raise Exception('В директории должны находиться только файлы и папки!')
-        return path
-
     def _check_readability(self) -> bool:
         return True
 
     def _check_modifiablility(self) -> bool:
         return True
  
-    def _get_meta_info_by_path(self, path: Path) -> dict[str, Any]:
+    @staticmethod
+    def _build_meta_info(
+        id: int,
+        rel_path: str,
+        is_dir: bool,
+        size: int,
+        mtime_ns: int,
+        inode: int
+    ) -> dict[str, Any]:
         return {
-            'hashOrderLocation': self._path_id[str(path)],
-            'rel_path': str(path.relative_to(self._root_path))
+            'hashOrderLocation': id,
+            'rel_path': rel_path,
+            'type': 'dir' if is_dir else 'file',
+            'size': size,
+            'mtime_ns': mtime_ns,
+            'inode': inode
         }
 
+    def _get_meta_info_by_id(self, id: int) -> Mapping[str, Any]:
+        st = os.stat(self._get_abs_path_by_id(id))
+        node_stat = (st.st_size, st.st_mtime_ns, st.st_ino, stat.S_ISDIR(st.st_mode))
+        return self._get_cached_meta_info(id, node_stat)
+
+    # Путь узла не меняется, поэтому берется из кэша метаинформации,
+    # затем из пути родителя в кэше, и только затем из таблицы
+    def _get_rel_path(self, id: int, snapshot: Optional[NodeTableSnapshot] = None) -> str:
+        nodes = self._nodes if snapshot is None else snapshot
+        cached = self._meta_cache.get(id)
+        if cached is not None:
+            # Узел должен быть виден
+            nodes.get_parent(id)
+            return cached[1]['rel_path']
+        parent_id = nodes.get_parent(id)
+        if parent_id is None:
+            return '.'
+        parent_cached = self._meta_cache.get(parent_id)
+        if parent_cached is None:
+            return nodes.get_rel_path(id)
+        parent_rel_path = parent_cached[1]['rel_path']
+        name = nodes.get_name(id)
+        return name if parent_rel_path == '.' else f'{parent_rel_path}/{name}'
+
+    # Общий неизменяемый словарь метаинформации. При промахе путь
+    # собирается из пути родителя и имени (name может быть функцией)
+    def _get_cached_meta_info(
+        self,
+        id: int,
+        node_stat: tuple[int, int, int, bool],
+        parent_rel_path: Optional[str] = None,
+        name: 'Optional[str | Callable[[], str]]' = None,
+        snapshot: Optional[NodeTableSnapshot] = None
+    ) -> Mapping[str, Any]:
+        cached = self._meta_cache.pop(id, None)
+        if cached is not None and cached[0] == node_stat:
+            meta_info = cached[1]
+        else:
+            if cached is not None:
+                rel_path = cached[1]['rel_path']
+            elif parent_rel_path is not None and name is not None:
+                if callable(name):
+                    name = name()
+                rel_path = name if parent_rel_path == '.' else f'{parent_rel_path}/{name}'
+            else:
+                rel_path = self._get_rel_path(id, snapshot)
+            size, mtime_ns, inode, is_dir = node_stat
+            meta_info = ReadOnlyDict(
+                self._build_meta_info(id, rel_path, is_dir, size, mtime_ns, inode)
+            )
+        self._meta_cache[id] = (node_stat, meta_info)
+        if len(self._meta_cache) > self._meta_cache_size:
+            try:
+                del self._meta_cache[next(iter(self._meta_cache))]
+            except (KeyError, RuntimeError, StopIteration):
+                # Запись уже вытеснена другим потоком
+                pass
+        return meta_info
+
     def get_binary_by_id(self, id: int):
-        cpath  = self._id_path_dict.get(id)
-        if not cpath:
+        return open(self._get_abs_path_by_id(id), 'rb')
+
+    # Диапазон файла через mmap, без копирования в Python
+    def get_binary_view_by_id(
+        self,
+        id: int,
+        offset: int = 0,
+        length: Optional[int] = None
+    ) -> MappedFileView:
+        return MappedFileView(self._get_abs_path_by_id(id), offset, length)
+
+    # Имя нового узла берется из его пути в исходном дереве
+    @staticmethod
+    def _get_name_from_info(info: 'Optional[Mapping[str, Any]]') -> str:
+        rel_path = None if info is None else info.get('rel_path')
+        if not rel_path or rel_path == '.':
+            raise ValueError(f'В метаинформации нет пути узла! info={info}')
+        name = PurePosixPath(rel_path).name
+        # Защита от выхода за пределы каталога
+        if name in ('', '.', '..') or os.sep in name:
+            raise ValueError(f'Недопустимое имя узла! rel_path={rel_path}')
+        return name
+
+    def get_id_for_new_elem(self, parent_id: int) -> int:
+        # Потомки родителя должны быть прочитаны, иначе
+        # при чтении каталога новый узел получит второй id
+        if self._nodes.get_children(parent_id) is None:
+            self._get_childs_by_id(parent_id)
+        id = self._nodes.reserve_id()
+        with self._reserved_lock:
+            self._reserved[id] = parent_id
+        return id
+
+    # Файл пишется во временный файл рядом. Переименование выполняет
+    # сброс пачки после синхронизации данных, поэтому ни читатели,
+    # ни сбой питания не оставляют недописанного файла под итоговым именем
+    @staticmethod
+    def _write_temp_file(
+        abs_dir_path: str,
+        data: 'BufferedReader'
+    ) -> tuple[str, os.stat_result]:
+        tmp_path = os.path.join(abs_dir_path, f'{_TMP_PREFIX}{uuid.uuid4().hex}{_TMP_SUFFIX}')
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_CLOEXEC, 0o644)
+        try:
+            try:
+                copy_data_to_fd(data, fd)
+                st = os.fstat(fd)
+            finally:
+                os.close(fd)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        return tmp_path, st
+
+    # Вызывается сбросом пачки для каждого отложенного переименования
+    def _on_replaced(self, tmp_path: str, abs_path: str):
+        with self._reserved_lock:
+            id = self._pending_by_tmp.pop(tmp_path, None)
+            if id is not None:
+                self._pending_writes.pop(id, None)
+
+    def _flush_batch(self):
+        self._fsync_batch.flush(self._on_replaced)
+
+    def save_data_by_id(
+        self,
+        id: int,
+        data: 'Optional[BufferedReader]',
+        info: 'Optional[Mapping[str, Any]]' = None
+    ) -> bool:
+        with self._reserved_lock:
+            parent_id = self._reserved.get(id)
+        if parent_id is None:
             raise IdNotFoundError('Неизвестный идентификатор!')
-        return cpath.path.open('rb')
+        name = self._get_name_from_info(info)
+        is_dir = info.get('type') == 'dir'
+        abs_dir_path = self._get_abs_path_by_id(parent_id)
+        abs_path = os.path.join(abs_dir_path, name)
+        if is_dir:
+            try:
+                os.mkdir(abs_path)
+            except FileExistsError:
+                if not os.path.isdir(abs_path):
+                    raise
+            st = os.stat(abs_path)
+        else:
+            if data is None:
+                raise ValueError('Нет данных для сохранения!')
+            tmp_path, st = self._write_temp_file(abs_dir_path, data)
+        self._nodes.commit_child(id, parent_id, name)
+        self._nodes.set_stat(id, st.st_size, st.st_mtime_ns, st.st_ino, is_dir)
+        with self._reserved_lock:
+            self._reserved.pop(id, None)
+            if not is_dir:
+                self._pending_writes[id] = (parent_id, name, tmp_path)
+                self._pending_by_tmp[tmp_path] = id
+        if is_dir:
+            is_full = self._fsync_batch.add(abs_dir_path)
+        else:
+            is_full = self._fsync_batch.add_replace(tmp_path, abs_path)
+        if is_full:
+            self._flush_batch()
+        return True
+
+    def delete_by_id(self, id: int):
+        if id == self._root_id:
+            raise ValueError('Корневой каталог удалить нельзя!')
+        # Отложенные переименования узла и файлов внутри удаляемого
+        # каталога будут пропущены
+        for tmp_path in self._pop_pending_writes_under(id):
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+        abs_path = self._get_abs_path_by_rel_path(self._get_rel_path(id))
+        try:
+            if os.path.isdir(abs_path) and not os.path.islink(abs_path):
+                shutil.rmtree(abs_path)
+            else:
+                os.unlink(abs_path)
+        except FileNotFoundError:
+            # Уже удален с диска, убираем из таблицы
+            pass
+        self._nodes.remove_node(id)
+        if self._fsync_batch.add(os.path.dirname(abs_path)):
+            self._flush_batch()
+
+    # Убирает ожидающие записи узла и всех узлов под ним,
+    # возвращает их временные файлы
+    def _pop_pending_writes_under(self, id: int) -> list[str]:
+        with self._reserved_lock:
+            under = []
+            for pending_id, (parent_id, _, _) in self._pending_writes.items():
+                cur_id = pending_id if pending_id == id else parent_id
+                while cur_id is not None and cur_id != id:
+                    cur_id = self._nodes.get_parent(cur_id)
+                if cur_id == id:
+                    under.append(pending_id)
+            tmp_paths = []
+            for pending_id in under:
+                tmp_path = self._pending_writes.pop(pending_id)[2]
+                self._pending_by_tmp.pop(tmp_path, None)
+                tmp_paths.append(tmp_path)
+        return tmp_paths
+
+    # Сбрасывает на диск все записанное после прошлого сброса
+    # и переименовывает временные файлы
+    def flush_writes(self):
+        self._flush_batch()
 
     def get_hash_protocol(self):
         return Blake2ContentHashProtocol()
 
+    def _get_hash_cache(self) -> StatHashCache:
+        with self._hash_cache_lock:
+            if self._hash_cache is None:
+                self._hash_cache = StatHashCache(
+                    default_cache_path(self._root_path_str),
+                    type(self._hash_prototol).__name__
+                )
+            return self._hash_cache
+
+    # Хэш содержимого файла. stat берется с открытого файла, поэтому
+    # неизменившийся файл (тот же размер, mtime и inode) не читается
+    def get_file_hash_by_id(self, id: int) -> bytes:
+        hash_cache = self._get_hash_cache()
+        with open(self._get_abs_path_by_id(id), 'rb') as file:
+            st = os.fstat(file.fileno())
+            hash = hash_cache.get_hash_by_stat(st)
+            if hash is None:
+                hash = self._hash_prototol.get_hash_from_stream(file)
+                hash_cache.save_hash_by_stat(st, hash)
+        return hash
+
+    # Хэш узла: для файла - по содержимому, для каталога - от хэшей
+    # потомков. Хэши каталогов не кэшируются: stat каталога не
+    # меняется при изменении вложенных файлов
+    def get_hash_by_id(self, id: int, snapshot: Optional[NodeTableSnapshot] = None) -> bytes:
+        def get_descendants(node: IdentifiedInfo) -> list[IdentifiedInfo]:
+            if node.info['type'] != 'dir':
+                return []
+            return list(self.get_childs_by_id(node.id, snapshot))
+
+        def get_hash_from_leaf(node: IdentifiedInfo) -> bytes:
+            if node.info['type'] == 'dir':
+                # Пустой каталог
+                return self._hash_prototol.get_hash_by_hash_lst(())
+            return self.get_file_hash_by_id(node.id)
+
+        calculate = DependsOnlyDescendantsListTreeFunctionBuilder(
+            get_hash_from_leaf,
+            lambda node: node,
+            lambda node: node.info['rel_path'],
+            self._hash_prototol.get_hash_by_hash_lst,
+            get_descendants
+        )
+        return calculate(self.get_identified_info(id, snapshot))
+
     def get_location_protocol(self):
         return self._location_protocol
 
@@ -340,11 +1002,10 @@ class OsGatewayFactory(GatewayFactory):
 
     # Создает нового независимого чтеца с общей индексацией
     def _build_readable_gateway_context_manager(self):
-        return OsGatewayContextManager(
-            OsReadableGateway(self),
-            self._manage_lock
-        )
+        return OsGatewayContextManager(OsReadableGateway(self), self._manage_lock)
     
+    # Чтец работает со снимком и не ждет изменяющего,
+    # поэтому ожидания доступа у него нет
     def get_readable_gateway(
         self,
         location_protocol: 'Optional[LocationProtocol]' = None
@@ -354,9 +1015,14 @@ class OsGatewayFactory(GatewayFactory):
 
     def get_modifiable_gateway(
         self,
-        location_protocol: 'Optional[LocationProtocol]' = None
+        location_protocol: 'Optional[LocationProtocol]' = None,
+        timeout: Optional[float] = None
     ) -> 'ContextManager[ModifiableTreeDataGateway]':
-        ...
+        return OsGatewayContextManager(
+            OsModifiableGateway(self),
+            self._manage_lock,
+            self._lock_timeout if timeout is None else timeout
+        )
 
 
 
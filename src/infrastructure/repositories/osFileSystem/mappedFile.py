@@ -0,0 +1,60 @@
+import mmap
+import os
+from typing import Optional
+
+
+# Отображение диапазона файла в память. Внутри контекста данные
+# доступны как memoryview без копирования. Начало отображения
+# выравнивается по ALLOCATIONGRANULARITY, лишнее отрезается срезом.
+# Файл нельзя обрезать, пока открыто отображение (SIGBUS),
+# поэтому запись в хранилище идет через переименование
+class MappedFileView:
+    def __init__(
+        self,
+        abs_path: str,
+        offset: int = 0,
+        length: Optional[int] = None
+    ):
+        if offset < 0:
+            raise ValueError(f'Смещение не может быть отрицательным! offset={offset}')
+        if length is not None and length < 0:
+            raise ValueError(f'Длина не может быть отрицательной! length={length}')
+        self._abs_path = abs_path
+        self._offset = offset
+        self._length = length
+        self._mmap: Optional[mmap.mmap] = None
+        self._view: Optional[memoryview] = None
+
+    def __enter__(self) -> memoryview:
+        fd = os.open(self._abs_path, os.O_RDONLY | os.O_CLOEXEC)
+        try:
+            size = os.fstat(fd).st_size
+            end = size if self._length is None else min(size, self._offset + self._length)
+            if end <= self._offset:
+                # Пустой диапазон отобразить нельзя
+                self._view = memoryview(b'')
+                return self._view
+            start = self._offset - self._offset % mmap.ALLOCATIONGRANULARITY
+            self._mmap = mmap.mmap(fd, end - start, access=mmap.ACCESS_READ, offset=start)
+        finally:
+            # Отображение не зависит от дескриптора
+            os.close(fd)
+        if self._length is None and hasattr(self._mmap, 'madvise'):
+            self._mmap.madvise(mmap.MADV_SEQUENTIAL)
+        base = memoryview(self._mmap)
+        self._view = base[self._offset - start:]
+        base.release()
+        return self._view
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Снаружи остались срезы: отображение закроется
+                # вместе с последним из них
+                pass
+            self._mmap = None
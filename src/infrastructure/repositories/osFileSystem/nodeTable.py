@@ -0,0 +1,635 @@
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+from typing import Any, Iterable, Optional, Sequence
+
+from domain.interfaces.gateway import IdNotFoundError
+
+
+# Компактная таблица узлов файловой системы.
+# Потомки каталога добавляются в порядке имен.
+# Каждый столбец - отдельный массив, индекс в массиве - id узла.
+# Имена хранятся в общем буфере, полный путь собирается по цепочке
+# родителей. Потомки одной директории получают id подряд, поэтому
+# для них хранится только диапазон (первый id, количество).
+# Для перечитанных после изменений каталогов список потомков
+# хранится отдельно, а исчезнувшие узлы помечаются удаленными.
+# Таблицу можно сохранить в файл и загрузить при следующем запуске,
+# тогда узлы сохраняют свои id. Загруженные каталоги считаются
+# непроверенными, пока их не перечитают.
+# Снимки (NodeTableSnapshot) видят таблицу на момент открытия: перед
+# изменением уже существующего узла старое значение пишется в журнал
+# отката, а новые узлы помечаются версией, в которой появились.
+# Журнал ведется только пока открыт хотя бы один снимок
+class CompactNodeTable:
+    # Потомки узла еще не читались
+    NOT_LISTED = -1
+    # Родитель удаленного узла
+    REMOVED = -2
+
+    # Флаги узла
+    _VERIFIED = 1
+    _IS_DIR = 2
+    # stat получен в этом запуске, а не загружен из файла
+    _STAT_SEEN = 4
+    # Поля журнала отката
+    _PARENT = 0
+    _CHILDREN = 1
+    _STAT = 2
+
+    # Формат файла: заголовок, путь корня, столбцы, буфер имен,
+    # затем списки потомков перечитанных каталогов (родитель, число, id...)
+    SNAPSHOT_MAGIC = b'OSIDMAP\0'
+    SNAPSHOT_VERSION = 2
+    # magic, версия, порядок байт (1 - little), длина пути корня,
+    # число узлов, длина буфера имен, длина раздела списков потомков
+    _SNAPSHOT_HEADER = struct.Struct('<8sIIIqqq')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._parents = array('q')
+        self._name_offsets = array('q')
+        self._name_lengths = array('i')
+        self._child_starts = array('q')
+        self._child_counts = array('i')
+        # Последний увиденный stat узла: размер, время изменения, inode
+        self._sizes = array('q')
+        self._mtimes = array('q')
+        self._inodes = array('q')
+        # _VERIFIED - содержимое каталога сверено с диском в этом запуске,
+        # _IS_DIR - узел каталог (по последнему stat),
+        # _STAT_SEEN - stat получен в этом запуске
+        self._flags = bytearray()
+        self._names = bytearray()
+        # Потомки перечитанных каталогов
+        self._child_lists: dict[int, array] = {}
+        # Версия, с которой появился узел (0 - найден при первом чтении)
+        self._created = array('I')
+        # Текущая версия и число открытых снимков каждой версии
+        self._version = 0
+        self._snapshots: dict[int, int] = {}
+        # id -> [(версия изменения, поле, старое значение)]
+        self._undo: dict[int, list[tuple[int, int, Any]]] = {}
+
+    def __len__(self):
+        return len(self._parents)
+
+    def __contains__(self, id: int):
+        return 0 <= id < len(self._parents)
+
+    def _check_id(self, id: int):
+        if not (0 <= id < len(self._parents)) or self._parents[id] == self.REMOVED:
+            raise IdNotFoundError('Неизвестный идентификатор!')
+
+    def _append(self, parent_id: int, name: str, version: int = 0) -> int:
+        encoded = os.fsencode(name)
+        id = len(self._parents)
+        self._parents.append(parent_id)
+        self._name_offsets.append(len(self._names))
+        self._name_lengths.append(len(encoded))
+        self._names += encoded
+        self._child_starts.append(self.NOT_LISTED)
+        self._child_counts.append(0)
+        self._sizes.append(-1)
+        self._mtimes.append(-1)
+        self._inodes.append(-1)
+        self._flags.append(self._VERIFIED)
+        self._created.append(version)
+        return id
+
+    # Запоминает старое значение поля для открытых снимков
+    def _log(self, id: int, field: int, old_value: Any):
+        if len(self._snapshots) == 0:
+            return
+        self._undo.setdefault(id, []).append((self._version, field, old_value))
+
+    def add_root(self) -> int:
+        with self._lock:
+            return self._append(-1, '')
+
+    # Добавляет всех потомков директории разом и возвращает их id.
+    # Если потомков уже добавил другой поток, то возвращает None
+    def set_children(self, parent_id: int, names: Iterable[str]) -> Optional[range]:
+        with self._lock:
+            self._check_id(parent_id)
+            if self._child_starts[parent_id] != self.NOT_LISTED:
+                return None
+            return self._set_children(parent_id, names)
+
+    def _set_children(self, parent_id: int, names: Iterable[str]) -> range:
+        start = len(self._parents)
+        for name in names:
+            self._append(parent_id, name)
+        self._child_starts[parent_id] = start
+        self._child_counts[parent_id] = len(self._parents) - start
+        self._flags[parent_id] |= self._VERIFIED
+        return range(start, len(self._parents))
+
+    # Заменяет потомков каталога новым списком имен. Узлы с теми же
+    # именами сохраняют id, новые получают id, исчезнувшие удаляются
+    # вместе со своими поддеревьями. Возвращает id в порядке имен.
+    # Сверка загруженного из файла каталога не считается изменением:
+    # снимки видят ее результат, поэтому непроверенные каталоги нужно
+    # сверять до чтения через снимок
+    def update_children(self, parent_id: int, names: Iterable[str]) -> Sequence[int]:
+        with self._lock:
+            self._check_id(parent_id)
+            old_ids = self._get_children(parent_id)
+            if old_ids is None:
+                return self._set_children(parent_id, names)
+            is_change = self._flags[parent_id] & self._VERIFIED != 0
+            version = self._version if is_change else 0
+            id_by_name = {self._get_name(child_id): child_id for child_id in old_ids}
+            new_ids = array('q')
+            for name in names:
+                child_id = id_by_name.pop(name, None)
+                if child_id is None:
+                    child_id = self._append(parent_id, name, version)
+                new_ids.append(child_id)
+            if len(id_by_name) == 0 and len(new_ids) == len(old_ids):
+                # Состав каталога не изменился
+                self._flags[parent_id] |= self._VERIFIED
+                return old_ids
+            for child_id in id_by_name.values():
+                self._remove_subtree(child_id, is_change)
+            if is_change:
+                self._log(parent_id, self._CHILDREN, old_ids)
+            self._child_lists[parent_id] = new_ids
+            # Диапазон не используется, отмечаем только, что каталог прочитан
+            self._child_starts[parent_id] = 0
+            self._child_counts[parent_id] = len(new_ids)
+            self._flags[parent_id] |= self._VERIFIED
+            return new_ids
+
+    # Резервирует id под будущий узел. До commit_child узел
+    # считается удаленным и нигде не виден
+    def reserve_id(self) -> int:
+        with self._lock:
+            return self._append(self.REMOVED, '', self._version)
+
+    # Позиция имени среди отсортированных потомков
+    def _find_position(self, children: Sequence[int], name: str) -> int:
+        low, high = 0, len(children)
+        while low < high:
+            middle = (low + high) // 2
+            if self._get_name(children[middle]) < name:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    # Добавляет зарезервированный узел в прочитанный каталог.
+    # Узел с тем же именем заменяется вместе с поддеревом
+    def commit_child(self, id: int, parent_id: int, name: str):
+        encoded = os.fsencode(name)
+        with self._lock:
+            self._check_id(parent_id)
+            old_ids = self._get_children(parent_id)
+            if old_ids is None:
+                raise ValueError(f'Потомки каталога еще не прочитаны! parent_id={parent_id}')
+            self._name_offsets[id] = len(self._names)
+            self._name_lengths[id] = len(encoded)
+            self._names += encoded
+            self._parents[id] = parent_id
+            self._created[id] = self._version
+            new_ids = array('q', old_ids)
+            pos = self._find_position(old_ids, name)
+            if pos < len(old_ids) and self._get_name(old_ids[pos]) == name:
+                self._remove_subtree(old_ids[pos])
+                new_ids[pos] = id
+            else:
+                new_ids.insert(pos, id)
+            self._log(parent_id, self._CHILDREN, old_ids)
+            self._child_lists[parent_id] = new_ids
+            self._child_starts[parent_id] = 0
+            self._child_counts[parent_id] = len(new_ids)
+
+    # Удаляет узел с поддеревом и из списка потомков родителя
+    def remove_node(self, id: int):
+        with self._lock:
+            self._check_id(id)
+            parent_id = self._parents[id]
+            if parent_id >= 0:
+                old_ids = self._get_children(parent_id)
+                if old_ids is not None:
+                    new_ids = array('q', (child_id for child_id in old_ids if child_id != id))
+                    self._log(parent_id, self._CHILDREN, old_ids)
+                    self._child_lists[parent_id] = new_ids
+                    self._child_starts[parent_id] = 0
+                    self._child_counts[parent_id] = len(new_ids)
+            self._remove_subtree(id)
+
+    def _remove_subtree(self, id: int, is_change: bool = True):
+        stack = [id]
+        while len(stack) > 0:
+            cur_id = stack.pop()
+            children = self._get_children(cur_id)
+            if children is not None:
+                stack.extend(children)
+            if is_change:
+                self._log(cur_id, self._PARENT, self._parents[cur_id])
+                self._log(cur_id, self._CHILDREN, children)
+            self._parents[cur_id] = self.REMOVED
+            self._child_lists.pop(cur_id, None)
+            self._child_starts[cur_id] = self.NOT_LISTED
+            self._child_counts[cur_id] = 0
+
+    def is_removed(self, id: int) -> bool:
+        return 0 <= id < len(self._parents) and self._parents[id] == self.REMOVED
+
+    # False, если потомки загружены из файла и еще не сверены с диском
+    def is_verified(self, id: int) -> bool:
+        self._check_id(id)
+        return self._flags[id] & self._VERIFIED != 0
+
+    def _get_stat(self, id: int) -> Optional[tuple[int, int, int, bool]]:
+        if self._mtimes[id] < 0:
+            return None
+        return (
+            self._sizes[id],
+            self._mtimes[id],
+            self._inodes[id],
+            self._flags[id] & self._IS_DIR != 0
+        )
+
+    # Последний увиденный (размер, mtime_ns, inode, это каталог),
+    # None, если stat не сохранялся
+    def get_stat(self, id: int) -> Optional[tuple[int, int, int, bool]]:
+        self._check_id(id)
+        return self._get_stat(id)
+
+    # Чтение старого значения, запись в журнал и запись столбцов -
+    # один шаг под блокировкой, иначе снимок может увидеть новое
+    # значение раньше записи журнала
+    def set_stat(self, id: int, size: int, mtime_ns: int, inode: int, is_dir: bool):
+        with self._lock:
+            self._check_id(id)
+            if len(self._snapshots) > 0 and self._flags[id] & self._STAT_SEEN:
+                old_stat = self._get_stat(id)
+                if old_stat is not None and old_stat != (size, mtime_ns, inode, is_dir):
+                    self._log(id, self._STAT, old_stat)
+            self._sizes[id] = size
+            self._mtimes[id] = mtime_ns
+            self._inodes[id] = inode
+            if is_dir:
+                self._flags[id] |= self._IS_DIR | self._STAT_SEEN
+            else:
+                self._flags[id] = self._flags[id] & ~self._IS_DIR & 0xff | self._STAT_SEEN
+
+    def _get_children(self, id: int) -> Optional[Sequence[int]]:
+        child_list = self._child_lists.get(id)
+        if child_list is not None:
+            return child_list
+        start = self._child_starts[id]
+        if start == self.NOT_LISTED:
+            return None
+        return range(start, start + self._child_counts[id])
+
+    # None, если потомки еще не читались
+    def get_children(self, id: int) -> Optional[Sequence[int]]:
+        self._check_id(id)
+        return self._get_children(id)
+
+    def get_parent(self, id: int) -> Optional[int]:
+        self._check_id(id)
+        parent_id = self._parents[id]
+        return None if parent_id < 0 else parent_id
+
+    def _get_name(self, id: int) -> str:
+        offset = self._name_offsets[id]
+        return os.fsdecode(bytes(self._names[offset:offset + self._name_lengths[id]]))
+
+    def get_name(self, id: int) -> str:
+        self._check_id(id)
+        return self._get_name(id)
+
+    # Путь относительно корня таблицы ('.' для корня)
+    def get_rel_path(self, id: int) -> str:
+        self._check_id(id)
+        names: list[str] = []
+        while self._parents[id] >= 0:
+            names.append(self._get_name(id))
+            id = self._parents[id]
+        if len(names) == 0:
+            return '.'
+        names.reverse()
+        return '/'.join(names)
+
+    # Потомки хранятся в порядке имен, поэтому поиск двоичный
+    def find_child_by_name(self, parent_id: int, name: str) -> Optional[int]:
+        children = self.get_children(parent_id)
+        if children is None:
+            return None
+        pos = self._find_position(children, name)
+        if pos < len(children) and self._get_name(children[pos]) == name:
+            return children[pos]
+        return None
+
+    # Поиск id по относительному пути среди уже прочитанных директорий
+    def find_id_by_rel_path(self, root_id: int, rel_path: str) -> Optional[int]:
+        id: Optional[int] = root_id
+        if rel_path in ('', '.'):
+            return id
+        for name in rel_path.split('/'):
+            id = self.find_child_by_name(id, name)
+            if id is None:
+                return None
+        return id
+
+    # Примерный объем памяти таблицы в байтах
+    def memory_usage(self) -> int:
+        return (
+            sum(
+                column.itemsize * column.buffer_info()[1]
+                for column in (
+                    self._parents,
+                    self._name_offsets,
+                    self._name_lengths,
+                    self._child_starts,
+                    self._child_counts,
+                    self._sizes,
+                    self._mtimes,
+                    self._inodes,
+                    self._created
+                )
+            )
+            + len(self._flags)
+            + len(self._names)
+            + sum(
+                child_list.itemsize * len(child_list)
+                for child_list in self._child_lists.values()
+            )
+        )
+
+    def _columns(self) -> tuple[array, ...]:
+        return (
+            self._parents,
+            self._name_offsets,
+            self._name_lengths,
+            self._child_starts,
+            self._child_counts,
+            self._sizes,
+            self._mtimes,
+            self._inodes
+        )
+
+    # Сохраняет таблицу в файл. Запись идет во временный файл,
+    # который затем атомарно заменяет старый
+    def save(self, abs_file_path: str, root_path: str):
+        encoded_root = os.fsencode(root_path)
+        tmp_path = f'{abs_file_path}.tmp'
+        with self._lock:
+            child_lists = array('q')
+            for parent_id, child_list in self._child_lists.items():
+                child_lists.append(parent_id)
+                child_lists.append(len(child_list))
+                child_lists.extend(child_list)
+            header = self._SNAPSHOT_HEADER.pack(
+                self.SNAPSHOT_MAGIC,
+                self.SNAPSHOT_VERSION,
+                1 if sys.byteorder == 'little' else 0,
+                len(encoded_root),
+                len(self._parents),
+                len(self._names),
+                len(child_lists)
+            )
+            with open(tmp_path, 'wb') as f:
+                f.write(header)
+                f.write(encoded_root)
+                for column in self._columns():
+                    column.tofile(f)
+                f.write(self._flags)
+                f.write(self._names)
+                child_lists.tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, abs_file_path)
+
+    # Загружает таблицу из файла через mmap: столбцы копируются
+    # целиком, без разбора по узлам. Возвращает None, если файл
+    # отсутствует, поврежден или сохранен для другого корня
+    @classmethod
+    def load(cls, abs_file_path: str, root_path: str) -> 'Optional[CompactNodeTable]':
+        try:
+            with open(abs_file_path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size < cls._SNAPSHOT_HEADER.size:
+                    return None
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    return cls._load_from_buffer(mm, os.fsencode(root_path))
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def _load_from_buffer(cls, mm: mmap.mmap, encoded_root: bytes) -> 'Optional[CompactNodeTable]':
+        (
+            magic, version, little_endian, root_len,
+            nodes_count, names_len, child_lists_len
+        ) = cls._SNAPSHOT_HEADER.unpack_from(mm, 0)
+        if magic != cls.SNAPSHOT_MAGIC or version != cls.SNAPSHOT_VERSION:
+            return None
+        offset = cls._SNAPSHOT_HEADER.size
+        if mm[offset:offset + root_len] != encoded_root:
+            return None
+        offset += root_len
+        table = cls()
+        columns = table._columns()
+        expected_size = (
+            offset
+            + (sum(column.itemsize for column in columns) + 1) * nodes_count
+            + names_len
+            + 8 * child_lists_len
+        )
+        if len(mm) != expected_size or nodes_count <= 0:
+            return None
+        swap = little_endian != (1 if sys.byteorder == 'little' else 0)
+        view = memoryview(mm)
+        try:
+            for column in columns:
+                size = column.itemsize * nodes_count
+                column.frombytes(view[offset:offset + size])
+                offset += size
+            # Загруженные каталоги и stat еще не сверены с диском
+            table._flags = bytearray(view[offset:offset + nodes_count]).translate(_CLEAR_LOADED)
+            offset += nodes_count
+            table._names = bytearray(view[offset:offset + names_len])
+            offset += names_len
+            child_lists = array('q')
+            child_lists.frombytes(view[offset:])
+        finally:
+            view.release()
+        if swap:
+            for column in columns:
+                column.byteswap()
+            child_lists.byteswap()
+        pos = 0
+        while pos < len(child_lists):
+            parent_id, count = child_lists[pos], child_lists[pos + 1]
+            table._child_lists[parent_id] = child_lists[pos + 2:pos + 2 + count]
+            pos += 2 + count
+        table._created = array('I', [0]) * nodes_count
+        return table
+
+    # Открывает снимок текущего состояния таблицы. Изменения после
+    # открытия получают версию больше версии снимка
+    def open_snapshot(self) -> 'NodeTableSnapshot':
+        with self._lock:
+            version = self._version
+            self._version += 1
+            self._snapshots[version] = self._snapshots.get(version, 0) + 1
+        return NodeTableSnapshot(self, version)
+
+    # Версия, включающая все сделанные изменения, но не последующие
+    def next_version(self) -> int:
+        with self._lock:
+            version = self._version
+            self._version += 1
+            return version
+
+    # Закрывает снимок и убирает записи журнала, не нужные
+    # оставшимся снимкам
+    def _release_snapshot(self, version: int):
+        with self._lock:
+            count = self._snapshots.get(version, 0)
+            if count <= 1:
+                self._snapshots.pop(version, None)
+            else:
+                self._snapshots[version] = count - 1
+            if len(self._snapshots) == 0:
+                self._undo.clear()
+                return
+            min_version = min(self._snapshots)
+            for id in list(self._undo):
+                entries = [entry for entry in self._undo[id] if entry[0] > min_version]
+                if len(entries) > 0:
+                    self._undo[id] = entries
+                else:
+                    del self._undo[id]
+
+    @property
+    def snapshots_count(self) -> int:
+        return sum(self._snapshots.values())
+
+    # Значение поля на момент версии: первое изменение после нее
+    # хранит старое значение. found = False - поле не менялось
+    def _get_old_value(self, id: int, field: int, version: int) -> tuple[bool, Any]:
+        entries = self._undo.get(id)
+        if entries is not None:
+            for entry_version, entry_field, old_value in entries:
+                if entry_field == field and entry_version > version:
+                    return True, old_value
+        return False, None
+
+
+_CLEAR_LOADED = bytes(
+    flags & ~(CompactNodeTable._VERIFIED | CompactNodeTable._STAT_SEEN) for flags in range(256)
+)
+
+
+# Неизменяемый вид таблицы на момент открытия. Каталог, прочитанный
+# снимком заново (set_dir_version), виден в версии чтения: потомки
+# и их stat на момент чтения. Дальнейшие изменения снимку не видны.
+# Снимок нужно закрыть
+class NodeTableSnapshot:
+    def __init__(self, table: CompactNodeTable, version: int):
+        self._table = table
+        self._version = version
+        # Каталоги, прочитанные снимком: id -> версия чтения
+        self._dir_versions: dict[int, int] = {}
+        self._closed = False
+
+    @property
+    def version(self):
+        return self._version
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._table._release_snapshot(self._version)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def is_dir_read(self, id: int) -> bool:
+        return id in self._dir_versions
+
+    # Отмечает, что каталог прочитан снимком в версии version
+    def set_dir_version(self, id: int, version: int):
+        self._dir_versions.setdefault(id, version)
+
+    def _get_dir_version(self, id: int) -> int:
+        return self._dir_versions.get(id, self._version)
+
+    # Родитель не меняется, удаленный узел хранит его в журнале
+    def _get_real_parent(self, id: int) -> int:
+        found, parent_id = self._table._get_old_value(id, CompactNodeTable._PARENT, -1)
+        if found:
+            return parent_id
+        return self._table._parents[id]
+
+    def _check_id(self, id: int) -> int:
+        table = self._table
+        if not (0 <= id < len(table)):
+            raise IdNotFoundError('Неизвестный идентификатор!')
+        parent_id = self._get_real_parent(id)
+        version = self._version if parent_id < 0 else self._get_dir_version(parent_id)
+        if table._created[id] > version:
+            raise IdNotFoundError('Неизвестный идентификатор!')
+        if table._parents[id] == CompactNodeTable.REMOVED:
+            found, _ = table._get_old_value(id, CompactNodeTable._PARENT, version)
+            if not found:
+                raise IdNotFoundError('Неизвестный идентификатор!')
+        return parent_id
+
+    def __contains__(self, id: int):
+        try:
+            self._check_id(id)
+        except IdNotFoundError:
+            return False
+        return True
+
+    # None, если потомки еще не читались
+    def get_children(self, id: int) -> Optional[Sequence[int]]:
+        self._check_id(id)
+        # Журнал и столбцы читаются под той же блокировкой, под которой пишутся
+        with self._table._lock:
+            found, children = self._table._get_old_value(
+                id, CompactNodeTable._CHILDREN, self._get_dir_version(id)
+            )
+            if found:
+                return children
+            return self._table._get_children(id)
+
+    def get_parent(self, id: int) -> Optional[int]:
+        parent_id = self._check_id(id)
+        return None if parent_id < 0 else parent_id
+
+    def get_name(self, id: int) -> str:
+        self._check_id(id)
+        return self._table._get_name(id)
+
+    def get_rel_path(self, id: int) -> str:
+        parent_id = self._check_id(id)
+        names: list[str] = []
+        while parent_id >= 0:
+            names.append(self._table._get_name(id))
+            id = parent_id
+            parent_id = self._get_real_parent(id)
+        if len(names) == 0:
+            return '.'
+        names.reverse()
+        return '/'.join(names)
+
+    def get_stat(self, id: int) -> Optional[tuple[int, int, int, bool]]:
+        parent_id = self._check_id(id)
+        version = self._version if parent_id < 0 else self._get_dir_version(parent_id)
+        with self._table._lock:
+            found, old_stat = self._table._get_old_value(id, CompactNodeTable._STAT, version)
+            if found:
+                return old_stat
+            return self._table._get_stat(id)
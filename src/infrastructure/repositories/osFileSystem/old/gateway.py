@@ -12,7 +12,7 @@ if TYPE_CHECKING:
 from pathlib import Path
 from domain.interfaces.gateway import BadLocationId, NoContentFromLocationId
 from infrastructure.repositories.osFileSystem.dataInfo import OsDirectoryDataInfo, OsFileDataInfo, OsFileObjectDataInfo
-import xattr
+from infrastructure.repositories.osFileSystem.statHashCache import StatHashCache, default_cache_path
 
 # TODO: подумать как защитить от возможности проникнуть в другие каталоги при помощи
 # ../ и ./
@@ -22,12 +22,21 @@ class OsFileSystemGateway(Gateway):
         location_id_protocol: 'LocationIdentifierProtocol',
         hash_protocol: 'ContentHashProtocol',
         transformation_protocol: 'ContentTransformationProtocol',
-        abs_root_dir_path: str
+        abs_root_dir_path: str,
+        hash_cache: 'StatHashCache | None' = None
     ):
         self._root_dir_path = Path(abs_root_dir_path.rstrip('/') + '/')
         self._check_root_path()
         
         super().__init__(location_id_protocol, hash_protocol, transformation_protocol)
+        # Кэш хэшей по stat вместо xattr, по умолчанию - постоянный
+        # файл в каталоге состояния реплики
+        if hash_cache is None:
+            hash_cache = StatHashCache(
+                default_cache_path(abs_root_dir_path),
+                type(hash_protocol).__name__
+            )
+        self._hash_cache = hash_cache
         
         # Собираем функцию, вычисляющуюю хэши. Вычисляем хэши
         self._hash_tree_calculator = self._get_hash_tree_calculator()
@@ -80,7 +89,9 @@ class OsFileSystemGateway(Gateway):
         )
     
     def _calculate_hash_tree(self):
+        self._hash_cache.forget_directories()
         self._hash_tree_calculator(self._root_dir_path)
+        self._hash_cache.flush()
 
     def _get_internal_paths_by_path(self, path: Path) -> list[Path]:
         content_lst = []
@@ -94,11 +105,14 @@ class OsFileSystemGateway(Gateway):
         def get_path_order(path: Path):
             return str(path)
 
+        def get_file_path(path: Path):
+            return path
+
         return DependsOnlyDescendantsListTreeFunctionBuilder(
-            # Функция, хэширующая бинарник
-            self._hash_protocol.get_hash_from_binary,
-            # Функция, извлекающая бинарник
-            Path.read_bytes, 
+            # Функция, хэширующая бинарник потоково
+            self._get_hash_from_file_by_path,
+            # Файл открывается только на время хэширования
+            get_file_path, 
             # Функция, для упорядочивания путей в директории
             get_path_order,
             # Функция, для вычисления хэшей от вычисленных хэшей 
@@ -111,16 +125,15 @@ class OsFileSystemGateway(Gateway):
             self._get_hash_by_path
         )
     
-    # TODO: обработать исключения
+    def _get_hash_from_file_by_path(self, path: Path) -> bytes:
+        with path.open('rb') as file:
+            return self._hash_protocol.get_hash_from_stream(file)
+
     def _save_hash_by_path(self, path: Path, hash: bytes):
-        xattr.setxattr(str(path), 'user.hash', hash)
+        self._hash_cache.save_hash_by_path(path, hash)
     
-    # TODO: подумать над исключениями
     def _get_hash_by_path(self, path: Path) -> bytes | None:
-        try:
-            return xattr.getxattr(str(path), 'user.hash')
-        except IOError:
-            return None
+        return self._hash_cache.get_hash_by_path(path)
 
     def _get_path_by_rel_path(self, rel_path: str) -> Path:
         path = Path(self._root_dir_path / rel_path)
@@ -0,0 +1,229 @@
+import threading
+import time
+from typing import Optional
+
+
+# Снимок счетчиков блокировки. Время в секундах
+class LockStats:
+    def __init__(
+        self,
+        read_acquired: int,
+        write_acquired: int,
+        read_timeouts: int,
+        write_timeouts: int,
+        read_wait_time: float,
+        write_wait_time: float,
+        max_read_wait_time: float,
+        max_write_wait_time: float,
+        read_hold_time: float,
+        write_hold_time: float,
+        active_readers: int,
+        waiting_readers: int,
+        waiting_writers: int
+    ):
+        self._read_acquired = read_acquired
+        self._write_acquired = write_acquired
+        self._read_timeouts = read_timeouts
+        self._write_timeouts = write_timeouts
+        self._read_wait_time = read_wait_time
+        self._write_wait_time = write_wait_time
+        self._max_read_wait_time = max_read_wait_time
+        self._max_write_wait_time = max_write_wait_time
+        self._read_hold_time = read_hold_time
+        self._write_hold_time = write_hold_time
+        self._active_readers = active_readers
+        self._waiting_readers = waiting_readers
+        self._waiting_writers = waiting_writers
+
+    @property
+    def read_acquired(self):
+        return self._read_acquired
+
+    @property
+    def write_acquired(self):
+        return self._write_acquired
+
+    @property
+    def read_timeouts(self):
+        return self._read_timeouts
+
+    @property
+    def write_timeouts(self):
+        return self._write_timeouts
+
+    # Суммарное время ожидания, включая неудачные попытки
+    @property
+    def read_wait_time(self):
+        return self._read_wait_time
+
+    @property
+    def write_wait_time(self):
+        return self._write_wait_time
+
+    @property
+    def max_read_wait_time(self):
+        return self._max_read_wait_time
+
+    @property
+    def max_write_wait_time(self):
+        return self._max_write_wait_time
+
+    # Суммарное время удержания
+    @property
+    def read_hold_time(self):
+        return self._read_hold_time
+
+    @property
+    def write_hold_time(self):
+        return self._write_hold_time
+
+    @property
+    def active_readers(self):
+        return self._active_readers
+
+    # Длина очередей в момент снимка
+    @property
+    def waiting_readers(self):
+        return self._waiting_readers
+
+    @property
+    def waiting_writers(self):
+        return self._waiting_writers
+
+    def __repr__(self):
+        return (
+            f'LockStats(read_acquired={self._read_acquired}, write_acquired={self._write_acquired}, '
+            f'read_timeouts={self._read_timeouts}, write_timeouts={self._write_timeouts}, '
+            f'max_write_wait_time={self._max_write_wait_time:.3f}, '
+            f'waiting_readers={self._waiting_readers}, waiting_writers={self._waiting_writers})'
+        )
+
+
+# Блокировка чтения-записи с приоритетом писателя: пока писатель
+# ждет, новые читатели не допускаются, поэтому поток читателей
+# не может задержать запись бесконечно. Захват с таймаутом
+# возвращает False, если дождаться не удалось.
+# Блокировка не реентерабельна
+class ReadWriteLock:
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers_count = 0
+        self._writer_active = False
+        self._waiting_readers = 0
+        self._waiting_writers = 0
+        # Время захвата удерживаемых блокировок в текущем потоке
+        self._local = threading.local()
+        self._write_start = 0.0
+        # Счетчики
+        self._read_acquired = 0
+        self._write_acquired = 0
+        self._read_timeouts = 0
+        self._write_timeouts = 0
+        self._read_wait_time = 0.0
+        self._write_wait_time = 0.0
+        self._max_read_wait_time = 0.0
+        self._max_write_wait_time = 0.0
+        self._read_hold_time = 0.0
+        self._write_hold_time = 0.0
+
+    def _can_read(self) -> bool:
+        return not self._writer_active and self._waiting_writers == 0
+
+    def _can_write(self) -> bool:
+        return not self._writer_active and self._readers_count == 0
+
+    def _read_starts(self) -> list[float]:
+        starts = getattr(self._local, 'read_starts', None)
+        if starts is None:
+            starts = []
+            self._local.read_starts = starts
+        return starts
+
+    def acquire_read(self, timeout: Optional[float] = None) -> bool:
+        start = time.monotonic()
+        with self._cond:
+            self._waiting_readers += 1
+            try:
+                acquired = self._cond.wait_for(self._can_read, timeout)
+            finally:
+                self._waiting_readers -= 1
+            waited = time.monotonic() - start
+            self._read_wait_time += waited
+            self._max_read_wait_time = max(self._max_read_wait_time, waited)
+            if not acquired:
+                self._read_timeouts += 1
+                return False
+            self._readers_count += 1
+            self._read_acquired += 1
+        self._read_starts().append(time.monotonic())
+        return True
+
+    def release_read(self):
+        starts = self._read_starts()
+        # Освобождение из другого потока в удержание не засчитываем
+        held = time.monotonic() - starts.pop() if len(starts) > 0 else 0.0
+        with self._cond:
+            if self._readers_count == 0:
+                raise RuntimeError('Блокировка чтения не захвачена!')
+            self._readers_count -= 1
+            self._read_hold_time += held
+            if self._readers_count == 0:
+                self._cond.notify_all()
+
+    def acquire_write(self, timeout: Optional[float] = None) -> bool:
+        start = time.monotonic()
+        with self._cond:
+            self._waiting_writers += 1
+            acquired = False
+            try:
+                acquired = self._cond.wait_for(self._can_write, timeout)
+            finally:
+                self._waiting_writers -= 1
+                if not acquired and self._waiting_writers == 0:
+                    # Читатели ждали только из-за этого писателя
+                    self._cond.notify_all()
+            waited = time.monotonic() - start
+            self._write_wait_time += waited
+            self._max_write_wait_time = max(self._max_write_wait_time, waited)
+            if not acquired:
+                self._write_timeouts += 1
+                return False
+            self._writer_active = True
+            self._write_acquired += 1
+            self._write_start = time.monotonic()
+        return True
+
+    def release_write(self):
+        with self._cond:
+            if not self._writer_active:
+                raise RuntimeError('Блокировка записи не захвачена!')
+            self._writer_active = False
+            self._write_hold_time += time.monotonic() - self._write_start
+            self._cond.notify_all()
+
+    @property
+    def read_locked(self):
+        return self._readers_count > 0
+
+    @property
+    def write_locked(self):
+        return self._writer_active
+
+    @property
+    def stats(self) -> LockStats:
+        with self._cond:
+            return LockStats(
+                self._read_acquired,
+                self._write_acquired,
+                self._read_timeouts,
+                self._write_timeouts,
+                self._read_wait_time,
+                self._write_wait_time,
+                self._max_read_wait_time,
+                self._max_write_wait_time,
+                self._read_hold_time,
+                self._write_hold_time,
+                self._readers_count,
+                self._waiting_readers,
+                self._waiting_writers
+            )
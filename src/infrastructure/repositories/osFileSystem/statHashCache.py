@@ -0,0 +1,168 @@
+import hashlib
+import os
+import sqlite3
+import stat
+import threading
+from pathlib import Path
+from typing import Optional
+
+
+class StatHashCacheError(Exception):
+    ...
+
+
+# Ключ записи: (st_dev, st_ino), проверка актуальности: (size, mtime_ns, ctime_ns)
+StatKey = tuple[int, int]
+StatStamp = tuple[int, int, int]
+
+
+# Файл кэша по умолчанию для реплики: в каталоге состояния
+# пользователя ($XDG_STATE_HOME или ~/.local/state), а не внутри
+# самой реплики, чтобы кэш не попадал в дерево
+def default_cache_path(abs_root_dir_path: str) -> str:
+    state_dir = os.environ.get('XDG_STATE_HOME') or os.path.join(os.path.expanduser('~'), '.local', 'state')
+    root_key = hashlib.blake2b(os.fsencode(os.path.abspath(abs_root_dir_path)), digest_size=16).hexdigest()
+    cache_dir = os.path.join(state_dir, 'statHashCache')
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(cache_dir, f'{root_key}.sqlite')
+
+
+# Постоянный кэш хэшей файлов, привязанный к stat.
+# Хранится в одном файле sqlite, целиком загружается при открытии,
+# изменения записываются пачками.
+# Хэши каталогов не сохраняются между запусками: stat каталога
+# не меняется при изменении вложенных файлов. Они живут только
+# в памяти до вызова forget_directories
+class StatHashCache:
+    def __init__(
+        self,
+        db_path: str,
+        protocol_name: str = '',
+        flush_batch_size: int = 10000
+    ):
+        self._db_path = db_path
+        self._protocol_name = protocol_name
+        self._flush_batch_size = flush_batch_size
+        self._lock = threading.Lock()
+
+        self._file_hashes: dict[StatKey, tuple[StatStamp, bytes]] = {}
+        self._dir_hashes: dict[StatKey, bytes] = {}
+        self._not_flushed: dict[StatKey, tuple[StatStamp, bytes]] = {}
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._init_db()
+        self._load()
+
+    def _init_db(self):
+        with self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)'
+            )
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS hashes ('
+                'dev INTEGER, ino INTEGER, size INTEGER, '
+                'mtime_ns INTEGER, ctime_ns INTEGER, hash BLOB, '
+                'PRIMARY KEY (dev, ino))'
+            )
+            row = self._conn.execute(
+                "SELECT value FROM meta WHERE key = 'protocol'"
+            ).fetchone()
+            # Хэши другого протокола не годятся
+            if row is not None and row[0] != self._protocol_name:
+                self._conn.execute('DELETE FROM hashes')
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('protocol', ?)",
+                (self._protocol_name,)
+            )
+
+    # Загружаем весь кэш одним запросом
+    def _load(self):
+        for dev, ino, size, mtime_ns, ctime_ns, hash in self._conn.execute(
+            'SELECT dev, ino, size, mtime_ns, ctime_ns, hash FROM hashes'
+        ):
+            self._file_hashes[(dev, ino)] = ((size, mtime_ns, ctime_ns), bytes(hash))
+
+    @staticmethod
+    def _get_stat(path: Path) -> Optional[os.stat_result]:
+        try:
+            return os.stat(path, follow_symlinks=False)
+        except FileNotFoundError:
+            return None
+
+    def get_hash_by_stat(self, st: os.stat_result) -> Optional[bytes]:
+        key = (st.st_dev, st.st_ino)
+        if stat.S_ISDIR(st.st_mode):
+            return self._dir_hashes.get(key)
+        item = self._file_hashes.get(key)
+        if item is None:
+            return None
+        stamp, hash = item
+        if stamp != (st.st_size, st.st_mtime_ns, st.st_ctime_ns):
+            return None
+        return hash
+
+    def save_hash_by_stat(self, st: os.stat_result, hash: bytes):
+        key = (st.st_dev, st.st_ino)
+        with self._lock:
+            if stat.S_ISDIR(st.st_mode):
+                self._dir_hashes[key] = hash
+                return
+            item = ((st.st_size, st.st_mtime_ns, st.st_ctime_ns), hash)
+            self._file_hashes[key] = item
+            self._not_flushed[key] = item
+            need_flush = len(self._not_flushed) >= self._flush_batch_size
+        if need_flush:
+            self.flush()
+
+    # Подходит для get_cached_method
+    def get_hash_by_path(self, path: Path) -> Optional[bytes]:
+        st = self._get_stat(path)
+        if st is None:
+            return None
+        return self.get_hash_by_stat(st)
+
+    # Подходит для save_out_method
+    def save_hash_by_path(self, path: Path, hash: bytes):
+        st = self._get_stat(path)
+        if st is None:
+            return
+        self.save_hash_by_stat(st, hash)
+
+    def forget_directories(self):
+        with self._lock:
+            self._dir_hashes.clear()
+
+    def flush(self):
+        with self._lock:
+            items = self._not_flushed
+            self._not_flushed = {}
+        if len(items) == 0:
+            return
+        try:
+            with self._conn:
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO hashes '
+                    '(dev, ino, size, mtime_ns, ctime_ns, hash) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    [
+                        (dev, ino, size, mtime_ns, ctime_ns, hash)
+                        for (dev, ino), ((size, mtime_ns, ctime_ns), hash) in items.items()
+                    ]
+                )
+        except sqlite3.Error as e:
+            # Пачка возвращается, чтобы записать ее при следующем flush.
+            # Более новые записи тех же файлов не затираются
+            with self._lock:
+                for key, item in items.items():
+                    self._not_flushed.setdefault(key, item)
+            raise StatHashCacheError(e)
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+    def __enter__(self) -> 'StatHashCache':
+        return self
+
+    def __exit__(self, pa, par, para):
+        self.close()
@@ -0,0 +1,123 @@
+import json
+import os
+import time
+from pathlib import Path
+from typing import Iterable, Mapping, Optional
+
+from domain.interfaces.syncJournal import SyncJournal, SyncJournalError
+
+
+# Журнал в виде файла JSON-строк, только дописывается.
+# Отметки о выполнении копятся в памяти и сбрасываются с fsync
+# пачками (групповая фиксация): по числу записей или по времени
+class FileSyncJournal(SyncJournal):
+    def __init__(
+        self,
+        abs_file_path: str,
+        batch_size: int = 1000,
+        batch_interval: float = 1.0
+    ):
+        self._file_path = Path(abs_file_path)
+        if not self._file_path.is_absolute():
+            raise ValueError(f'Путь должен быть абсолютным! abs_file_path={abs_file_path}')
+        self._batch_size = batch_size
+        self._batch_interval = batch_interval
+
+        self._planned: set[str] = set()
+        self._completed: dict[str, Optional[int]] = {}
+        self._load()
+
+        self._file = self._file_path.open('ab')
+        self._not_flushed: list[bytes] = []
+        self._last_flush_time = time.monotonic()
+
+    # Недописанная при сбое последняя строка обрезается, иначе
+    # следующая запись допишется к ней и тоже не прочитается
+    def _load(self):
+        if not self._file_path.exists():
+            return
+        complete_size = 0
+        with self._file_path.open('rb') as file:
+            for line in file:
+                if not line.endswith(b'\n'):
+                    break
+                complete_size += len(line)
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record['type'] == 'plan':
+                    self._planned.add(record['key'])
+                elif record['type'] == 'done':
+                    self._completed[record['key']] = record.get('id')
+            file_size = file.tell()
+        if complete_size < file_size:
+            try:
+                os.truncate(self._file_path, complete_size)
+            except OSError as e:
+                raise SyncJournalError(e)
+
+    def get_planned(self) -> set[str]:
+        return set(self._planned)
+
+    def get_completed(self) -> Mapping[str, Optional[int]]:
+        return dict(self._completed)
+
+    @staticmethod
+    def _dump(record: dict) -> bytes:
+        return json.dumps(record, ensure_ascii=False).encode() + b'\n'
+
+    def _write(self, data: bytes, sync: bool):
+        try:
+            self._file.write(data)
+            if sync:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+        except OSError as e:
+            raise SyncJournalError(e)
+
+    # План пишется сразу и с fsync
+    def record_planned(self, keys: Iterable[str]):
+        new_keys = [key for key in keys if key not in self._planned]
+        if len(new_keys) == 0:
+            return
+        self.flush()
+        self._write(
+            b''.join(self._dump({'type': 'plan', 'key': key}) for key in new_keys),
+            True
+        )
+        self._planned.update(new_keys)
+
+    def record_done(self, key: str, result_id: Optional[int] = None):
+        self._completed[key] = result_id
+        self._not_flushed.append(self._dump({'type': 'done', 'key': key, 'id': result_id}))
+        if (
+            len(self._not_flushed) >= self._batch_size
+            or time.monotonic() - self._last_flush_time >= self._batch_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        self._last_flush_time = time.monotonic()
+        if len(self._not_flushed) == 0:
+            return
+        data = b''.join(self._not_flushed)
+        self._not_flushed = []
+        self._write(data, True)
+
+    def finish(self):
+        self._not_flushed = []
+        self._file.close()
+        self._file_path.unlink(missing_ok=True)
+        self._planned.clear()
+        self._completed.clear()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+    def __enter__(self) -> 'FileSyncJournal':
+        return self
+
+    def __exit__(self, pa, par, para):
+        self.close()
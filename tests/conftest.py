@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Пакеты проекта импортируются от каталога src
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
@@ -0,0 +1,45 @@
+import time
+
+from domain.entities.dataInfo import DataInfo
+from domain.interfaces.tree import ReadOnlyTree
+from infrastructure.repositories.oneFileGateway.binarySnapshotGateway import BinarySnapshotGateway, write_binary_snapshot
+
+
+# Цепочка каталогов глубины depth с файлом в конце
+class _ChainTree(ReadOnlyTree[DataInfo]):
+    def __init__(self, depth: int):
+        self._nodes = []
+        rel_path = '.'
+        for id in range(depth + 1):
+            if id > 0:
+                rel_path = f'd{id}' if rel_path == '.' else f'{rel_path}/d{id}'
+            is_leaf = id == depth
+            self._nodes.append(DataInfo(id, None, {'rel_path': rel_path, 'type': 'file' if is_leaf else 'dir'}, None))
+
+    def root(self):
+        return self._nodes[0]
+
+    def find_node(self, node):
+        return self.find_node_by_id(node.id)
+
+    def find_node_by_id(self, id):
+        return self._nodes[id] if 0 <= id < len(self._nodes) else None
+
+    def get_children(self, node):
+        return self._nodes[node.id + 1:node.id + 2]
+
+
+def test_deep_chain_reads_without_recursion(tmp_path):
+    depth = 3000
+    tree = _ChainTree(depth)
+    path = str(tmp_path / 'chain.bin')
+    assert write_binary_snapshot(path, tree) == depth + 1
+    with BinarySnapshotGateway(path, verify_checksum=True) as gate:
+        leaf = gate.get_info_by_id(depth)
+        assert leaf.info['rel_path'] == tree.find_node(leaf).meta_info['rel_path']
+        start = time.perf_counter()
+        infos = [info for chunk in gate.iter_subtree_info_by_id(0) for info in chunk]
+        elapsed = time.perf_counter() - start
+    assert [info.info['rel_path'] for info in infos] == [node.meta_info['rel_path'] for node in tree._nodes]
+    # Чтение линейно по числу узлов
+    assert elapsed < 1
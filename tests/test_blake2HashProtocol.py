@@ -0,0 +1,59 @@
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+from domain.shared.listTreeFunctionBuilder import (
+    DependsOnlyDescendantsListTreeFunctionBuilder,
+    ParallelDependsOnlyDescendantsListTreeFunctionBuilder
+)
+from infrastructure.repositories.contentHashProtocol.blake2HashProtocol import Blake2ContentHashProtocol
+
+
+# Узел: (имя, данные, потомки)
+TREE = ('root', b'', [
+    ('a', b'', [('a1', b'111', []), ('a2', b'222', [])]),
+    ('b', b'333', []),
+    ('c', b'', [('c1', b'444', [])])
+])
+
+
+def _get_data(node):
+    return node[1]
+
+
+def _get_name(node):
+    return node[0]
+
+
+def _get_descendants(node):
+    return list(node[2])
+
+
+def _build(builder, hash_protocol, **kwargs):
+    return builder(
+        hash_protocol.get_hash_from_binary,
+        _get_data,
+        _get_name,
+        hash_protocol.get_hash_by_hash_lst,
+        _get_descendants,
+        **kwargs
+    )
+
+
+def test_pickle_keeps_chunk_size_and_recreates_buffer():
+    hash_protocol = Blake2ContentHashProtocol(chunk_size=16)
+    hash_protocol.get_hash_from_stream(iter([b'abc']))
+    restored = pickle.loads(pickle.dumps(hash_protocol))
+    assert restored.chunk_size == 16
+    assert restored.get_hash_from_binary(b'abc') == hash_protocol.get_hash_from_binary(b'abc')
+
+
+def test_parallel_builder_runs_in_process_pool():
+    hash_protocol = Blake2ContentHashProtocol()
+    expected = _build(DependsOnlyDescendantsListTreeFunctionBuilder, hash_protocol)(TREE)
+    foo = _build(
+        ParallelDependsOnlyDescendantsListTreeFunctionBuilder,
+        hash_protocol,
+        max_workers=2,
+        executor_builder=ProcessPoolExecutor
+    )
+    assert foo(TREE) == expected
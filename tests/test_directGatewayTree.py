@@ -0,0 +1,64 @@
+from domain.entities.DirectGatewayTree import DirectGatewayReadOnlyTree
+from domain.entities.dataInfo import DataInfo, DataInfoBuilder
+from domain.entities.mirrorGatewayTree import MirrorGatewayTree
+from infrastructure.repositories.osFileSystem.gateway import OsGatewayFactory
+
+
+class _Builder(DataInfoBuilder):
+    def build(self, info):
+        return DataInfo(info.id, None, info.info, None)
+
+
+# Каталоги на трех уровнях по fanout потомков, файлы - листья
+def _make_tree(root_dir, fanout=3, depth=3):
+    dirs = [root_dir]
+    for level in range(depth):
+        next_dirs = []
+        for cur in dirs:
+            for i in range(fanout):
+                path = cur / f'n{i}'
+                if level == depth - 1:
+                    path.write_bytes(b'x')
+                else:
+                    path.mkdir()
+                    next_dirs.append(path)
+        dirs = next_dirs
+
+
+def _count_calls(gate):
+    calls = {'subtree': 0, 'childs': 0}
+    iter_subtree = gate.iter_subtree_info_by_id
+    get_childs = gate.get_childs_info_by_id
+
+    def counting_iter_subtree(*args, **kwargs):
+        calls['subtree'] += 1
+        return iter_subtree(*args, **kwargs)
+
+    def counting_get_childs(*args, **kwargs):
+        calls['childs'] += 1
+        return get_childs(*args, **kwargs)
+
+    gate.iter_subtree_info_by_id = counting_iter_subtree
+    gate.get_childs_info_by_id = counting_get_childs
+    return calls
+
+
+def _paths(tree):
+    return sorted(node.meta_info['rel_path'] for node, _, _ in tree.iter_nodes(batch_size=16))
+
+
+def test_trees_fetch_children_by_subtree(tmp_path):
+    _make_tree(tmp_path)
+    factory = OsGatewayFactory(str(tmp_path))
+    with factory.get_readable_gateway() as gate:
+        calls = _count_calls(gate)
+        paths = _paths(DirectGatewayReadOnlyTree(gate, _Builder(), prefetch_depth=2))
+        # 1 + 3 + 9 каталогов и 27 файлов
+        assert len(paths) == 40
+        # Запросы - только для корня и каталогов второго уровня
+        assert calls == {'subtree': 1 + 9, 'childs': 0}
+
+        calls = _count_calls(gate)
+        assert _paths(MirrorGatewayTree(gate, _Builder(), prefetch_depth=4)) == paths
+        assert calls == {'subtree': 1, 'childs': 0}
+    factory.close()
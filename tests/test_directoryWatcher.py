@@ -0,0 +1,29 @@
+import threading
+
+import pytest
+
+from infrastructure.repositories.osFileSystem.directoryWatcher import InotifyDirectoryWatcher, WatchEventKind, WatcherError
+
+
+def test_callback_error_keeps_thread_and_reports_overflow(tmp_path):
+    try:
+        watcher = InotifyDirectoryWatcher(batch_interval=0.01)
+    except WatcherError:
+        pytest.skip('inotify недоступен')
+    batches = []
+    overflowed = threading.Event()
+
+    def callback(events):
+        batches.append(events)
+        if len(batches) == 1:
+            raise RuntimeError('сбой обработчика')
+        if any(event.kind == WatchEventKind.OVERFLOW for event in events):
+            overflowed.set()
+
+    watcher.start(callback)
+    try:
+        watcher.watch(1, str(tmp_path))
+        (tmp_path / 'f').write_bytes(b'x')
+        assert overflowed.wait(5)
+    finally:
+        watcher.stop()
@@ -0,0 +1,19 @@
+from infrastructure.repositories.syncJournal.fileSyncJournal import FileSyncJournal
+
+
+def test_partial_last_line_is_dropped_and_next_record_survives(tmp_path):
+    path = tmp_path / 'journal.jsonl'
+    with FileSyncJournal(str(path)) as journal:
+        journal.record_planned(['a', 'b'])
+        journal.record_done('a', 1)
+    # Сбой посреди записи оставил недописанную строку
+    with path.open('ab') as file:
+        file.write(b'{"type": "done", "key": "b", "i')
+
+    with FileSyncJournal(str(path)) as journal:
+        assert journal.get_planned() == {'a', 'b'}
+        assert journal.get_completed() == {'a': 1}
+        journal.record_done('b', 2)
+
+    with FileSyncJournal(str(path)) as journal:
+        assert journal.get_completed() == {'a': 1, 'b': 2}
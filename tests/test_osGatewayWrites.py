@@ -0,0 +1,28 @@
+import io
+import os
+
+from infrastructure.repositories.osFileSystem.gateway import OsGatewayFactory
+
+
+def _save(gate, parent_id, rel_path, data=None):
+    id = gate.get_id_for_new_elem(parent_id)
+    info = {'rel_path': rel_path, 'type': 'dir' if data is None else 'file'}
+    gate.save_data_by_id(id, None if data is None else io.BytesIO(data), info)
+    return id
+
+
+def test_deleting_directory_drops_pending_writes_under_it(tmp_path):
+    factory = OsGatewayFactory(str(tmp_path))
+    with factory.get_modifiable_gateway() as gate:
+        root_id = gate.get_root().id
+        dir_id = _save(gate, root_id, 'd')
+        sub_id = _save(gate, dir_id, 'd/s')
+        _save(gate, dir_id, 'd/f1', b'1')
+        _save(gate, sub_id, 'd/s/f2', b'2')
+        _save(gate, root_id, 'f3', b'3')
+        gate.delete_by_id(dir_id)
+        names = [child.info['rel_path'] for child in gate.get_childs_info_by_id(root_id)]
+        assert names == ['f3']
+    factory.close()
+    assert os.listdir(tmp_path) == ['f3']
+    assert (tmp_path / 'f3').read_bytes() == b'3'
@@ -0,0 +1,47 @@
+from infrastructure.repositories.contentHashProtocol.blake2HashProtocol import Blake2ContentHashProtocol
+from infrastructure.repositories.osFileSystem.gateway import OsGatewayFactory
+from infrastructure.repositories.osFileSystem.statHashCache import StatHashCache
+
+
+# Считает чтения содержимого файлов
+class _CountingHashProtocol(Blake2ContentHashProtocol):
+    def __init__(self):
+        super().__init__()
+        self.streams = 0
+
+    def get_hash_from_stream(self, data):
+        self.streams += 1
+        return super().get_hash_from_stream(data)
+
+
+def _hash_root(root_dir, db_path):
+    protocol = _CountingHashProtocol()
+    factory = OsGatewayFactory(str(root_dir), hash_cache=StatHashCache(str(db_path), 'blake2'))
+    factory._hash_prototol = protocol
+    try:
+        with factory.get_readable_gateway() as gate:
+            hash = gate.get_hash_by_id(gate.get_root().id)
+    finally:
+        factory.close()
+        factory._hash_cache.close()
+    return hash, protocol.streams
+
+
+def test_unchanged_files_are_not_hashed_again(tmp_path):
+    root_dir = tmp_path / 'root'
+    (root_dir / 'd').mkdir(parents=True)
+    (root_dir / 'a').write_bytes(b'aaa')
+    (root_dir / 'd' / 'b').write_bytes(b'bbb')
+    db_path = tmp_path / 'cache.sqlite'
+
+    first_hash, first_streams = _hash_root(root_dir, db_path)
+    assert first_streams == 2
+    # Новый запуск с тем же кэшем: файлы не изменились
+    second_hash, second_streams = _hash_root(root_dir, db_path)
+    assert second_hash == first_hash
+    assert second_streams == 0
+
+    (root_dir / 'd' / 'b').write_bytes(b'bbbb')
+    third_hash, third_streams = _hash_root(root_dir, db_path)
+    assert third_hash != first_hash
+    assert third_streams == 1